@@ -38,7 +38,9 @@ def create_app(config_class=Config):
   moment.init_app(app)
   csrf = CSRFProtect(app)
   app.redis = Redis.from_url(app.config['REDIS_URL'])
-  app.task_queue = rq.Queue('framease-tasks', connection=app.redis)
+  from app.queues import make_queues, INTERACTIVE
+  app.task_queues = make_queues(app.redis)
+  app.task_queue = app.task_queues[INTERACTIVE]
 
   from app.errors import bp as errors_bp
   app.register_blueprint(errors_bp)
@@ -95,7 +97,7 @@ def create_app(config_class=Config):
   return app
 
 
-from app import models
+from app import models, identity
 
 import app.plugins as _plugins
 import app.validation_models as _validation_models
@@ -2,6 +2,7 @@ import sqlalchemy as sa
 
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, FieldList, FormField, FieldList, SelectField, TextAreaField
+from wtforms import SelectMultipleField
 from wtforms import ValidationError
 from wtforms_components import read_only
 from wtforms.validators import ValidationError, DataRequired, Email, EqualTo, Length
@@ -110,3 +111,9 @@ class ImportForm(FlaskForm):
 
 class ExportForm(FlaskForm):
   textdata = TextAreaField('JSON Data', validators=[DataRequired()])
+
+
+class FleetRunForm(FlaskForm):
+  suite = SelectField('Test Suite', coerce=int, validators=[DataRequired()])
+  devices = SelectMultipleField('Devices (leave empty for every compatible device)', coerce=int)
+  submit = SubmitField('Run')
@@ -10,12 +10,14 @@ import json
 import sys
 import traceback
 
-from app import db, plugins
+from app import db, plugins, metrics, parse_cache, fleet, plans, queues
+from app.queues import QueueLimitError
 from app.admin import bp
 from app.admin.forms import EditProfileForm, NewTestSuiteForm, TestSuiteForm, AddSuiteCaseForm, RoleForm, EditRoleForm, NewTestCaseForm, TestCaseForm
-from app.admin.forms import ImportForm, ExportForm
+from app.admin.forms import ImportForm, ExportForm, FleetRunForm
 from app.main.forms import EmptyForm
 from app.models import User, Role, TestSuite, TestCase, DeviceValidation, Device
+from app.pagination import paginate
 from app.auth.email import send_password_reset_email
 
 EXEMPT_METHODS = []
@@ -39,22 +41,29 @@ def index():
   return render_template('admin/index.html', title='Admin Portal')
 
 
+@bp.route('/metrics', endpoint='metrics')
+@login_required
+@admin_required
+def metrics_view():
+  counters = metrics.get_counters()
+  return render_template('admin/metrics.html', title='Metrics',
+    counters=counters, parse_cache=parse_cache.stats(),
+    parse_cache_hit_rate=metrics.hit_rate(counters, 'parse_cache'),
+    identity_cache_hit_rate=metrics.hit_rate(counters, 'identity_cache'),
+    queues=queues.stats())
+
+
 @bp.route('/users')
 @login_required
 @admin_required
 def users():
-  page = request.args.get('page', 1, type=int)
+  cursor = request.args.get('cursor')
   form = EmptyForm()
-  query = sa.select(User).order_by(User.display_name.desc())
-  users = db.paginate(query, page=page,
-    per_page=current_user.page_size,
-    error_out=False)
-  next_url = url_for('admin.users', page=users.next_num) \
-    if users.has_next else None
-  prev_url = url_for('admin.users', page=users.prev_num) \
-    if users.has_prev else None
+  users = paginate(sa.select(User), User.listing_order(), cursor, current_user.page_size)
+  next_url = users.next_url('admin.users')
+  prev_url = users.prev_url('admin.users')
   return render_template('admin/users.html', title='User Administration',
-    users=users, next_url=next_url, prev_url=prev_url, form=form)
+    users=users, next_url=next_url, prev_url=prev_url, form=form, cursor=cursor)
 
 
 @bp.route('/roles', methods=['GET', 'POST'])
@@ -128,28 +137,24 @@ def deactivate_role(roleid):
 @login_required
 @admin_required
 def suites():
-  page = request.args.get('page', 1, type=int)
+  cursor = request.args.get('cursor')
   form = NewTestSuiteForm()
   import_form = ImportForm()
   if form.validate_on_submit():
     name_check = TestSuite.get_by_name_version(form.name.data, form.version.data)
     if name_check and name_check.name == form.name.data and name_check.version == form.version.data:
       flash('Invalid name/version: in-use')
-      return redirect(url_for('admin.suites', page=page))
+      return redirect(url_for('admin.suites', cursor=cursor))
     suite = TestSuite(name=form.name.data, version=form.version.data)
     db.session.add(suite)
     db.session.commit()
-    return redirect(url_for('admin.suites', page=page))
-  query = sa.select(TestSuite).order_by(TestSuite.name.desc())
-  suites = db.paginate(query, page=page,
-    per_page=current_user.page_size,
-    error_out=False)
-  next_url = url_for('admin.suites', page=suites.next_num) \
-    if suites.has_next else None
-  prev_url = url_for('admin.suites', page=suites.prev_num) \
-    if suites.has_prev else None
+    return redirect(url_for('admin.suites', cursor=cursor))
+  suites = paginate(sa.select(TestSuite), TestSuite.listing_order(), cursor, current_user.page_size)
+  next_url = suites.next_url('admin.suites')
+  prev_url = suites.prev_url('admin.suites')
   return render_template('admin/suites.html', title='Roles Administration',
-    suites=suites, next_url=next_url, prev_url=prev_url, form=form, import_form=import_form)
+    suites=suites, next_url=next_url, prev_url=prev_url, form=form, import_form=import_form,
+    cursor=cursor)
 
 #class TestSuite(db.Model):
 #  id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -168,7 +173,7 @@ def archive_suite(suiteid):
     suite.archived = True
     db.session.commit()
     flash('Test Suite Archived.')
-  return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
 
 
 @bp.route('/suite/<suiteid>/unarchive', methods=['POST'])
@@ -181,7 +186,7 @@ def unarchive_suite(suiteid):
     suite.archived = False
     db.session.commit()
     flash('Test Suite Unarchived.')
-  return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
 
 
 @bp.route('/suite/<suiteid>/lock', methods=['POST'])
@@ -191,13 +196,13 @@ def lock_suite(suiteid):
   suite = db.first_or_404(sa.select(TestSuite).where(TestSuite.id == suiteid))
   if suite.archived:
     flash('Test Suite is Archived. Unarchive before making any changes.', 'warning')
-    return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+    return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
   form = EmptyForm()
   if form.validate_on_submit():
     suite.final = True
     db.session.commit()
     flash('Test Suite Locked.')
-  return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
 
 
 @bp.route('/suite/<suiteid>/unlock', methods=['POST'])
@@ -207,13 +212,13 @@ def unlock_suite(suiteid):
   suite = db.first_or_404(sa.select(TestSuite).where(TestSuite.id == suiteid))
   if suite.archived:
     flash('Test Suite is Archived. Unarchive before making any changes.', 'warning')
-    return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))  
+    return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))  
   form = EmptyForm()
   if form.validate_on_submit():
     suite.final = False
     db.session.commit()
     flash('Test Suite Unlocked.')
-  return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
 
 
 @bp.route('/suite/new', methods=['GET', 'POST'])
@@ -241,7 +246,7 @@ def suite(suiteid):
     suite.version = form.version.data
     suite.archived = form.archived.data
     db.session.commit()
-    return redirect(url_for('admin.suites', page=request.args.get('page', 1, type=int)))
+    return redirect(url_for('admin.suites', cursor=request.args.get('cursor')))
   else:
     form.name.data = suite.name
     form.version.data = suite.version
@@ -344,7 +349,7 @@ def delete_suite_case(suiteid, suitecaseid):
 @login_required
 @admin_required
 def cases():
-  page = request.args.get('page', 1, type=int)
+  cursor = request.args.get('cursor')
   form = NewTestCaseForm()
   form.plugin.choices = [ plugin_name for plugin_name in plugins ]
   query = sa.select(Role).where(Role.active == True).order_by(Role.name.asc())
@@ -358,32 +363,22 @@ def cases():
     name_check = TestCase.get_by_name_version(form.name.data, form.version.data)
     if name_check and name_check.name == form.name.data and name_check.version == form.version.data:
       flash('Invalid name/version: in-use')
-      return redirect(url_for('admin.cases', page=page))
+      return redirect(url_for('admin.cases', cursor=cursor))
     case = TestCase(name=form.name.data, version=form.version.data,
       description=form.description.data, function=form.plugin.data,
       data=json.dumps(case_data, indent=4), approver_role_id=form.approver_role.data,
       archived=False)
     db.session.add(case)
     db.session.commit()
-    return redirect(url_for('admin.cases', page=page))
+    return redirect(url_for('admin.cases', cursor=cursor))
   elif request.method == 'POST':
     flash(f'Error: {form.errors}')
 
-  query = (
-    sa.select(TestCase)
-    .order_by(TestCase.archived)
-    .order_by(TestCase.name.asc())
-    .order_by(TestCase.version.asc())
-  )
-  cases = db.paginate(query, page=page,
-    per_page=current_user.page_size,
-    error_out=False)
-  next_url = url_for('admin.cases', page=cases.next_num) \
-    if cases.has_next else None
-  prev_url = url_for('admin.cases', page=cases.prev_num) \
-    if cases.has_prev else None
+  cases = paginate(sa.select(TestCase), TestCase.listing_order(), cursor, current_user.page_size)
+  next_url = cases.next_url('admin.cases')
+  prev_url = cases.prev_url('admin.cases')
   return render_template('admin/cases.html', title='Test Case Administration',
-    cases=cases, next_url=next_url, prev_url=prev_url, form=form)
+    cases=cases, next_url=next_url, prev_url=prev_url, form=form, cursor=cursor)
 
 
 @bp.route('/case/<caseid>', methods=['GET', 'POST'])
@@ -400,7 +395,8 @@ def case(caseid):
     case.description = form.description.data
     case.approver_role_id = form.approver_role.data
     db.session.commit()
-    return redirect(url_for('admin.cases', page=request.args.get('page', 1, type=int)))
+    plans.invalidate(case.id)
+    return redirect(url_for('admin.cases', cursor=request.args.get('cursor')))
   elif request.method == 'POST':
     flash(form.errors)
   form.approver_role.default = case.approver_role.id
@@ -430,13 +426,13 @@ def archive_case(caseid):
     flash('Test Case is in use. Please archive or unlink:')
     for suiteid, suite_name in suites_using:
       flash(suite_name)
-    return redirect(url_for('admin.cases', page=request.args.get('page', 1, type=int)))
+    return redirect(url_for('admin.cases', cursor=request.args.get('cursor')))
   form = EmptyForm()
   if form.validate_on_submit():
     case.archived = True
     db.session.commit()
     flash('Test Case Archived.')
-  return redirect(url_for('admin.cases', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.cases', cursor=request.args.get('cursor')))
 
 
 @bp.route('/case/<caseid>/unarchive', methods=['POST'])
@@ -449,7 +445,7 @@ def unarchive_case(caseid):
     case.archived = False
     db.session.commit()
     flash('Test Case Unarchived.')
-  return redirect(url_for('admin.cases', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.cases', cursor=request.args.get('cursor')))
 
 @bp.route('/case/<caseid>/copy', methods=['GET', 'POST'])
 @login_required
@@ -496,7 +492,7 @@ def make_admin(username):
     user.admin = True
     db.session.commit()
     flash(f'User {user.display_name} (@{user.username}) is now an Administrator')
-  return redirect(url_for('admin.users', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.users', cursor=request.args.get('cursor')))
 
 
 @bp.route('/edit_user/<username>/remove_admin', methods=['POST'])
@@ -509,7 +505,7 @@ def remove_admin(username):
     user.admin = False
     db.session.commit()
     flash(f'User {user.display_name} (@{user.username}) is no longer an Administrator')
-  return redirect(url_for('admin.users', page=request.args.get('page', 1, type=int)))
+  return redirect(url_for('admin.users', cursor=request.args.get('cursor')))
 
 
 @bp.route('/edit_user/<username>/roles', methods=['GET', 'POST'])
@@ -550,3 +546,39 @@ def deactivate_user_role(username, roleid):
     db.session.commit()
     flash('Role Deactivated')
   return redirect(url_for('admin.edit_user_roles', username=username, page=request.args.get('page', 1, type=int)))
+
+
+@bp.route('/fleet', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def fleet_runs():
+  form = FleetRunForm()
+  query = sa.select(TestSuite).where(TestSuite.archived == False).order_by(TestSuite.name.asc())
+  form.suite.choices = [ (suite.id, str(suite)) for suite in db.session.scalars(query) ]
+  query = sa.select(Device).where(Device.archived == False).order_by(Device.devicename.asc())
+  all_devices = db.session.scalars(query).all()
+  form.devices.choices = [ (device.id, str(device)) for device in all_devices ]
+  if form.validate_on_submit():
+    suite = db.first_or_404(sa.select(TestSuite).where(TestSuite.id == form.suite.data))
+    devices = all_devices
+    if form.devices.data:
+      devices = [ device for device in all_devices if device.id in form.devices.data ]
+    devices = fleet.compatible_devices(suite, devices)
+    if not devices:
+      flash('No compatible devices selected.')
+    else:
+      try:
+        group = fleet.start(current_user, suite, devices)
+      except QueueLimitError as e:
+        flash(str(e))
+      else:
+        started = group.get_group_progress()['total']
+        flash(f'Fleet validation of {started} devices started.')
+        if started < len(devices):
+          flash(f'{len(devices) - started} devices skipped: already running validations.')
+    return redirect(url_for('admin.fleet_runs'))
+  elif request.method == 'POST':
+    flash(f'Error: {form.errors}')
+  groups = [ group.get_group_progress() for group in fleet.get_groups() ]
+  return render_template('admin/fleet.html', title='Fleet Validation',
+    form=form, groups=groups)
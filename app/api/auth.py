@@ -2,7 +2,7 @@ import sqlalchemy as sa
 
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 
-from app import db
+from app import db, identity
 from app.models import User
 from app.api.errors import error_response
 
@@ -24,7 +24,7 @@ def basic_auth_error(status):
 
 @token_auth.verify_token
 def verify_token(token):
-  return User.check_token(token) if token else None
+  return identity.user_by_token(token) if token else None
 
 
 @token_auth.error_handler
@@ -0,0 +1,66 @@
+import sqlalchemy as sa
+
+from flask import request
+
+from app import db, config_index, config_store
+from app.models import Device
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.pagination import paginate, collection_dict
+
+
+@bp.route('/devices/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_device(id):
+  return db.get_or_404(Device, id).to_dict()
+
+
+@bp.route('/devices', methods=['GET'])
+@token_auth.login_required
+def get_devices():
+  per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)
+  devices = paginate(sa.select(Device), Device.listing_order(), request.args.get('cursor'), per_page)
+  return collection_dict(devices, 'api.get_devices')
+
+
+@bp.route('/config_search', methods=['GET'])
+@token_auth.login_required
+def search_configs():
+  try:
+    results, truncated = config_index.search(request.args.get('path'), request.args.get('key'),
+      request.args.get('value'), request.args.get('match', 'exact'))
+  except ValueError as e:
+    return bad_request(str(e))
+  return {
+    'items': [
+      { 'device': device.to_dict(), 'matches': [ term.to_dict() for term in terms ] }
+      for device, terms in results
+    ],
+    'truncated': truncated,
+  }
+
+
+@bp.route('/config_stats', methods=['GET'])
+@token_auth.login_required
+def config_stats():
+  store = config_store.open_store()
+  if store is None:
+    return error_response(404, 'The configuration store has not been built yet.')
+  group_by = request.args.get('group_by', 'value')
+  try:
+    counts = store.count(group_by, path=request.args.get('path'), key=request.args.get('key'),
+      value=request.args.get('value'), match=request.args.get('match', 'exact'),
+      limit=request.args.get('limit', None, type=int))
+  except ValueError as e:
+    return bad_request(str(e))
+  if group_by == 'device':
+    devices = { device.id: device for device in db.session.scalars(
+      sa.select(Device).where(Device.id.in_([ group for group, count in counts ]))) }
+    counts = [ (devices[group].to_dict() if group in devices else { 'id': group }, count)
+      for group, count in counts ]
+  return {
+    'items': [ { 'group': group, 'count': count } for group, count in counts ],
+    'rows': store.rows,
+    'built': store.built,
+  }
@@ -0,0 +1,37 @@
+import sqlalchemy as sa
+
+from flask import request, url_for
+
+from app import db, fleet
+from app.models import Device, Task, TestSuite, FLEET_TASK_NAME
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+
+
+@bp.route('/fleet_runs', methods=['POST'])
+@token_auth.login_required
+def create_fleet_run():
+  user = token_auth.current_user()
+  if not user.admin:
+    return error_response(403)
+  data = request.get_json(silent=True) or {}
+  if 'suite_id' not in data:
+    return bad_request('must include suite_id')
+  suite = db.get_or_404(TestSuite, data['suite_id'])
+  query = sa.select(Device).where(Device.archived == False)
+  if data.get('device_ids'):
+    query = query.where(Device.id.in_(data['device_ids']))
+  devices = fleet.compatible_devices(suite, db.session.scalars(query).all())
+  if not devices:
+    return bad_request('no compatible devices')
+  group = fleet.start(user, suite, devices)
+  response = group.get_group_progress()
+  return response, 201, {'Location': url_for('api.get_fleet_run', id=group.id)}
+
+
+@bp.route('/fleet_runs/<id>', methods=['GET'])
+@token_auth.login_required
+def get_fleet_run(id):
+  group = db.first_or_404(sa.select(Task).where(Task.id == id, Task.name == FLEET_TASK_NAME))
+  return group.get_group_progress()
@@ -0,0 +1,37 @@
+import sqlalchemy as sa
+
+from flask import request
+
+from app import db
+from app.models import TestSuite, TestCase
+from app.api import bp
+from app.api.auth import token_auth
+from app.pagination import paginate, collection_dict
+
+
+@bp.route('/suites/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_suite(id):
+  return db.get_or_404(TestSuite, id).to_dict()
+
+
+@bp.route('/suites', methods=['GET'])
+@token_auth.login_required
+def get_suites():
+  per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)
+  suites = paginate(sa.select(TestSuite), TestSuite.listing_order(), request.args.get('cursor'), per_page)
+  return collection_dict(suites, 'api.get_suites')
+
+
+@bp.route('/cases/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_case(id):
+  return db.get_or_404(TestCase, id).to_dict()
+
+
+@bp.route('/cases', methods=['GET'])
+@token_auth.login_required
+def get_cases():
+  per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)
+  cases = paginate(sa.select(TestCase), TestCase.listing_order(), request.args.get('cursor'), per_page)
+  return collection_dict(cases, 'api.get_cases')
@@ -4,6 +4,7 @@ from flask import request, url_for, abort
 
 from app import db
 from app.models import User
+from app.pagination import paginate, collection_dict
 from app.api import bp
 from app.api.auth import token_auth
 from app.api.errors import bad_request
@@ -18,7 +19,7 @@ def get_user(id):
 @bp.route('/users', methods=['GET'])
 @token_auth.login_required
 def get_users():
-  page = request.args.get('page', 1, type=int)
-  per_page = min(requests.args.get('per_page', 10, type=int), 100)
-  return User.to_collection_dict(sa.select(User), page, per_page, 'api.get_users')
+  per_page = max(min(request.args.get('per_page', 10, type=int), 100), 1)
+  users = paginate(sa.select(User), User.listing_order(), request.args.get('cursor'), per_page)
+  return collection_dict(users, 'api.get_users')
 
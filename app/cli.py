@@ -3,10 +3,193 @@ import os
 
 import sqlalchemy as sa
 
-from flask import Blueprint
+from flask import Blueprint, current_app
 
 import app
 from app import db
 
 bp = Blueprint('cli', __name__, cli_group=None)
 
+
+
+@bp.cli.command('bench-parser')
+@click.argument('filename', required=False)
+@click.option('--repeat', default=3, help='Runs per parser; the best time is reported.')
+@click.option('--policies', default=10000, help='Policies in the synthetic config when no file is given.')
+def bench_parser(filename, repeat, policies):
+  '''Compare the fortigate_offline parser with the old shlex parser.'''
+  from app.validation_models.fortigate_offline import benchmark
+  if filename:
+    with open(filename, 'r') as f:
+      lines = f.readlines()
+  else:
+    lines = benchmark.synthetic_config(policies=policies, addresses=policies * 2)
+  stats = benchmark.run_benchmark(lines, repeat=repeat)
+  click.echo(f'lines:     {stats["lines"]}')
+  click.echo(f'shlex:     {stats["legacy_seconds"]:.3f}s ({stats["legacy_lines_per_sec"]:,.0f} lines/sec)')
+  click.echo(f'streaming: {stats["stream_seconds"]:.3f}s ({stats["stream_lines_per_sec"]:,.0f} lines/sec)')
+  click.echo(f'speedup:   {stats["speedup"]:.1f}x')
+  click.echo(f'identical: {stats["identical"]}')
+
+
+@bp.cli.command('sweep')
+@click.option('--concurrency', type=int, default=None, help='Hosts checked at once (REACHABILITY_CONCURRENCY).')
+@click.option('--timeout', type=float, default=None, help='Seconds per check (REACHABILITY_TIMEOUT).')
+@click.option('--no-icmp', is_flag=True, help='Only try the TCP ports.')
+@click.option('--archived', is_flag=True, help='Include archived devices.')
+def sweep(concurrency, timeout, no_icmp, archived):
+  '''Check every device for ping and SSH/HTTPS reachability.'''
+  from app import reachability
+  from app.models import Device
+  query = sa.select(Device).order_by(Device.devicename)
+  if not archived:
+    query = query.where(Device.archived == False)
+  devices = db.session.scalars(query).all()
+  results = reachability.sweep([ reachability.device_target(device) for device in devices ],
+    concurrency=concurrency, timeout=timeout, icmp=not no_icmp, ttl=0)
+  for device, result in zip(devices, results):
+    icmp = {True: 'up', False: 'down', None: '-'}[result['icmp']]
+    ports = ' '.join(f'{port}:{"open" if is_open else "closed"}' for port, is_open in result['tcp'].items())
+    click.echo(f'{device.devicename:<32} {device.hostname:<40} icmp:{icmp:<5} {ports}')
+  reachable = sum(1 for result in results if reachability.is_reachable(result))
+  click.echo(f'{reachable}/{len(results)} devices reachable')
+
+
+@bp.cli.command('fetch-configs')
+@click.option('--workers', type=int, default=None, help='Devices fetched at once (FORTIGATE_ONLINE_WORKERS).')
+def fetch_configs(workers):
+  '''Refresh the cached configuration of every fortigate_online device.'''
+  from app.models import DeviceValidationModel
+  from app.validation_models.fortigate_online import fetch_many
+  dvms = db.session.scalars(sa.select(DeviceValidationModel).where(
+    DeviceValidationModel.validation_model == 'app.validation_models.fortigate_online')).all()
+  dvms = [ dvm for dvm in dvms if dvm.is_configured and not dvm.device.archived ]
+  results = fetch_many([ (dvm.device.to_model_data(), dvm.get_data()['api_token']) for dvm in dvms ],
+    max_workers=workers)
+  for dvm, result in zip(dvms, results):
+    state = f'error: {result}' if isinstance(result, Exception) else 'ok'
+    click.echo(f'{dvm.device.devicename:<32} {state}')
+
+
+@bp.cli.command('requeue-stuck')
+def requeue_stuck():
+  '''Requeue validation runs whose worker died, resuming from their checkpoint.'''
+  from app import recovery
+  requeued, failed = recovery.requeue_stuck()
+  for run in requeued:
+    click.echo(f'requeued {run}')
+  for run in failed:
+    click.echo(f'failed {run}')
+  click.echo(f'{len(requeued)} requeued, {len(failed)} given up')
+
+
+@bp.cli.command('index-configs')
+@click.option('--archived', is_flag=True, help='Include archived devices.')
+def index_configs(archived):
+  '''Update the configuration search index from every device's configuration.'''
+  from app import config_index
+  from app.models import Device
+  query = sa.select(Device).order_by(Device.devicename)
+  if not archived:
+    query = query.where(Device.archived == False)
+  updated = 0
+  for device in db.session.scalars(query).all():
+    try:
+      updated += int(config_index.index_device(device))
+    except Exception as e:
+      db.session.rollback()
+      click.echo(f'{device.devicename:<32} error: {e}')
+  pruned = config_index.prune()
+  click.echo(f'{updated} devices updated, {pruned} unused settings dropped')
+  if updated or pruned:
+    from app import config_store
+    click.echo(f'configuration store rebuilt: {config_store.build()} rows')
+
+
+@bp.cli.command('build-config-store')
+def build_config_store():
+  '''Rebuild the columnar configuration store from the search index.'''
+  from app import config_store
+  click.echo(f'{config_store.build()} rows')
+
+
+@bp.cli.command('config-stats')
+@click.option('--group-by', default='value', type=click.Choice(['device', 'path', 'key', 'value']))
+@click.option('--path', default=None, help='Only settings under this path.')
+@click.option('--key', default=None, help='Only this setting.')
+@click.option('--value', default=None, help='Only this value.')
+@click.option('--match', default='exact', type=click.Choice(['exact', 'prefix', 'substring']), help='How --value matches.')
+@click.option('--limit', default=20, help='Groups shown.')
+def config_stats(group_by, path, key, value, match, limit):
+  '''Count settings across the fleet, e.g. --key admintimeout, or
+  --key logtraffic --value disable --group-by device.'''
+  from app import config_store
+  from app.models import Device
+  store = config_store.open_store()
+  if store is None:
+    click.echo('The configuration store is empty; run `flask build-config-store` first.')
+    return
+  counts = store.count(group_by, path=path, key=key, value=value, match=match, limit=limit)
+  if group_by == 'device':
+    names = dict(db.session.execute(sa.select(Device.id, Device.devicename)
+      .where(Device.id.in_([ group for group, count in counts ]))).all())
+    counts = [ (names.get(group, group), count) for group, count in counts ]
+  for group, count in counts:
+    click.echo(f'{count:>8}  {group}')
+
+
+@bp.cli.command('reindex-compatibility')
+def reindex_compatibility():
+  '''Recompute suite requirements and device capabilities, e.g. after an
+  upgrade changed what plugins require or validation models provide.'''
+  from app.models import refresh_compatibility
+  refresh_compatibility(db.session.connection())
+  db.session.commit()
+  click.echo('Compatibility index rebuilt.')
+
+
+def _work(redis_url, queue_names):
+  import rq
+  from redis import Redis
+  connection = Redis.from_url(redis_url)
+  rq.Worker([ rq.Queue(name, connection=connection) for name in queue_names ],
+    connection=connection).work()
+
+
+def _schedule():
+  from app import create_app, schedule
+  with create_app().app_context():
+    schedule.run_forever()
+
+
+@bp.cli.command('workers')
+@click.option('--weights', default=None, help='Workers per queue, e.g. "interactive=4,bulk=2" (TASK_WORKERS).')
+@click.option('--scheduler/--no-scheduler', default=True, help='Also run the revalidation scheduler.')
+def workers(weights, scheduler):
+  '''Start RQ workers for the interactive, bulk and maintenance queues.'''
+  import multiprocessing
+  from app import queues
+  plan = queues.worker_plan(queues.parse_weights(weights or current_app.config['TASK_WORKERS']))
+  processes = [
+    multiprocessing.Process(target=_work, args=(current_app.config['REDIS_URL'], queue_names))
+    for queue_names in plan
+  ]
+  for process, queue_names in zip(processes, plan):
+    process.start()
+    click.echo(f'worker {process.pid}: {", ".join(queue_names)}')
+  if scheduler:
+    process = multiprocessing.Process(target=_schedule)
+    process.start()
+    click.echo(f'scheduler {process.pid}')
+    processes.append(process)
+  for process in processes:
+    process.join()
+
+
+@bp.cli.command('scheduler')
+def scheduler():
+  '''Run the revalidation scheduler (see REVALIDATION_INTERVAL).'''
+  from app import schedule
+  if not current_app.config['REVALIDATION_INTERVAL']:
+    click.echo('REVALIDATION_INTERVAL is not set; scheduled revalidation is off.')
+  schedule.run_forever()
@@ -0,0 +1,214 @@
+import hashlib
+import re
+
+import sqlalchemy as sa
+
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.exc import IntegrityError
+
+from app import db, queues
+from app.models import Device, ConfigTerm, ConfigPosting
+
+
+CONFIGURATION = ('json', 'fgt_cli_configuration')
+PATH_SEPARATOR = ' / '
+MATCHES = ('exact', 'prefix', 'substring')
+BATCH = 300
+STORE_BUILD_KEY = 'framease:config_store:build_queued'
+# Settings holding passwords, pre-shared keys and the like: `set password
+# ENC ...`, `set psksecret ...`, `set key-string ...`. Their values are
+# replaced with SECRET_VALUE, so the index only tells that they are set.
+SECRET_KEY = re.compile(r'passw|passphrase|secret|pwd|psk|(^|-)key(-string)?$')
+SECRET_VALUE = re.compile(r'^ENC ')
+MASK = '********'
+
+
+def flatten(hierarchy, path=()):
+  '''(path, key, value) of every setting in a parsed configuration.
+
+  `path` joins the `config ...`/`edit ...` lines leading to the setting,
+  e.g. 'config system interface / edit "port1"'.
+  '''
+  for key, value in hierarchy.items():
+    if isinstance(value, dict):
+      yield from flatten(value, path + (key,))
+    else:
+      yield PATH_SEPARATOR.join(path), key, str(value)
+
+
+def is_secret(key, value):
+  return bool(SECRET_KEY.search(key) or SECRET_VALUE.match(value))
+
+
+def terms(hierarchy):
+  '''Settings to index; values over CONFIG_INDEX_MAX_VALUE (certificates,
+  scripts) are left out, secret ones are masked.'''
+  limit = current_app.config['CONFIG_INDEX_MAX_VALUE']
+  return set(
+    (path, key, MASK if is_secret(key, value) else value)
+    for path, key, value in flatten(hierarchy) if len(value) <= limit
+  )
+
+
+def digest(found):
+  h = hashlib.sha256()
+  for term in sorted(found):
+    h.update('\0'.join(term).encode())
+    h.update(b'\n')
+  return h.hexdigest()
+
+
+def _term_ids(found):
+  '''Ids of the terms, creating the ones not seen on any device yet.'''
+  found = list(found)
+  ids = dict()
+  for i in range(0, len(found), BATCH):
+    batch = found[i:i + BATCH]
+    columns = sa.tuple_(ConfigTerm.path, ConfigTerm.key, ConfigTerm.value)
+    query = sa.select(ConfigTerm.path, ConfigTerm.key, ConfigTerm.value, ConfigTerm.id) \
+      .where(columns.in_(batch))
+    ids.update(((path, key, value), term_id) for path, key, value, term_id in db.session.execute(query))
+    missing = [ term for term in batch if term not in ids ]
+    if missing:
+      db.session.execute(sa.insert(ConfigTerm), [
+        { 'path': path, 'key': key, 'value': value } for path, key, value in missing
+      ])
+      ids.update(((path, key, value), term_id)
+        for path, key, value, term_id in db.session.execute(query.where(columns.in_(missing))))
+  return ids
+
+
+def update(device, hierarchy):
+  '''Make the index match `hierarchy` for the device.
+
+  Only the settings that changed since the last update are written, and
+  nothing at all when the configuration is the same. Returns True if the
+  index changed.
+  '''
+  found = terms(hierarchy)
+  new_digest = digest(found)
+  if device.config_digest == new_digest:
+    return False
+  query = sa.select(ConfigTerm.path, ConfigTerm.key, ConfigTerm.value, ConfigTerm.id) \
+    .join(ConfigPosting, ConfigPosting.c.term_id == ConfigTerm.id) \
+    .where(ConfigPosting.c.device_id == device.id)
+  current = { (path, key, value): term_id for path, key, value, term_id in db.session.execute(query) }
+  removed = [ term_id for term, term_id in current.items() if term not in found ]
+  added = found - current.keys()
+  try:
+    for i in range(0, len(removed), BATCH):
+      db.session.execute(ConfigPosting.delete().where(ConfigPosting.c.device_id == device.id,
+        ConfigPosting.c.term_id.in_(removed[i:i + BATCH])))
+    ids = _term_ids(added)
+    if ids:
+      db.session.execute(ConfigPosting.insert(), [
+        { 'term_id': term_id, 'device_id': device.id } for term_id in ids.values()
+      ])
+    device.config_digest = new_digest
+    db.session.commit()
+  except IntegrityError:
+    # Another worker indexed the same device or terms at the same time;
+    # the digest is not stored, so the next update tries again.
+    db.session.rollback()
+    current_app.logger.warning(f'Configuration index of {device} not updated', exc_info=True)
+    return False
+  schedule_store_build()
+  return True
+
+
+def update_from_model_data(device, data):
+  '''Index the configuration in a device's model data, if it has one.
+
+  A configuration that failed to parse leaves the index as it was.
+  '''
+  configuration = data.get(CONFIGURATION[1])
+  hierarchy = configuration.get('hierarchy') if configuration else None
+  if not hierarchy:
+    return False
+  return update(device, hierarchy)
+
+
+def index_device(device):
+  if CONFIGURATION not in device.provides:
+    return False
+  return update_from_model_data(device, device.get_model_data([ CONFIGURATION ]))
+
+
+def schedule(device):
+  '''Re-index the device in the background, e.g. after a config upload.'''
+  if CONFIGURATION not in device.provides:
+    return
+  try:
+    queues.get_queue(queues.MAINTENANCE).enqueue('app.tasks.index_device_config', device.id)
+  except RedisError:
+    current_app.logger.warning(f'Unable to queue the configuration index of {device}', exc_info=True)
+
+
+def schedule_store_build():
+  '''Rebuild the configuration store (see config_store) in the background
+  after the index changed. Changes made before the queued build starts
+  share it.'''
+  try:
+    if not current_app.redis.set(STORE_BUILD_KEY, 1, nx=True, ex=3600):
+      return
+    queues.get_queue(queues.MAINTENANCE).enqueue('app.tasks.build_config_store')
+  except RedisError:
+    current_app.logger.warning('Unable to queue a configuration store build', exc_info=True)
+
+
+def prune():
+  '''Drop the terms no device has any more. Returns how many.'''
+  result = db.session.execute(sa.delete(ConfigTerm).where(
+    ~sa.exists().where(ConfigPosting.c.term_id == ConfigTerm.id)))
+  db.session.commit()
+  return result.rowcount
+
+
+def _starts_with(column, prefix):
+  # The range lets the database seek in the index; LIKE alone may not.
+  upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+  return sa.and_(column >= prefix, column < upper, column.startswith(prefix, autoescape=True))
+
+
+def search(path=None, key=None, value=None, match='exact'):
+  '''Devices whose configuration has a matching setting.
+
+  `path` matches the path and everything under it, `key` the setting
+  name exactly, and `value` exactly, as a prefix or as a substring
+  according to `match`. Returns (results, truncated): a list of
+  (device, [ConfigTerm, ...]) ordered by device name, and whether
+  CONFIG_SEARCH_MAX_MATCHES cut the matches short.
+  '''
+  if match not in MATCHES:
+    raise ValueError(f'Unknown match: {match}')
+  if not (path or key or value):
+    return list(), False
+  query = sa.select(ConfigTerm.id)
+  if path:
+    path = path.strip()
+    query = query.where(sa.or_(ConfigTerm.path == path,
+      _starts_with(ConfigTerm.path, path + PATH_SEPARATOR)))
+  if key:
+    query = query.where(ConfigTerm.key == key.strip())
+  if value:
+    if match == 'exact':
+      query = query.where(ConfigTerm.value == value)
+    elif match == 'prefix':
+      query = query.where(_starts_with(ConfigTerm.value, value))
+    else:
+      query = query.where(ConfigTerm.value.contains(value, autoescape=True))
+  limit = current_app.config['CONFIG_SEARCH_MAX_MATCHES']
+  rows = db.session.execute(sa.select(ConfigPosting.c.device_id, ConfigTerm)
+    .join(ConfigTerm, ConfigTerm.id == ConfigPosting.c.term_id)
+    .where(ConfigPosting.c.term_id.in_(query)).limit(limit + 1)).all()
+  truncated = len(rows) > limit
+  matches = dict()
+  for device_id, term in rows[:limit]:
+    matches.setdefault(device_id, list()).append(term)
+  devices = db.session.scalars(sa.select(Device).where(Device.id.in_(matches))
+    .order_by(Device.devicename, Device.id)).all()
+  return [
+    (device, sorted(matches[device.id], key=lambda term: (term.path, term.key, term.value)))
+    for device in devices
+  ], truncated
@@ -0,0 +1,205 @@
+import fcntl
+import json
+import mmap
+import os
+import shutil
+import time
+import uuid
+
+from array import array
+from collections import Counter
+
+import sqlalchemy as sa
+
+from flask import current_app
+
+from app import db
+from app.config_index import PATH_SEPARATOR, MATCHES
+from app.models import ConfigTerm, ConfigPosting
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+COLUMNS = ('device', 'path', 'key', 'value')
+DICTIONARIES = ('path', 'key', 'value')
+CURRENT = 'CURRENT'
+LOCK = 'build.lock'
+# Builds live in their own directory under CONFIG_STORE_PATH, so cleaning up
+# old generations never touches anything else kept there.
+STORE_DIR = 'framease-config-store'
+GENERATION_PREFIX = 'generation-'
+
+
+def store_path():
+  path = current_app.config['CONFIG_STORE_PATH'] / STORE_DIR
+  path.mkdir(parents=True, exist_ok=True)
+  return path
+
+
+def build():
+  '''Write the columnar store from the configuration search index.
+
+  Every (device, setting) posting becomes one row of four int columns:
+  the device id and the interned ids of its path, key and value. Each
+  build goes to a new directory and CURRENT is switched to it at the
+  end, so readers never see a half-written store. Returns the row count.
+  '''
+  root = store_path()
+  # One build at a time, so an older snapshot never replaces a newer one
+  # and no build removes the generation another is about to make current.
+  with open(root / LOCK, 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return _build(root)
+
+
+def _build(root):
+  interned = { name: dict() for name in DICTIONARIES }
+  terms = dict()
+  query = sa.select(ConfigTerm.id, ConfigTerm.path, ConfigTerm.key, ConfigTerm.value)
+  for term_id, *values in db.session.execute(query.execution_options(yield_per=10000)):
+    terms[term_id] = tuple(
+      interned[name].setdefault(value, len(interned[name]))
+      for name, value in zip(DICTIONARIES, values))
+  columns = { name: array('i') for name in COLUMNS }
+  query = sa.select(ConfigPosting.c.device_id, ConfigPosting.c.term_id) \
+    .order_by(ConfigPosting.c.device_id)
+  for device_id, term_id in db.session.execute(query.execution_options(yield_per=10000)):
+    columns['device'].append(device_id)
+    for name, value_id in zip(DICTIONARIES, terms[term_id]):
+      columns[name].append(value_id)
+
+  generation = f'{GENERATION_PREFIX}{uuid.uuid4().hex}'
+  path = root / generation
+  path.mkdir()
+  for name, column in columns.items():
+    with open(path / f'{name}.bin', 'wb') as f:
+      column.tofile(f)
+  for name, values in interned.items():
+    with open(path / f'{name}.json', 'w') as f:
+      json.dump(list(values), f)
+  with open(path / 'meta.json', 'w') as f:
+    json.dump({ 'rows': len(columns['device']), 'built': time.time() }, f)
+  tmp = root / f'{CURRENT}.{generation}'
+  tmp.write_text(generation)
+  os.replace(tmp, root / CURRENT)
+  for entry in root.iterdir():
+    if entry.name.startswith(GENERATION_PREFIX) and entry.is_dir() and entry.name != generation:
+      shutil.rmtree(entry, ignore_errors=True)
+  return len(columns['device'])
+
+
+class ConfigStore:
+  '''Read side of the store: columns are memory-mapped, so opening it is
+  cheap and only the pages a query touches are read.
+
+  Queries use NumPy when it is installed and plain Python loops over the
+  mapped arrays otherwise.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    with open(path / 'meta.json', 'r') as f:
+      meta = json.load(f)
+    self.rows = meta['rows']
+    self.built = meta.get('built')
+    self.dictionaries = dict()
+    for name in DICTIONARIES:
+      with open(path / f'{name}.json', 'r') as f:
+        self.dictionaries[name] = json.load(f)
+    self.columns = { name: self._map(path / f'{name}.bin') for name in COLUMNS }
+    self._lookup = dict()
+
+  def _map(self, fname):
+    if not self.rows:
+      return numpy.zeros(0, dtype=numpy.intc) if numpy is not None else array('i')
+    if numpy is not None:
+      return numpy.memmap(fname, dtype=numpy.intc, mode='r', shape=(self.rows,))
+    with open(fname, 'rb') as f:
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast('i')
+
+  def _ids(self, name, value, match='exact'):
+    '''Ids of the dictionary entries of column `name` that match.'''
+    values = self.dictionaries[name]
+    if match == 'exact':
+      if name not in self._lookup:
+        self._lookup[name] = { v: i for i, v in enumerate(values) }
+      return [ self._lookup[name][value] ] if value in self._lookup[name] else list()
+    if match == 'prefix':
+      return [ i for i, v in enumerate(values) if v.startswith(value) ]
+    if match == 'under':
+      return [ i for i, v in enumerate(values) if v == value or v.startswith(value + PATH_SEPARATOR) ]
+    return [ i for i, v in enumerate(values) if value in v ]
+
+  def _filters(self, path, key, value, match):
+    filters = list()
+    if path:
+      filters.append(('path', self._ids('path', path.strip(), 'under')))
+    if key:
+      filters.append(('key', self._ids('key', key.strip())))
+    if value:
+      filters.append(('value', self._ids('value', value, match)))
+    return filters
+
+  def count(self, group_by='value', path=None, key=None, value=None, match='exact', limit=None):
+    '''Rows matching the filters, counted per distinct `group_by`.
+
+    Filters are the same as for config_index.search(). Returns a list of
+    (group, count), largest first; groups are device ids for 'device' and
+    the path, key or value itself otherwise.
+    '''
+    if group_by not in COLUMNS:
+      raise ValueError(f'Unknown column: {group_by}')
+    if match not in MATCHES:
+      raise ValueError(f'Unknown match: {match}')
+    filters = self._filters(path, key, value, match)
+    if any(not ids for name, ids in filters):
+      return list()
+    if numpy is not None:
+      counts = self._count_numpy(group_by, filters)
+    else:
+      counts = self._count_python(group_by, filters)
+    counts = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    if group_by == 'device':
+      return counts
+    labels = self.dictionaries[group_by]
+    return [ (labels[group], count) for group, count in counts ]
+
+  def _count_numpy(self, group_by, filters):
+    mask = numpy.ones(self.rows, dtype=bool)
+    for name, ids in filters:
+      column = self.columns[name]
+      mask &= column == ids[0] if len(ids) == 1 else numpy.isin(column, ids)
+    groups, counts = numpy.unique(self.columns[group_by][mask], return_counts=True)
+    return dict(zip(groups.tolist(), counts.tolist()))
+
+  def _count_python(self, group_by, filters):
+    filters = [ (self.columns[name], set(ids)) for name, ids in filters ]
+    column = self.columns[group_by]
+    return Counter(column[row] for row in range(self.rows)
+      if all(values[row] in ids for values, ids in filters))
+
+
+_loaded = dict()
+
+
+def open_store():
+  '''The current store, shared by the queries of this process until a
+  newer build replaces it. None if nothing was built yet.'''
+  root = store_path()
+  try:
+    generation = (root / CURRENT).read_text().strip()
+  except OSError:
+    return None
+  store = _loaded.get(root)
+  if store is None or store.path.name != generation:
+    try:
+      store = ConfigStore(root / generation)
+    except (OSError, ValueError, KeyError):
+      current_app.logger.warning(f'Unable to open configuration store {generation}', exc_info=True)
+      return store
+    _loaded[root] = store
+  return store
@@ -0,0 +1,139 @@
+import json
+
+from collections.abc import Mapping
+
+
+class ExecutionContext(Mapping):
+  '''Read-only view of the data a device's validation models produced.
+
+  Models and plugins that set `accepts_context = True` receive this object
+  directly instead of a JSON string. The view cannot be modified at the top
+  level. The nested structures are shared with every other case in the run,
+  so plugins must treat them as read-only too.
+  '''
+
+  def __init__(self, data, parameters=None, reads=None):
+    self._data = data
+    self._parameters = parameters
+    self._reads = reads
+
+  @classmethod
+  def from_model_data(cls, data):
+    '''Wrap accumulated model data, dropping the raw `filedata:` lines and
+    the values of `secret` requirements, which only models may see.'''
+    secrets = set(key.split(':', 1)[1] for key, value in data.items()
+      if key.startswith('type:') and value == 'secret')
+    return cls({
+      key: value for key, value in data.items()
+      if not key.startswith('filedata:') and key not in secrets
+    })
+
+  def with_parameters(self, parameters):
+    return ExecutionContext(self._data, parameters, self._reads)
+
+  def tracking(self):
+    '''Return a copy of the context that records what is read from it.
+
+    The second value is the set of paths (tuples of keys) that were read.
+    Parameters are not tracked.
+    '''
+    reads = set()
+    return ExecutionContext(self._data, self._parameters, reads), reads
+
+  def __getitem__(self, key):
+    if key == 'parameters' and self._parameters is not None:
+      return self._parameters
+    if self._reads is not None:
+      return ReadTracker(self._data, (), self._reads)[key]
+    return self._data[key]
+
+  def __iter__(self):
+    if self._reads is not None:
+      self._reads.add(())
+    yield from self._data
+    if self._parameters is not None and 'parameters' not in self._data:
+      yield 'parameters'
+
+  def __len__(self):
+    return len(self._data) + (
+      1 if self._parameters is not None and 'parameters' not in self._data else 0)
+
+  def __repr__(self):
+    return f'<ExecutionContext: {", ".join(self)}>'
+
+  def to_dict(self):
+    if self._reads is not None:
+      self._reads.add(())
+    data = dict(self._data)
+    if self._parameters is not None:
+      data['parameters'] = self._parameters
+    return data
+
+  def to_json(self):
+    return json.dumps(self.to_dict())
+
+
+class ReadTracker(Mapping):
+  '''Mapping view that records the paths read from the data it wraps.
+
+  Looking up a single value records the path to it. Iterating over a mapping,
+  or asking for its length, records the path of the whole mapping, and its
+  values are handed out without further tracking.
+  '''
+
+  def __init__(self, data, path, reads):
+    self._data = data
+    self._path = path
+    self._reads = reads
+
+  def __getitem__(self, key):
+    path = self._path + (key,)
+    value = self._data.get(key, _MISSING)
+    if isinstance(value, Mapping):
+      return ReadTracker(value, path, self._reads)
+    self._reads.add(path)
+    if value is _MISSING:
+      raise KeyError(key)
+    return value
+
+  def __contains__(self, key):
+    self._reads.add(self._path + (key,))
+    return key in self._data
+
+  def __iter__(self):
+    self._reads.add(self._path)
+    return iter(self._data)
+
+  def __len__(self):
+    self._reads.add(self._path)
+    return len(self._data)
+
+  def items(self):
+    self._reads.add(self._path)
+    return self._data.items()
+
+  def values(self):
+    self._reads.add(self._path)
+    return self._data.values()
+
+  def __repr__(self):
+    return repr(self._data)
+
+
+_MISSING = object()
+
+
+def minimal_paths(reads):
+  '''Drop every path that lies inside another path of `reads`.'''
+  paths = list()
+  for path in sorted(reads, key=len):
+    if not any(path[:len(other)] == other for other in paths):
+      paths.append(path)
+  return sorted(paths)
+
+
+def call_with_context(module, func, context):
+  '''Call `module.func` with the context, or with JSON for older modules.'''
+  if getattr(module, 'accepts_context', False):
+    return getattr(module, func)(context)
+  return getattr(module, func)(context.to_json())
@@ -0,0 +1,134 @@
+import json
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from flask import current_app
+from redis.exceptions import RedisError
+from time import time
+
+
+PENDING = 'framease_events'
+# Progress events carry no SSE id: their timestamps come from the workers'
+# clocks and are not ordered with the notifications Last-Event-ID resumes.
+PROGRESS_EVENT = 'task_progress'
+
+
+def channel(user_id):
+  return f'framease:events:user:{user_id}'
+
+
+def progress_key(task_id):
+  return f'framease:task:{task_id}:progress'
+
+
+def _event(name, data, timestamp=None):
+  return {
+    'name': name,
+    'data': data,
+    'timestamp': timestamp if timestamp is not None else time(),
+  }
+
+
+def _message(name, data, timestamp=None):
+  return json.dumps(_event(name, data, timestamp))
+
+
+def publish(user_id, name, data, timestamp=None):
+  try:
+    current_app.redis.publish(channel(user_id), _message(name, data, timestamp))
+  except RedisError:
+    current_app.logger.warning('Unable to publish %s to user %s', name, user_id, exc_info=True)
+
+
+def publish_after_commit(session, user_id, name, data, timestamp=None):
+  '''Publish once `session` commits, so listeners never see rolled back rows.'''
+  session.info.setdefault(PENDING, list()).append((user_id, name, data, timestamp))
+
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def _publish_pending(session):
+  for user_id, name, data, timestamp in session.info.pop(PENDING, list()):
+    publish(user_id, name, data, timestamp)
+
+
+@sa.event.listens_for(so.Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+  session.info.pop(PENDING, None)
+
+
+def set_progress(user_id, task_id, progress):
+  '''Record a task's progress and push it to the task owner's stream.'''
+  try:
+    with current_app.redis.pipeline() as pipe:
+      pipe.set(progress_key(task_id), int(progress),
+        ex=current_app.config['TASK_PROGRESS_TTL'])
+      pipe.publish(channel(user_id),
+        _message(PROGRESS_EVENT, {'task_id': task_id, 'progress': int(progress)}))
+      pipe.execute()
+  except RedisError:
+    current_app.logger.warning('Unable to record progress of task %s', task_id, exc_info=True)
+
+
+def get_progress(task_ids):
+  '''Progress of several tasks with a single Redis round trip.
+
+  Returns {task_id: progress}; tasks that never reported are left out.
+  '''
+  task_ids = list(task_ids)
+  if not task_ids:
+    return dict()
+  try:
+    values = current_app.redis.mget([ progress_key(task_id) for task_id in task_ids ])
+  except RedisError:
+    return dict()
+  return { task_id: int(value) for task_id, value in zip(task_ids, values) if value is not None }
+
+
+def progress_events(progress):
+  '''{task_id: progress} as events, to bring a reconnecting stream up to date.'''
+  return [
+    _event(PROGRESS_EVENT, {'task_id': task_id, 'progress': value})
+    for task_id, value in progress.items()
+  ]
+
+
+def subscribe(user_id):
+  '''Subscribe to a user's events before loading the backlog, so nothing
+  published in between is lost.'''
+  pubsub = current_app.redis.pubsub(ignore_subscribe_messages=True)
+  pubsub.subscribe(channel(user_id))
+  return pubsub
+
+
+def format_event(message):
+  '''An SSE event; only notifications get an id to resume from.'''
+  event = json.loads(message) if isinstance(message, (str, bytes)) else message
+  if event['name'] == PROGRESS_EVENT:
+    return f'data: {json.dumps(event)}\n\n'
+  return f'id: {event["timestamp"]}\ndata: {json.dumps(event)}\n\n'
+
+
+def stream(pubsub, backlog=(), duration=300, heartbeat=15):
+  '''Server-Sent Events: the backlog, then everything published to `pubsub`.
+
+  The stream ends after `duration` seconds; the browser reconnects on its
+  own and resumes from the Last-Event-ID of the last notification it was
+  sent. A comment line every
+  `heartbeat` seconds notices clients that went away.
+  '''
+  try:
+    yield 'retry: 3000\n\n'
+    for event in backlog:
+      yield format_event(event)
+    deadline = time() + duration
+    last_sent = time()
+    while time() < deadline:
+      message = pubsub.get_message(timeout=min(heartbeat, max(deadline - time(), 0)))
+      if message is not None and message['type'] == 'message':
+        yield format_event(message['data'])
+        last_sent = time()
+      elif time() - last_sent >= heartbeat:
+        yield ': keep-alive\n\n'
+        last_sent = time()
+  finally:
+    pubsub.close()
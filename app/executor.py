@@ -0,0 +1,187 @@
+import multiprocessing
+import multiprocessing.connection
+import time
+
+from app.context import call_with_context, minimal_paths
+
+
+def run_case(function, parameters, context, plan=None):
+  from app.models import plugins
+  if function in plugins:
+    if plan is not None:
+      return plugins[function].evaluate(plan, context.with_parameters(parameters))
+    return call_with_context(plugins[function], 'check', context.with_parameters(parameters))
+
+
+def run_tracked_case(function, parameters, context, plan=None):
+  '''Run a case, returning its result and the data paths it read.'''
+  context, reads = context.tracking()
+  return run_case(function, parameters, context, plan), minimal_paths(reads)
+
+
+# The parsed configuration of the validation being run, and its cases. They
+# are set before the pool forks, so every worker shares them copy-on-write
+# instead of receiving a pickled copy with each case.
+_shared_context = None
+_shared_cases = None
+
+
+def _run_shared_case(function, parameters, plan):
+  return run_tracked_case(function, parameters, _shared_context, plan)
+
+
+def timeout_result(timeout):
+  return { f'[ERROR: timed out after {timeout}s]': False }
+
+
+def run_batches(context, cases):
+  '''Evaluate together the cases whose plugin can batch their plans.
+
+  Returns {index in cases: (result, reads)} for every batched case. Only
+  plugins with an evaluate_batch() are batched, and only when at least two
+  of their cases' plans allow it.
+  '''
+  from app.models import plugins
+  groups = dict()
+  for i, (sequence, function, parameters, plan) in enumerate(cases):
+    plugin = plugins.get(function)
+    if plan is not None and hasattr(plugin, 'evaluate_batch') and plugin.batchable(plan):
+      groups.setdefault(function, list()).append(i)
+  batched = dict()
+  for function, indexes in groups.items():
+    if len(indexes) < 2:
+      continue
+    plugin = plugins[function]
+    plans = [ cases[i][3] for i in indexes ]
+    for i, plan, result in zip(indexes, plans, plugin.evaluate_batch(plans, context)):
+      batched[i] = (result, minimal_paths(tuple(path) for path in plugin.plan_reads(plan)))
+  return batched
+
+
+def run_cases(context, cases, pool_size=1, timeout=None):
+  '''Run suite cases against one context, yielding (sequence, result, reads).
+
+  `cases` is a list of (sequence, function, parameters, plan), where plan
+  is the compiled plan of the case or None, and `reads` lists the paths of
+  the context each case read (None if it timed out). Cases that can be
+  batched are evaluated together first; see run_batches(). Results are
+  yielded in the order of `cases` no matter which worker finishes first.
+  '''
+  batched = run_batches(context, cases)
+  unbatched = _run_unbatched(context,
+    [ case for i, case in enumerate(cases) if i not in batched ],
+    pool_size, timeout)
+  try:
+    for i, case in enumerate(cases):
+      if i in batched:
+        yield (case[0], *batched[i])
+      else:
+        yield next(unbatched)
+  finally:
+    unbatched.close()
+
+
+def _serve(conn):
+  '''Worker loop: run the shared cases whose indexes come down `conn`.'''
+  while True:
+    try:
+      index = conn.recv()
+    except EOFError:
+      return
+    sequence, function, parameters, plan = _shared_cases[index]
+    try:
+      outcome = (True, _run_shared_case(function, parameters, plan))
+    except Exception as e:
+      outcome = (False, e)
+    try:
+      conn.send(outcome)
+    except Exception as e:
+      # The result or the exception could not be pickled.
+      conn.send((False, RuntimeError(repr(e))))
+
+
+class _Worker:
+  '''A forked worker process and the case it is running, if any.'''
+
+  def __init__(self, fork):
+    self.conn, child = fork.Pipe()
+    self.process = fork.Process(target=_serve, args=(child,), daemon=True)
+    self.process.start()
+    child.close()
+    self.index = None
+    self.deadline = None
+
+  def start(self, index, timeout):
+    self.conn.send(index)
+    self.index = index
+    self.deadline = time.monotonic() + timeout if timeout else None
+
+  def stop(self):
+    self.conn.close()
+    self.process.kill()
+    self.process.join()
+
+
+def _run_unbatched(context, cases, pool_size=1, timeout=None):
+  '''Run cases one by one, yielding (sequence, result, reads) in order.
+
+  Cases run in a pool of `pool_size` forked workers, started once per
+  call; each case is sent as its index in `cases`, which the workers
+  share with the context. A case still running `timeout` seconds after it
+  started gets a failed timeout result, and only its worker is killed and
+  replaced, so a hung plugin never holds up the cases after it. Without a
+  timeout and with a pool of one, cases run in this process.
+  '''
+  if not cases:
+    return
+  if pool_size <= 1 and not timeout:
+    for sequence, function, parameters, plan in cases:
+      yield (sequence, *run_tracked_case(function, parameters, context, plan))
+    return
+
+  global _shared_context, _shared_cases
+  _shared_context = context
+  _shared_cases = cases
+  fork = multiprocessing.get_context('fork')
+  workers = list()
+  done = dict()      # index -> (ok, outcome)
+  sent = 0
+  try:
+    workers.extend(_Worker(fork) for _ in range(min(max(pool_size, 1), len(cases))))
+    for i, (sequence, function, parameters, plan) in enumerate(cases):
+      while i not in done:
+        for worker in workers:
+          if worker.index is None and sent < len(cases):
+            worker.start(sent, timeout)
+            sent += 1
+        busy = [ worker for worker in workers if worker.index is not None ]
+        deadlines = [ worker.deadline for worker in busy if worker.deadline is not None ]
+        wait = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+        ready = multiprocessing.connection.wait([ worker.conn for worker in busy ], wait)
+        now = time.monotonic()
+        for worker in busy:
+          if worker.conn in ready:
+            try:
+              done[worker.index] = worker.conn.recv()
+              worker.index = None
+              continue
+            except EOFError:
+              worker.process.join()
+              done[worker.index] = (True, ({ f'[ERROR: exited with code {worker.process.exitcode}]': False }, None))
+          elif worker.deadline is not None and worker.deadline <= now:
+            done[worker.index] = (True, (timeout_result(timeout), None))
+          else:
+            continue
+          worker.stop()
+          workers.remove(worker)
+          if sent < len(cases):
+            workers.append(_Worker(fork))
+      ok, outcome = done.pop(i)
+      if not ok:
+        raise outcome
+      yield (sequence, *outcome)
+  finally:
+    for worker in workers:
+      worker.stop()
+    _shared_context = None
+    _shared_cases = None
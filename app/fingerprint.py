@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+
+from collections.abc import Mapping
+
+
+_MISSING = '[missing]'
+
+
+def _resolve(data, path):
+  for key in path:
+    if not isinstance(data, Mapping) or key not in data:
+      return _MISSING
+    data = data[key]
+  return data
+
+
+def digest_reads(data, paths, memo=None):
+  '''Hash the values found at `paths` in `data`.
+
+  `memo` caches the hash of each path, so the same subtree read by many
+  cases of a suite is only serialised once per run.
+  '''
+  if memo is None:
+    memo = dict()
+  digest = hashlib.sha256()
+  for path in paths:
+    path = tuple(path)
+    if path not in memo:
+      value = data if not path else _resolve(data, path)
+      if hasattr(value, 'to_dict'):
+        value = value.to_dict()
+      memo[path] = hashlib.sha256(json.dumps(
+        [list(path), value], sort_keys=True, default=str).encode()).hexdigest()
+    digest.update(memo[path].encode())
+  return digest.hexdigest()
+
+
+def plugin_version(function):
+  from app.models import plugins
+  return getattr(plugins.get(function), 'plugin_version', None)
+
+
+def case_fingerprint(case, parameters, reads_digest):
+  '''Fingerprint of one case run: what it is, what it was given and read.'''
+  return hashlib.sha256(json.dumps([
+    case.function,
+    case.version,
+    plugin_version(case.function),
+    parameters,
+    reads_digest,
+  ], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def make_entry(case, parameters, data, reads, memo=None):
+  '''Fingerprint entry to store with a case result, or None.
+
+  Only plugins that declare a `plugin_version` get one; their results are
+  assumed to depend on nothing but the case and the data they read.
+  '''
+  if reads is None or plugin_version(case.function) is None:
+    return None
+  paths = [ list(path) for path in reads ]
+  return {
+    'fingerprint': case_fingerprint(case, parameters, digest_reads(data, paths, memo)),
+    'reads': paths,
+  }
+
+
+def is_unchanged(case, parameters, data, entry, memo=None):
+  '''True if a case would read the same inputs as when `entry` was made.'''
+  if not entry or plugin_version(case.function) is None:
+    return False
+  return entry['fingerprint'] == case_fingerprint(
+    case, parameters, digest_reads(data, entry['reads'], memo))
+
+
+def _file_state(fname):
+  try:
+    stat = os.stat(fname)
+  except (OSError, TypeError):
+    return _MISSING
+  return [stat.st_size, stat.st_mtime_ns]
+
+
+def input_digest(validation):
+  '''Digest of everything a run of `validation` is computed from, or None.
+
+  Covers the device's validation models, their configuration and the
+  size and mtime of the files they read, and the suite's cases. It is
+  None when an input cannot be known without running: a model not fed
+  only by uploaded files (live retrieval), or a plugin without a
+  `plugin_version`.
+  '''
+  from app.models import validation_models
+  from app.parse_cache import is_cacheable
+  device = validation.device
+  parts = [ device.to_model_data() ]
+  for dvm in sorted(device.validation_models, key=lambda dvm: dvm.sequence):
+    model = validation_models.get(dvm.validation_model)
+    if model is None or not is_cacheable(model):
+      return None
+    data = dvm.get_data()
+    parts.append([dvm.sequence, model.model_name, getattr(model, 'model_version', None), data,
+      [ _file_state(data.get(req_name)) for req_type, req_name in model.requires() ]])
+  for suitecase in validation.suite.cases:
+    case = suitecase.case
+    version = plugin_version(case.function)
+    if version is None:
+      return None
+    parts.append([suitecase.sequence, case.id, case.function, case.version, version, case.data])
+  return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
@@ -0,0 +1,119 @@
+import json
+import uuid
+
+import rq
+import sqlalchemy as sa
+
+from flask import current_app
+
+from app import db, events, queues
+from app.models import Task, DeviceValidation, FLEET_TASK_NAME, validation_retry, \
+  validation_on_failure
+
+
+def pending_key(group_id):
+  return f'framease:fleet:{group_id}:pending'
+
+
+def compatible_devices(suite, devices):
+  compat = set(device.id for device in suite.get_compatible_devices([ device.id for device in devices ]))
+  return [ device for device in devices if device.id in compat ]
+
+
+def _enqueue(tasks):
+  '''Enqueue one run_validation job per child task, batched in pipelines.'''
+  queue = queues.get_queue(queues.BULK)
+  batch_size = current_app.config['FLEET_ENQUEUE_BATCH']
+  for i in range(0, len(tasks), batch_size):
+    with current_app.redis.pipeline() as pipe:
+      queue.enqueue_many([
+        rq.Queue.prepare_data('app.tasks.run_validation',
+          args=(task.user_id, task.obj_id), job_id=task.id, retry=validation_retry(),
+          on_failure=validation_on_failure())
+        for task in tasks[i:i + batch_size]
+      ], pipeline=pipe)
+      pipe.execute()
+
+
+def _push_pending(group, tasks):
+  batch_size = current_app.config['FLEET_ENQUEUE_BATCH']
+  key = pending_key(group.id)
+  with current_app.redis.pipeline() as pipe:
+    for i in range(0, len(tasks), batch_size):
+      pipe.rpush(key, *[ f'{task.id}:{task.obj_id}' for task in tasks[i:i + batch_size] ])
+    pipe.execute()
+
+
+def start(user, suite, devices):
+  '''Validate `devices` against `suite` as one job group.
+
+  All DeviceValidation and Task rows are created in one transaction. Only
+  FLEET_CONCURRENCY jobs are enqueued straight away; the rest wait in a
+  Redis list and are enqueued one at a time as earlier jobs finish.
+  Devices already at their DEVICE_MAX_ACTIVE_RUNS limit are left out;
+  raises QueueLimitError if the user has too many tasks in flight.
+  '''
+  queues.check_limits(user)
+  busy = queues.busy_devices([ device.id for device in devices ])
+  devices = [ device for device in devices if device.id not in busy ]
+  group = Task(id=str(uuid.uuid4()), name=FLEET_TASK_NAME,
+    description=f'Fleet validation: {suite} ({len(devices)} devices)'[:128],
+    user=user, obj_id=suite.id)
+  db.session.add(group)
+  validations = [
+    DeviceValidation(device_id=device.id, suite_id=suite.id,
+      name=f'{device}: {suite}', data=json.dumps(dict()), archived=False,
+      submitted=False, approved=False, final=False, running=True)
+    for device in devices
+  ]
+  db.session.add_all(validations)
+  db.session.flush()
+  tasks = [
+    Task(id=str(uuid.uuid4()), name='run_validation', user=user,
+      obj_id=validation.id, parent_id=group.id, kind=queues.BULK,
+      description=f'{validation.name}'[:128])
+    for validation in validations
+  ]
+  db.session.add_all(tasks)
+  if not tasks:
+    group.complete = True
+  db.session.commit()
+
+  cap = current_app.config['FLEET_CONCURRENCY']
+  if len(tasks) > cap:
+    _push_pending(group, tasks[cap:])
+  _enqueue(tasks[:cap])
+  return group
+
+
+def child_finished(task):
+  '''Called by the worker once a child validation is done.
+
+  Starts the next waiting validation of the group, if any, so the group
+  never has more than FLEET_CONCURRENCY jobs queued or running.
+  '''
+  if task is None or task.parent_id is None:
+    return
+  group = db.session.get(Task, task.parent_id)
+  events.set_progress(group.user_id, group.id, group.get_group_progress()['progress'])
+  item = current_app.redis.lpop(pending_key(task.parent_id))
+  if item is not None:
+    task_id, validation_id = item.decode().split(':')
+    next_task = db.session.get(Task, task_id)
+    if next_task is not None:
+      _enqueue([next_task])
+    return
+  incomplete = db.session.scalar(
+    sa.select(sa.func.count(Task.id))
+    .where(Task.parent_id == task.parent_id, Task.complete == False))
+  if not incomplete:
+    group.complete = True
+    db.session.commit()
+
+
+def get_groups(user=None, limit=20):
+  query = sa.select(Task).where(Task.name == FLEET_TASK_NAME)
+  if user is not None:
+    query = query.where(Task.user_id == user.id)
+  query = query.order_by(Task.timestamp.desc()).limit(limit)
+  return db.session.scalars(query).all()
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import threading
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.orm.attributes import set_committed_value
+from time import monotonic
+
+from app import db, login, metrics
+from app.models import User, Role, UserRole
+
+
+PENDING = 'framease_identity'
+METRICS_FLUSH_INTERVAL = 10
+
+# Left out of the cache; loaded from the database when something needs it.
+UNCACHED = ('password_hash',)
+
+# ('user', id) or ('token', digest) -> (expires, state)
+_local = OrderedDict()
+_lock = threading.Lock()
+_counts = dict()
+_flushed = monotonic()
+
+
+def user_key(user_id):
+  return f'framease:identity:user:{user_id}'
+
+
+def token_key(digest):
+  return f'framease:identity:token:{digest}'
+
+
+def token_digest(token):
+  # Tokens are credentials: only their digest is used as a key.
+  return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _count(name):
+  global _flushed
+  with _lock:
+    _counts[name] = _counts.get(name, 0) + 1
+    if monotonic() - _flushed < METRICS_FLUSH_INTERVAL:
+      return
+    counts = dict(_counts)
+    _counts.clear()
+    _flushed = monotonic()
+  metrics.incr_many({ f'identity_cache.{name}': amount for name, amount in counts.items() })
+
+
+def _dump(user):
+  '''Plain, JSON-friendly copy of what a request needs of `user`.'''
+  state = dict()
+  for attr in sa.inspect(User).column_attrs:
+    if attr.key in UNCACHED:
+      continue
+    value = getattr(user, attr.key)
+    state[attr.key] = value.isoformat() if isinstance(value, datetime) else value
+  state['roles'] = [ [ role.id, role.name, role.active ] for role in user.roles ]
+  return state
+
+
+def _load(state):
+  '''Attach a User built from `state` to the session without a query.'''
+  state = dict(state)
+  roles = list()
+  for role_id, name, active in state.pop('roles'):
+    role = Role(id=role_id, name=name, active=active)
+    so.make_transient_to_detached(role)
+    roles.append(role)
+  for key, value in state.items():
+    if value is not None and isinstance(getattr(User, key).type, sa.DateTime):
+      state[key] = datetime.fromisoformat(value)
+  user = User(**state)
+  # Without events, so the roles don't get a half-filled `users` backref.
+  set_committed_value(user, 'roles', roles)
+  so.make_transient_to_detached(user)
+  return db.session.merge(user, load=False)
+
+
+def _local_get(key):
+  with _lock:
+    entry = _local.get(key)
+    if entry is None:
+      return None
+    expires, state = entry
+    if expires < monotonic():
+      del _local[key]
+      return None
+    _local.move_to_end(key)
+    return state
+
+
+def _local_put(key, state):
+  size = current_app.config['IDENTITY_CACHE_SIZE']
+  with _lock:
+    _local[key] = (monotonic() + current_app.config['IDENTITY_CACHE_LOCAL_TTL'], state)
+    _local.move_to_end(key)
+    while len(_local) > size:
+      _local.popitem(last=False)
+
+
+def _get(key, redis_key):
+  '''Cached state from this process, else from Redis.'''
+  state = _local_get(key)
+  if state is not None:
+    return state
+  try:
+    raw = current_app.redis.get(redis_key)
+  except RedisError:
+    return None
+  if raw is None:
+    return None
+  state = json.loads(raw)
+  _local_put(key, state)
+  return state
+
+
+def _put(user, digest=None):
+  state = _dump(user)
+  entries = [ (('user', user.id), user_key(user.id)) ]
+  if digest is not None:
+    entries.append((('token', digest), token_key(digest)))
+  for key, redis_key in entries:
+    _local_put(key, state)
+  try:
+    with current_app.redis.pipeline() as pipe:
+      for key, redis_key in entries:
+        pipe.set(redis_key, json.dumps(state), ex=current_app.config['IDENTITY_CACHE_TTL'])
+      pipe.execute()
+  except RedisError:
+    pass
+
+
+def _enabled():
+  return current_app.config['IDENTITY_CACHE_TTL'] > 0
+
+
+def user_by_id(user_id):
+  '''The user with this id, from the cache when possible.'''
+  if not _enabled():
+    return db.session.get(User, user_id)
+  state = _get(('user', user_id), user_key(user_id))
+  if state is not None:
+    _count('hit')
+    return _load(state)
+  _count('miss')
+  user = db.session.get(User, user_id)
+  if user is not None:
+    _put(user)
+  return user
+
+
+def user_by_token(token):
+  '''The user owning an unexpired API token, like User.check_token() but
+  from the cache when possible.'''
+  if not _enabled():
+    return User.check_token(token)
+  digest = token_digest(token)
+  state = _get(('token', digest), token_key(digest))
+  if state is not None:
+    _count('hit')
+    expiration = state['token_expiration']
+    if state['token'] != token or expiration is None or \
+        datetime.fromisoformat(expiration).replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+      return None
+    return _load(state)
+  _count('miss')
+  user = User.check_token(token)
+  if user is not None:
+    _put(user, digest)
+  return user
+
+
+def invalidate(user_ids=(), tokens=()):
+  '''Forget cached users and tokens, here and in Redis.
+
+  Other processes may go on using their own copy for up to
+  IDENTITY_CACHE_LOCAL_TTL seconds.
+  '''
+  digests = [ token_digest(token) for token in tokens ]
+  keys = [ ('user', user_id) for user_id in user_ids ] + [ ('token', digest) for digest in digests ]
+  if not keys:
+    return
+  with _lock:
+    for key in keys:
+      _local.pop(key, None)
+  redis_keys = [ user_key(user_id) for user_id in user_ids ] + [ token_key(digest) for digest in digests ]
+  try:
+    current_app.redis.delete(*redis_keys)
+  except RedisError:
+    current_app.logger.warning('Unable to invalidate cached identities', exc_info=True)
+  metrics.incr('identity_cache.invalidated', len(keys))
+
+
+@login.user_loader
+def load_user(id):
+  return user_by_id(int(id))
+
+
+def _values(obj, key):
+  history = sa.inspect(obj).attrs[key].history
+  return set(value for value in list(history.sum()) + [ getattr(obj, key) ] if value is not None)
+
+
+def _changed(obj, *keys):
+  state = sa.inspect(obj)
+  return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def _collect_changes(session, flush_context):
+  '''Note the users whose cached copy a flush made stale: changed or
+  deleted users, with their old and new tokens, and the users of changed
+  roles. They are invalidated when the transaction commits.'''
+  user_ids, tokens, role_ids = set(), set(), set()
+  for obj in session.dirty | session.deleted:
+    if isinstance(obj, User) and (obj in session.deleted or session.is_modified(obj)):
+      user_ids.add(obj.id)
+      tokens |= _values(obj, 'token')
+    elif isinstance(obj, Role) and (obj in session.deleted or _changed(obj, 'name', 'active')):
+      role_ids.add(obj.id)
+  if role_ids:
+    for user_id, token in session.connection().execute(sa.select(User.id, User.token)
+        .join(UserRole, UserRole.c.user_id == User.id).where(UserRole.c.role_id.in_(role_ids))):
+      user_ids.add(user_id)
+      if token is not None:
+        tokens.add(token)
+  if user_ids or tokens:
+    pending = session.info.setdefault(PENDING, (set(), set()))
+    pending[0].update(user_ids)
+    pending[1].update(tokens)
+
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def _invalidate_pending(session):
+  user_ids, tokens = session.info.pop(PENDING, (set(), set()))
+  if user_ids or tokens:
+    invalidate(user_ids, tokens)
+
+
+@sa.event.listens_for(so.Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+  session.info.pop(PENDING, None)
@@ -0,0 +1,97 @@
+import threading
+
+from flask import current_app
+from redis.exceptions import WatchError
+
+
+def lease_key(validation_id):
+  return f'framease:validation:{validation_id}:lease'
+
+
+def claim(validation_id, owner, ttl):
+  '''Take the validation's lease for `owner` unless someone holds it.
+
+  Returns the owner of the lease afterwards: `owner` if it was free (or
+  already ours), otherwise whoever holds it.
+  '''
+  key = lease_key(validation_id)
+  redis = current_app.redis
+  if redis.set(key, owner, nx=True, px=int(ttl * 1000)):
+    return owner
+  holder = redis.get(key)
+  if holder is None:
+    return claim(validation_id, owner, ttl)
+  holder = holder.decode()
+  if holder == owner:
+    redis.pexpire(key, int(ttl * 1000))
+  return holder
+
+
+def holder(validation_id):
+  value = current_app.redis.get(lease_key(validation_id))
+  return value.decode() if value is not None else None
+
+
+def _if_owner(redis, key, owner, action):
+  with redis.pipeline() as pipe:
+    while True:
+      try:
+        pipe.watch(key)
+        value = pipe.get(key)
+        if value is None or value.decode() != owner:
+          pipe.unwatch()
+          return False
+        pipe.multi()
+        action(pipe)
+        pipe.execute()
+        return True
+      except WatchError:
+        continue
+
+
+def renew(validation_id, owner, ttl):
+  '''Extend the lease if `owner` still holds it. Returns False if not.'''
+  key = lease_key(validation_id)
+  return _if_owner(current_app.redis, key, owner, lambda pipe: pipe.pexpire(key, int(ttl * 1000)))
+
+
+def release(validation_id, owner):
+  key = lease_key(validation_id)
+  return _if_owner(current_app.redis, key, owner, lambda pipe: pipe.delete(key))
+
+
+class Heartbeat:
+  '''Renew a lease from a background thread while a worker holds it.
+
+  Cases can run for longer than the lease lives, so the lease is renewed
+  every ttl/3 seconds independently of the validation loop. `lost` is set
+  once the lease turns out to belong to someone else.
+  '''
+
+  def __init__(self, validation_id, owner, ttl):
+    self.app = current_app._get_current_object()
+    self.validation_id = validation_id
+    self.owner = owner
+    self.ttl = ttl
+    self.lost = threading.Event()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+
+  def _run(self):
+    with self.app.app_context():
+      while not self._stop.wait(self.ttl / 3):
+        try:
+          if not renew(self.validation_id, self.owner, self.ttl):
+            self.lost.set()
+            return
+        except Exception:
+          self.app.logger.warning('Unable to renew lease of validation %s',
+            self.validation_id, exc_info=True)
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self._stop.set()
+    self._thread.join()
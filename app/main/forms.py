@@ -4,7 +4,7 @@ from flask import request
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField
 from wtforms import StringField, SubmitField, TextAreaField, IntegerField, SelectField
-from wtforms import BooleanField, HiddenField, validators
+from wtforms import BooleanField, HiddenField, PasswordField, validators
 from wtforms_components import read_only
 from wtforms.validators import ValidationError, DataRequired, Length
 from werkzeug.utils import secure_filename
@@ -59,6 +59,11 @@ class ValidationModelConfigurationFileSelectForm(FlaskForm):
   name = HiddenField('name')
 
 
+class ValidationModelConfigurationSecretForm(FlaskForm):
+  value = PasswordField('Value', validators=[DataRequired()])
+  name = HiddenField('name')
+
+
 class NewDeviceValidationForm(FlaskForm):
   suite = SelectField('Test Suite', validators=[DataRequired()])
   submit = SubmitField('Add')
@@ -71,3 +76,17 @@ class NewCommentForm(FlaskForm):
   submit = SubmitField('Post')
 
 
+class ConfigSearchForm(FlaskForm):
+  path = StringField('Under Path')
+  key = StringField('Setting')
+  value = StringField('Value')
+  match = SelectField('Match', choices=[
+    ('exact', 'Exact'), ('prefix', 'Prefix'), ('substring', 'Substring') ])
+  submit = SubmitField('Search')
+
+  def __init__(self, *args, **kwargs):
+    if 'formdata' not in kwargs:
+      kwargs['formdata'] = request.args
+    if 'meta' not in kwargs:
+      kwargs['meta'] = {'csrf': False}
+    super(ConfigSearchForm, self).__init__(*args, **kwargs)
@@ -1,18 +1,23 @@
 import sqlalchemy as sa
 
 from datetime import datetime, timezone
-from flask import render_template, flash, redirect, url_for, request, g, current_app
+from flask import render_template, flash, redirect, url_for, request, g, current_app, Response
 from flask_login import current_user, login_required
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.sql.expression import false
 from werkzeug.utils import secure_filename
 
 import json
 
-from app import db, plugins, validation_models
+from app import db, config_index, events, plugins, validation_models
 from app.main.forms import DeviceForm, EmptyForm, TestCaseForm, TestSuiteForm, NewCommentForm
 from app.main.forms import EditProfileForm, NewDeviceValidationForm, NewDeviceValidationModelForm
 from app.main.forms import ValidationModelConfigurationFileUploadForm, ValidationModelConfigurationFileSelectForm
-from app.models import User, Device, TestSuite, TestCase, DeviceValidation, Notification, DeviceValidationModel, Comment
+from app.main.forms import ValidationModelConfigurationSecretForm, ConfigSearchForm
+from app.models import User, Device, TestSuite, TestCase, DeviceValidation, Notification, DeviceValidationModel, Comment, Task
+from app.pagination import paginate
+from app.queues import QueueLimitError
+from app.reports import ValidationReport
 from app.main import bp
 
 
@@ -20,14 +25,10 @@ from app.main import bp
 @bp.route('/index', methods=['GET', 'POST'])
 @login_required
 def index():
-  page = request.args.get('page', 1, type=int)
-  query = sa.select(Device).order_by(Device.devicename.desc())
-  devices = db.paginate(query, page=page,
-    per_page=current_user.page_size, error_out=False)
-  next_url = url_for('main.index', page=devices.next_num) \
-    if devices.has_next else None
-  prev_url = url_for('main.index', page=devices.prev_num) \
-    if devices.has_prev else None
+  devices = paginate(sa.select(Device), Device.listing_order(),
+    request.args.get('cursor'), current_user.page_size)
+  next_url = devices.next_url('main.index')
+  prev_url = devices.prev_url('main.index')
   return render_template('index.html', title='Framease',
     devices=devices, next_url=next_url, prev_url=prev_url)
 
@@ -74,6 +75,30 @@ def notifications():
   } for n in notifications ]
 
 
+@bp.route('/events')
+@login_required
+def events_stream():
+  since = request.headers.get('Last-Event-ID', request.args.get('since', 0.0), type=float)
+  pubsub = events.subscribe(current_user.id)
+  query = current_user.notifications.select().where(
+    Notification.timestamp > since).order_by(Notification.timestamp.asc())
+  backlog = [{
+    'name': n.name,
+    'data': n.get_data(),
+    'timestamp': n.timestamp
+  } for n in db.session.scalars(query) ]
+  # Progress published while the client was away is not replayed; send
+  # where its tasks are now instead.
+  backlog += events.progress_events(
+    Task.get_progress_many(current_user.get_tasks_in_progress().all()))
+  db.session.close()
+  return Response(events.stream(pubsub, backlog,
+      duration=current_app.config['EVENTS_STREAM_DURATION'],
+      heartbeat=current_app.config['EVENTS_HEARTBEAT']),
+    mimetype='text/event-stream',
+    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @bp.route('/device/new', methods=['GET', 'POST'])
 def new_device():
   form = DeviceForm()
@@ -167,7 +192,9 @@ def edit_device_models(deviceid):
 def device_delete_model(deviceid, modelid):
   form=EmptyForm()
   if form.validate_on_submit():
-    DeviceValidationModel.query.filter(DeviceValidationModel.id == modelid, DeviceValidationModel.device_id == deviceid).delete()
+    model = db.first_or_404(sa.select(DeviceValidationModel).where(
+      DeviceValidationModel.id == modelid, DeviceValidationModel.device_id == deviceid))
+    db.session.delete(model)
     db.session.commit()
   return redirect(url_for('main.edit_device_models', deviceid=deviceid))
 
@@ -177,6 +204,7 @@ def device_configure_model(deviceid, modelid):
   empty_form = EmptyForm()
   upload_form = ValidationModelConfigurationFileUploadForm()
   select_form = ValidationModelConfigurationFileSelectForm()
+  secret_form = ValidationModelConfigurationSecretForm()
   model = db.first_or_404(sa.select(
     DeviceValidationModel).where(
       DeviceValidationModel.id == modelid
@@ -185,7 +213,8 @@ def device_configure_model(deviceid, modelid):
     )
   )
   return render_template('config_model.html', title=f'Configure Device Validation Model',
-    model=model, empty_form=empty_form, upload_form=upload_form, select_form=select_form
+    model=model, empty_form=empty_form, upload_form=upload_form, select_form=select_form,
+    secret_form=secret_form
   )
 
 @bp.route('/device/<int:deviceid>/validation_models/<modelid>/configure/upload/<req_name>', methods=['POST'])
@@ -207,7 +236,8 @@ def device_configure_model_upload(deviceid, modelid, req_name):
       form.file.data.save(fname)
       if form.name:
         model.configure_requirement(req_name, str(fname))
-        
+        config_index.schedule(device)
+
   return redirect(url_for('main.device_configure_model', deviceid=deviceid, modelid=modelid))
 
 @bp.route('/device/<int:deviceid>/validation_models/<modelid>/configure/select/<req_name>', methods=['POST'])
@@ -225,8 +255,36 @@ def device_configure_model_select(deviceid, modelid, req_name):
   form.select.choices = device.files
   if form.validate_on_submit():
     model.configure_requirement(req_name, form.select.data)
+    config_index.schedule(device)
   return redirect(url_for('main.edit_device_models', deviceid=deviceid))
 
+@bp.route('/device/<int:deviceid>/validation_models/<modelid>/configure/secret/<req_name>', methods=['POST'])
+@login_required
+def device_configure_model_secret(deviceid, modelid, req_name):
+  form = ValidationModelConfigurationSecretForm()
+  model = db.first_or_404(sa.select(
+    DeviceValidationModel).where(
+      DeviceValidationModel.id == modelid
+    ).where(
+      DeviceValidationModel.device_id == deviceid
+    )
+  )
+  if form.validate_on_submit():
+    model.configure_requirement(req_name, form.value.data)
+  return redirect(url_for('main.device_configure_model', deviceid=deviceid, modelid=modelid))
+
+
+@bp.route('/config_search')
+@login_required
+def config_search():
+  form = ConfigSearchForm()
+  results, truncated = list(), False
+  if form.validate():
+    results, truncated = config_index.search(form.path.data, form.key.data,
+      form.value.data, form.match.data)
+  return render_template('config_search.html', title='Configuration Search', form=form,
+    results=results, truncated=truncated, searched=bool(request.args))
+
 
 @bp.route('/device/<int:deviceid>/validation/<validationid>', methods=['GET', 'POST'])
 @login_required
@@ -235,19 +293,27 @@ def device_validation(deviceid, validationid):
   device = validation.device
   form = EmptyForm()
   comment_form = NewCommentForm()
+  report = ValidationReport(validation)
   return render_template('validation.html', title=f'Validation: {validation.name}',
-    validation=validation, device=device, form=form, comment_form=comment_form)
+    validation=validation, device=device, form=form, comment_form=comment_form,
+    report=report)
 
 @bp.route('/device/<int:deviceid>/validation/<validationid>/run', methods=['POST'])
 @login_required
 def validation_run(deviceid, validationid):
   validation = db.first_or_404(sa.select(DeviceValidation).where(DeviceValidation.id == validationid))
   device = validation.device
-  if validation.running:
+  try:
+    task, started = validation.run(current_user)
+  except QueueLimitError as e:
+    flash(str(e))
+    return redirect(url_for('main.device_validation', deviceid=deviceid, validationid=validationid))
+  except StaleDataError:
+    db.session.rollback()
+    flash('The validation was changed meanwhile, please try again')
+    return redirect(url_for('main.device_validation', deviceid=deviceid, validationid=validationid))
+  if not started:
     flash('Validation is currently running')
-  else:
-    validation.run(current_user)
-    db.session.commit()
   return redirect(url_for('main.device_validation', deviceid=deviceid, validationid=validationid))
 
 @bp.route('/device/<int:deviceid>/validation/<validationid>/comment/<sequence>', methods=['GET', 'POST'])
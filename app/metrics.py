@@ -0,0 +1,42 @@
+import redis
+
+from flask import current_app
+
+
+METRICS_KEY = 'framease:metrics'
+
+
+def incr(name, amount=1):
+  try:
+    current_app.redis.hincrby(METRICS_KEY, name, amount)
+  except redis.exceptions.RedisError:
+    pass
+
+
+def incr_many(amounts):
+  try:
+    with current_app.redis.pipeline() as pipe:
+      for name, amount in amounts.items():
+        pipe.hincrby(METRICS_KEY, name, amount)
+      pipe.execute()
+  except redis.exceptions.RedisError:
+    pass
+
+
+def get_counters():
+  try:
+    counters = current_app.redis.hgetall(METRICS_KEY)
+  except redis.exceptions.RedisError:
+    return dict()
+  return {
+    name.decode(): int(value)
+    for name, value in sorted(counters.items())
+  }
+
+
+def hit_rate(counters, prefix):
+  hits = counters.get(f'{prefix}.hit', 0)
+  misses = counters.get(f'{prefix}.miss', 0)
+  if not hits + misses:
+    return None
+  return hits / (hits + misses)
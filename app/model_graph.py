@@ -0,0 +1,161 @@
+import hashlib
+import io
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from flask import current_app
+
+from app import parse_cache
+from app.context import ExecutionContext, call_with_context
+
+
+def run_model(model, local_data, data):
+  '''Run one validation model over `data` and return the merged result.
+
+  `local_data` is the model's own configuration (DeviceValidationModel data).
+  Uploaded files it names are read once and, for models fed only by files,
+  served from the parse cache when the bytes have been parsed before.
+  '''
+  data = dict(data)
+  data.update(local_data)
+  data_updates = dict()
+  digests = dict()
+  for key, value in data.items():
+    if key.startswith('type:') and value == 'file':
+      req_name = key.split(':', 1)[-1]
+      if f'filedata:{req_name}' not in data:
+        fname = data[req_name]
+        with open(fname, 'rb') as f:
+          raw = f.read()
+        digests[req_name] = hashlib.sha256(raw).hexdigest()
+        data_updates[f'filedata:{req_name}'] = io.TextIOWrapper(io.BytesIO(raw)).readlines()
+  if data_updates:
+    data.update(data_updates)
+  if model is None:
+    return data
+  cache_key = None
+  if parse_cache.is_cacheable(model) and \
+      all(req_name in digests for req_type, req_name in model.requires()):
+    cache_key = parse_cache.make_key(model, {
+      req_name: digests[req_name] for req_type, req_name in model.requires()
+    })
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+      data.update(cached)
+      return data
+  outputs = dict(call_with_context(model, 'process', ExecutionContext(data)))
+  if cache_key is not None and all(outputs.values()):
+    parse_cache.put(cache_key, outputs)
+  data.update(outputs)
+  return data
+
+
+class ModelNode:
+  def __init__(self, sequence, model, local_data):
+    self.sequence = sequence
+    self.model = model
+    self.local_data = local_data
+    self.requires = set(tuple(req) for req in model.requires()) if model else set()
+    self.provides = set(tuple(prov) for prov in model.provides()) if model else set()
+    self.depends = list()
+
+  def __repr__(self):
+    name = self.model.model_name if self.model else None
+    return f'<ModelNode({self.sequence}, {name})>'
+
+  def satisfied_locally(self, req):
+    req_type, req_name = req
+    return self.local_data.get(req_name) is not None
+
+
+class ModelGraph:
+  '''Validation models of a device, linked by what they require and provide.
+
+  A model depends on every lower-sequence model that provides something it
+  requires and has not been configured locally. Data only flows from lower
+  to higher sequence numbers, as it did when models ran one after another,
+  so the graph cannot contain a cycle.
+  '''
+
+  def __init__(self, nodes):
+    self.nodes = sorted(
+      (node if isinstance(node, ModelNode) else ModelNode(*node) for node in nodes),
+      key=lambda node: node.sequence)
+    for i, node in enumerate(self.nodes):
+      node.depends = [
+        other for other in self.nodes[:i]
+        if any(req in other.provides for req in node.requires
+               if not node.satisfied_locally(req))
+      ]
+
+  def prune(self, requirements):
+    '''Keep only the models needed to provide `requirements`.'''
+    wanted = set(tuple(req) for req in requirements)
+    keep = set()
+    pending = [ node for node in self.nodes if node.provides & wanted ]
+    while pending:
+      node = pending.pop()
+      if id(node) in keep:
+        continue
+      keep.add(id(node))
+      pending.extend(node.depends)
+    graph = ModelGraph.__new__(ModelGraph)
+    graph.nodes = [ node for node in self.nodes if id(node) in keep ]
+    return graph
+
+  def ancestors(self, node):
+    seen = dict()
+    pending = list(node.depends)
+    while pending:
+      other = pending.pop()
+      if id(other) not in seen:
+        seen[id(other)] = other
+        pending.extend(other.depends)
+    return sorted(seen.values(), key=lambda other: other.sequence)
+
+  def _inputs(self, node, results, initial=None):
+    data = dict(initial or dict())
+    for other in self.ancestors(node):
+      data.update(results[id(other)])
+    return data
+
+  def _merge(self, results):
+    data = dict()
+    for node in self.nodes:
+      data.update(results[id(node)])
+    return data
+
+  def run(self, max_workers=1, initial=None):
+    '''Run every model once its dependencies are done.
+
+    `initial` is data every model starts from, such as the device itself.
+
+    Independent models run concurrently on up to `max_workers` threads.
+    The outputs are merged in sequence order, so the result does not depend
+    on which thread finishes first.
+    '''
+    results = dict()
+    if max_workers <= 1 or len(self.nodes) <= 1:
+      for node in self.nodes:
+        results[id(node)] = run_model(node.model, node.local_data, self._inputs(node, results, initial))
+      return self._merge(results)
+
+    app = current_app._get_current_object()
+
+    def run_in_app(node, data):
+      with app.app_context():
+        return run_model(node.model, node.local_data, data)
+
+    remaining = list(self.nodes)
+    running = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      while remaining or running:
+        for node in list(remaining):
+          if all(id(dep) in results for dep in node.depends):
+            remaining.remove(node)
+            future = executor.submit(run_in_app, node, self._inputs(node, results, initial))
+            running[future] = node
+        done, not_done = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+          node = running.pop(future)
+          results[id(node)] = future.result()
+    return self._merge(results)
@@ -11,17 +11,23 @@ import rq
 import pkgutil
 import importlib
 import traceback
+import uuid
 
 from datetime import datetime, timezone, timedelta
 from hashlib import md5
-from flask import current_app, url_for, jsonify
+from flask import current_app, url_for, jsonify, g, has_request_context
 from flask_login import UserMixin, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.sql import false
 from time import time
 from typing import List, Optional
 
-from app import db, login
+from app import db, events, leases, queues
+from app.context import ExecutionContext, call_with_context
+from app.executor import run_case
+from app.plans import get_plan
+from app.model_graph import ModelGraph, run_model
 
 from app import plugins as _plugins
 from app import validation_models as _validation_models
@@ -55,6 +61,37 @@ UserRole = sa.Table(
   sa.Column('role_id', sa.Integer, sa.ForeignKey('role.id'), primary_key=True)
 )
 
+# What each suite's cases require and what each device's validation models
+# provide, kept up to date by refresh_compatibility() so compatible suites
+# and devices are found with one query instead of loading every case.
+SuiteRequirement = sa.Table(
+  'suite_requirement',
+  db.metadata,
+  sa.Column('suite_id', sa.Integer, sa.ForeignKey('test_suite.id', ondelete='CASCADE'), primary_key=True),
+  sa.Column('req_type', sa.String(), primary_key=True),
+  sa.Column('req_name', sa.String(), primary_key=True),
+  sa.Index('ix_suite_requirement_req_type_req_name', 'req_type', 'req_name'),
+)
+
+DeviceCapability = sa.Table(
+  'device_capability',
+  db.metadata,
+  sa.Column('device_id', sa.Integer, sa.ForeignKey('device.id', ondelete='CASCADE'), primary_key=True),
+  sa.Column('req_type', sa.String(), primary_key=True),
+  sa.Column('req_name', sa.String(), primary_key=True),
+)
+
+
+def compatible(suite_id, device_id):
+  '''True where the device provides every requirement of the suite.'''
+  provided = sa.exists().where(
+    DeviceCapability.c.device_id == device_id,
+    DeviceCapability.c.req_type == SuiteRequirement.c.req_type,
+    DeviceCapability.c.req_name == SuiteRequirement.c.req_name).correlate_except(DeviceCapability)
+  return ~sa.exists().where(SuiteRequirement.c.suite_id == suite_id, ~provided) \
+    .correlate_except(SuiteRequirement)
+
+
 # SuiteCase = sa.Table(
 #   'suite_case',
 #   db.metadata,
@@ -91,10 +128,17 @@ class User(db.Model, UserMixin):
   roles: so.Mapped[List['Role']] = so.relationship(secondary=UserRole, back_populates='users')
 
   comments: so.Mapped['Comment'] = so.relationship(back_populates='author')
+  __table_args__ = (
+    sa.Index('ix_user_display_name_id', 'display_name', 'id'),
+  )
 
   def __repr__(self):
     return f'<User: {self.username}>'
 
+  @classmethod
+  def listing_order(cls):
+    return [ cls.display_name.desc(), cls.id.desc() ]
+
   def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
     self.page_size = self.page_size if self.page_size else current_app.config['DEFAULT_PAGE_SIZE']
@@ -122,8 +166,9 @@ class User(db.Model, UserMixin):
   def add_notification(self, name, data):
     db.session.execute(self.notifications.delete().where(
       Notification.name == name))
-    n = Notification(name=name, payload_json=json.dumps(data), user=self)
+    n = Notification(name=name, payload_json=json.dumps(data), user=self, timestamp=time())
     db.session.add(n)
+    events.publish_after_commit(db.session, self.id, name, data, n.timestamp)
     return n
 
   def launch_task(self, name, description, *args, **kwargs):
@@ -133,9 +178,22 @@ class User(db.Model, UserMixin):
     return task
 
   def get_tasks_in_progress(self):
-    query = self.tasks.select().where(Task.complete == False)
+    query = self.tasks.select().where(Task.complete == False, Task.parent_id == None)
     return db.session.scalars(query)
 
+  def get_tasks_progress(self):
+    '''Tasks in progress with their progress.
+
+    Cached for the rest of the request, since the layout renders it on
+    every page.
+    '''
+    cache = g.setdefault('tasks_progress', dict()) if has_request_context() else dict()
+    if self.id not in cache:
+      tasks = self.get_tasks_in_progress().all()
+      progress = Task.get_progress_many(tasks)
+      cache[self.id] = [ (task, progress[task.id]) for task in tasks if progress[task.id] < 100 ]
+    return cache[self.id]
+
   def get_task_in_progress(self, name):
     query = self.tasks.select().where(Task.name == name, Task.complete == False)
     return db.session.scalar(query)
@@ -188,11 +246,6 @@ class User(db.Model, UserMixin):
       self.roles.remove(role)
 
 
-@login.user_loader
-def load_user(id):
-  return db.session.get(User, int(id))
-
-
 class Notification(db.Model):
   id: so.Mapped[int] = so.mapped_column(primary_key=True)
   name: so.Mapped[str] = so.mapped_column(sa.String(128), index=True)
@@ -206,6 +259,26 @@ class Notification(db.Model):
     return json.loads(str(self.payload_json))
 
 
+FLEET_TASK_NAME = 'run_fleet_validation'
+
+
+def validation_retry():
+  '''RQ retries a validation job that timed out or whose worker died; the
+  retry resumes from the run's checkpoint.'''
+  attempts = current_app.config['VALIDATION_MAX_ATTEMPTS']
+  return rq.Retry(max=attempts - 1) if attempts > 1 else None
+
+def validation_on_failure():
+  '''RQ calls this when a validation job raises or its worker abandons it;
+  on the last attempt it closes the task, see recovery.give_up().'''
+  return rq.Callback('app.tasks.validation_failed')
+
+TASK_ENDED_STATUSES = {
+  rq.job.JobStatus.FINISHED, rq.job.JobStatus.FAILED,
+  rq.job.JobStatus.STOPPED, rq.job.JobStatus.CANCELED,
+}
+
+
 class Task(db.Model):
   id: so.Mapped[str] = so.mapped_column(sa.String(36), primary_key=True)
   name: so.Mapped[str] = so.mapped_column(sa.String(128), index=True)
@@ -213,6 +286,12 @@ class Task(db.Model):
   user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
   obj_id: so.Mapped[int] = so.mapped_column(sa.Integer)
   complete: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
+  parent_id: so.Mapped[Optional[str]] = so.mapped_column(sa.ForeignKey('task.id'), index=True)
+  timestamp: so.Mapped[Optional[float]] = so.mapped_column(index=True, default=time)
+  # queues.INTERACTIVE for what a user started, which counts against
+  # USER_MAX_ACTIVE_TASKS; queues.BULK for scheduled runs and fleet children.
+  kind: so.Mapped[str] = so.mapped_column(sa.String(16), default=queues.INTERACTIVE,
+    server_default=queues.INTERACTIVE)
 
   user: so.Mapped[User] = so.relationship(back_populates='tasks')
 
@@ -224,8 +303,57 @@ class Task(db.Model):
     return rq_job
 
   def get_progress(self):
-    job = self.get_rq_job()
-    return job.meta.get('progress', 0) if job is not None else 100
+    return Task.get_progress_many([self])[self.id]
+
+  @staticmethod
+  def get_progress_many(tasks):
+    '''Progress of several tasks as {task_id: progress}.
+
+    Progress is read with one MGET and the RQ jobs with one pipelined
+    fetch. Tasks whose job has ended, or expired, without the worker
+    marking them complete are marked complete with a single UPDATE;
+    fleet children are left to recovery.release_lost(), which also frees
+    their place in the group.
+    '''
+    pending = [ task for task in tasks if not task.complete ]
+    progress = events.get_progress([ task.id for task in pending ])
+    jobs = [ task for task in pending if task.name != FLEET_TASK_NAME ]
+    try:
+      fetched = rq.job.Job.fetch_many([ task.id for task in jobs ], connection=current_app.redis)
+    except redis.exceptions.RedisError:
+      fetched = [ False ] * len(jobs)
+    ended = set(
+      task.id for task, job in zip(jobs, fetched)
+      if job is None or (job and job.get_status(refresh=False) in TASK_ENDED_STATUSES)
+    )
+    result = {
+      task.id: 100 if task.complete or task.id in ended else progress.get(task.id, 0)
+      for task in tasks
+    }
+    abandoned = [ task.id for task in jobs if task.id in ended and task.parent_id is None ]
+    if abandoned:
+      db.session.execute(sa.update(Task).where(Task.id.in_(abandoned)).values(complete=True))
+      db.session.commit()
+    return result
+
+  def get_group_progress(self):
+    total, done = db.session.execute(
+      sa.select(sa.func.count(Task.id), sa.func.count(Task.id).filter(Task.complete == True))
+      .where(Task.parent_id == self.id)).one()
+    elapsed = max(time() - (self.timestamp or time()), 1e-6)
+    throughput = done / elapsed * 60
+    remaining = total - done
+    return {
+      'id': self.id,
+      'description': self.description,
+      'total': total,
+      'complete': done,
+      'remaining': remaining,
+      'progress': int(done * 100 / total) if total else 100,
+      'throughput': throughput,
+      'eta': remaining / throughput * 60 if throughput else None,
+      'finished': self.complete,
+    }
 
 
 class Device(db.Model):
@@ -235,13 +363,21 @@ class Device(db.Model):
   ssh_port: so.Mapped[int] = so.mapped_column(sa.Integer())
   https_port: so.Mapped[int] = so.mapped_column(sa.Integer())
   archived: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
+  config_digest: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
 
   validations: so.WriteOnlyMapped['DeviceValidation'] = so.relationship(back_populates='device')
   validation_models: so.Mapped[List['DeviceValidationModel']] = so.relationship(back_populates='device')
+  __table_args__ = (
+    sa.Index('ix_device_devicename_id', 'devicename', 'id'),
+  )
 
   def __repr__(self):
     return f'<Device {self.devicename}>'
 
+  @classmethod
+  def listing_order(cls):
+    return [ cls.devicename.desc(), cls.id.desc() ]
+
   def __str__(self):
     return str(self.devicename)
 
@@ -256,27 +392,45 @@ class Device(db.Model):
     return [ str(f) for f in self.files_path.glob('*') if f.is_file() ] 
 
 
-  def get_compatible_suites(self):
-    provs = set()
-    compat = list()
+  @property
+  def provides(self):
+    '''What the device's validation models provide, plus the device itself.'''
+    provs = set([ ('device', 'device') ])
     for dvm in self.validation_models:
-      for prov in dvm.provides:
-        provs.add(prov)
-    suites = TestSuite.query.all()
-    for suite in suites:
-      if all(req in provs for req in suite.requirements):
-        compat.append(suite)
-    return compat
-
-  def get_model_data(self):
-    data = dict()
-    for dvm in sorted(self.validation_models, key=lambda dvm: dvm.sequence):
-      dvm.reqs = dvm.requirements
-      json_data = dvm.process(json.dumps(data))
-      for req_name, req_data in json.loads(json_data).items():
-        data[req_name] = req_data
+      for prov in dvm.provides or []:
+        provs.add(tuple(prov))
+    return provs
+
+  def to_model_data(self):
+    return {
+      'id': self.id,
+      'devicename': self.devicename,
+      'hostname': self.hostname,
+      'ssh_port': self.ssh_port,
+      'https_port': self.https_port,
+    }
+
+  def to_dict(self):
+    data = self.to_model_data()
+    data['archived'] = self.archived
     return data
 
+  def get_compatible_suites(self):
+    query = sa.select(TestSuite).where(compatible(TestSuite.id, self.id)).order_by(TestSuite.id)
+    return db.session.scalars(query).all()
+
+  def get_model_data(self, requirements=None):
+    graph = ModelGraph([
+      (dvm.sequence, validation_models.get(dvm.validation_model), dvm.get_data())
+      for dvm in self.validation_models
+    ])
+    if requirements is not None:
+      graph = graph.prune(requirements)
+    data = graph.run(max_workers=current_app.config['MODEL_GRAPH_WORKERS'],
+      initial={'device': self.to_model_data()})
+    data['device'] = self.to_model_data()
+    return ExecutionContext.from_model_data(data)
+
 
 class DeviceValidationModel(db.Model):
   id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -297,8 +451,8 @@ class DeviceValidationModel(db.Model):
     except:
       self.initialize_data()
       data = json.loads(self.validation_model_data)
-    for req_type, req_name in self.requirements:
-      if data[req_name] is None:
+    for req_type, req_name in self.configurable_requirements:
+      if data.get(req_name) is None:
         return False
     return True
 
@@ -313,6 +467,12 @@ class DeviceValidationModel(db.Model):
       return validation_models[self.validation_model].requires()
     None
 
+  @property
+  def configurable_requirements(self):
+    '''Requirements configured on the model; the device is always provided.'''
+    return [ (req_type, req_name) for req_type, req_name in self.requirements or []
+             if req_type != 'device' ]
+
   @property
   def provides(self):
     if self.validation_model in validation_models:
@@ -321,6 +481,8 @@ class DeviceValidationModel(db.Model):
 
   def show_requirement(self, req_name):
     data = self.get_data()
+    if data.get(req_name) is not None and data.get(f'type:{req_name}') == 'secret':
+      return '********'
     if req_name in data:
       return data[req_name]
     return '<not configured>'
@@ -328,7 +490,7 @@ class DeviceValidationModel(db.Model):
   def initialize_data(self):
     data = dict()
     try:
-      for req_type, req_name in self.requirements:
+      for req_type, req_name in self.configurable_requirements:
         data[req_name] = None
         data[f'type:{req_name}'] = req_type
     finally:
@@ -352,24 +514,42 @@ class DeviceValidationModel(db.Model):
     return data
 
   def process(self, data):
-    data = json.loads(data)
-    local_data = self.get_data()
-    data.update(local_data)
-    data_updates = dict()
-    for key, value in data.items():
-      if key.startswith('type:') and value == 'file':
-        req_name = key.split(':', 1)[-1]
-        req_name = key.split(':', 1)[-1]
-        if f'filedata:{req_name}' not in data:
-          fname = data[req_name]
-          with open(fname, 'r') as f:
-            data_updates[f'filedata:{req_name}'] = f.readlines()
-    if data_updates:
-      data.update(data_updates)
-    if self.validation_model in validation_models:
-      for req_name, req_data in validation_models[self.validation_model].process(json.dumps(data)):
-        data[req_name] = req_data
-    return json.dumps(data)
+    if isinstance(data, str):
+      data = json.loads(data)
+    return run_model(validation_models.get(self.validation_model), self.get_data(), data)
+
+
+class ConfigTerm(db.Model):
+  '''One distinct setting, `key` = `value` under `path`, seen in at least
+  one device configuration. ConfigPosting lists the devices that have it.'''
+  id: so.Mapped[int] = so.mapped_column(primary_key=True)
+  path: so.Mapped[str] = so.mapped_column(sa.String())
+  key: so.Mapped[str] = so.mapped_column(sa.String())
+  value: so.Mapped[str] = so.mapped_column(sa.String())
+  __table_args__ = (
+    sa.UniqueConstraint('path', 'key', 'value', name='_path_key_value_uc'),
+    sa.Index('ix_config_term_key_value', 'key', 'value'),
+    sa.Index('ix_config_term_value', 'value'),
+  )
+
+  def __repr__(self):
+    return f'<ConfigTerm({self.id}, {self.path}, {self.key}, {self.value})>'
+
+  def to_dict(self):
+    return {
+      'path': self.path,
+      'key': self.key,
+      'value': self.value,
+    }
+
+
+ConfigPosting = sa.Table(
+  'config_posting',
+  db.metadata,
+  sa.Column('term_id', sa.Integer, sa.ForeignKey('config_term.id', ondelete='CASCADE'), primary_key=True),
+  sa.Column('device_id', sa.Integer, sa.ForeignKey('device.id', ondelete='CASCADE'), primary_key=True),
+  sa.Index('ix_config_posting_device_id', 'device_id'),
+)
 
 
 class TestSuite(db.Model):
@@ -380,6 +560,7 @@ class TestSuite(db.Model):
   final: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   __table_args__ = (
     db.UniqueConstraint('name', 'version', name='_name_version_uc'),
+    sa.Index('ix_test_suite_name_id', 'name', 'id'),
   )
 
   validations: so.WriteOnlyMapped['DeviceValidation'] = so.relationship(back_populates='suite', passive_deletes=True)
@@ -388,6 +569,10 @@ class TestSuite(db.Model):
   def __repr__(self):
     return f'<TestSuite({self.id}, {self.name}, {self.version})>'
 
+  @classmethod
+  def listing_order(cls):
+    return [ cls.name.desc(), cls.id.desc() ]
+
   def __str__(self):
     return f'{self.name} ({self.version})'
 
@@ -412,13 +597,20 @@ class TestSuite(db.Model):
   def add_case(self, caseid, sequence):
     self.cases.append(SuiteCase(self.id, caseid, sequence))
 
+  def del_case(self, suitecaseid):
+    self._import_delete({ 'suitecase': int(suitecaseid) })
+
   @property
   def requirements(self):
-    reqs = set()
-    for suitecase in self.cases:
-      for req in suitecase.case.requirements:
-        reqs.add(req)
-    return list(reqs)
+    query = sa.select(SuiteRequirement.c.req_type, SuiteRequirement.c.req_name) \
+      .where(SuiteRequirement.c.suite_id == self.id)
+    return [ tuple(req) for req in db.session.execute(query) ]
+
+  def get_compatible_devices(self, device_ids=None):
+    query = sa.select(Device).where(compatible(self.id, Device.id)).order_by(Device.id)
+    if device_ids is not None:
+      query = query.where(Device.id.in_(device_ids))
+    return db.session.scalars(query).all()
 
   def get_cases_in_order(self):
     return sorted(self.cases, key=lambda c: c.sequence)
@@ -592,10 +784,14 @@ class DeviceValidation(db.Model):
   approved: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   final: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   running: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
+  version: so.Mapped[int] = so.mapped_column(sa.Integer, server_default='1')
 
   comments: so.Mapped[List['Comment']] = so.relationship(back_populates='device_validation')
   device: so.Mapped['Device'] = so.relationship(back_populates='validations')
   suite: so.Mapped['TestSuite'] = so.relationship(back_populates='validations')
+  runs: so.WriteOnlyMapped['ValidationRun'] = so.relationship(back_populates='validation', passive_deletes=True)
+
+  __mapper_args__ = {'version_id_col': version}
 
   @staticmethod
   def get_by_id(id):
@@ -619,12 +815,13 @@ class DeviceValidation(db.Model):
       else:
         break
     seq = int(seq)
-    return Comment.query.where(Comment.sequence == seq).all()
-    
-  def sequence_status(self, sequence):
-    data = self.get_data()
+    return Comment.query.where(Comment.validation_id == self.id, Comment.sequence == seq) \
+      .order_by(Comment.id).all()
+
+  @staticmethod
+  def status_from(comments, results):
+    '''Badges of one suite case from its comments and check results.'''
     status = dict()
-    comments = self.sequence_comments(sequence)
     for comment in comments:
       if comment.deleted:
         continue
@@ -632,16 +829,12 @@ class DeviceValidation(db.Model):
         status['Manual Reject'] = False
       elif comment.is_override:
         status['Manual Override'] = True
-    if 'results' in data:
-      data = data['results']
-      sequence = str(sequence)
-      if sequence in data:
-        if isinstance(data[sequence], dict):
-          status.update(data[sequence])
+    status.update(results or dict())
     return status
 
-  def row_status(self, sequence):
-    comments = self.sequence_comments(sequence)
+  @staticmethod
+  def row_status_from(comments, results):
+    '''Overall status of one suite case from its comments and check results.'''
     comment_status = ''
     for comment in comments:
       if comment.deleted:
@@ -652,19 +845,9 @@ class DeviceValidation(db.Model):
         comment_status = 'success'
     if comment_status:
       return comment_status
-    data = self.get_data()
-    if 'results' not in data:
+    if results is None:
       return 'no data'
-    results = data['results']
-    if sequence in results:
-      statuses = results[sequence]
-    elif str(sequence) in results:
-      statuses = results[str(sequence)]
-    else:
-      return 'no data'
-    if not isinstance(statuses, dict):
-      return 'no data'
-    statuses = [ v for v in statuses.values() ]
+    statuses = [ v for v in results.values() ]
     if all(statuses):
       return 'success'
     if not any(statuses):
@@ -672,6 +855,41 @@ class DeviceValidation(db.Model):
     else:
       return 'incomplete'
 
+  def latest_run(self):
+    query = self.runs.select().where(ValidationRun.status == 'complete') \
+      .order_by(ValidationRun.id.desc()).limit(1)
+    return db.session.scalar(query)
+
+  def get_results(self):
+    '''Results of the latest complete run as {sequence: {check: status}}.'''
+    run = self.latest_run()
+    return run.get_results() if run is not None else dict()
+
+  def interrupted_run(self):
+    '''The run a worker left unfinished, which the next run resumes.'''
+    query = self.runs.select().where(ValidationRun.status == 'running') \
+      .order_by(ValidationRun.id.desc()).limit(1)
+    return db.session.scalar(query)
+
+  def sequence_results(self, sequence):
+    run = self.latest_run()
+    if run is None:
+      return None
+    query = sa.select(ValidationResult.check, ValidationResult.status).where(
+      ValidationResult.validation_id == self.id,
+      ValidationResult.run_id == run.id,
+      ValidationResult.sequence == int(sequence)).order_by(ValidationResult.id)
+    rows = db.session.execute(query).all()
+    if not rows:
+      return None
+    return { check: status for check, status in rows if check != NO_CHECKS }
+
+  def sequence_status(self, sequence):
+    return self.status_from(self.sequence_comments(sequence), self.sequence_results(sequence))
+
+  def row_status(self, sequence):
+    return self.row_status_from(self.sequence_comments(sequence), self.sequence_results(sequence))
+
   @property
   def has_secrets(self):
     for key, val in self.device.get_model_data():
@@ -679,12 +897,121 @@ class DeviceValidation(db.Model):
         return True
     return False
 
-  def run(self, user):
-    rq_job = current_app.task_queue.enqueue(f'app.tasks.run_validation', user.id, self.id)
-    task = Task(id=rq_job.get_id(), name='run_validation', user=user, obj_id=self.id)
+  def run(self, user, kind=queues.INTERACTIVE):
+    '''Start a run, or join the one already in flight.
+
+    The job id is claimed as the validation's lease before enqueueing, so
+    of two concurrent requests only one enqueues. Returns (task, started);
+    raises QueueLimitError if the user or device has too many runs already,
+    and StaleDataError if the validation was updated since it was read.
+    Only interactive runs count against the user's limit.
+    '''
+    holder = leases.holder(self.id)
+    if holder is not None:
+      return db.session.get(Task, holder), False
+    queues.check_limits(user if kind == queues.INTERACTIVE else None, self.device, validation=self)
+    job_id = str(uuid.uuid4())
+    owner = leases.claim(self.id, job_id, current_app.config['VALIDATION_LEASE_QUEUED_TTL'])
+    if owner != job_id:
+      return db.session.get(Task, owner), False
+    task = Task(id=job_id, name='run_validation', user=user, obj_id=self.id, kind=kind)
     self.running = True
     db.session.add(task)
-    db.session.commit()
+    try:
+      db.session.commit()
+    except StaleDataError:
+      # Changed since it was read; nothing is queued yet.
+      db.session.rollback()
+      leases.release(self.id, job_id)
+      raise
+    try:
+      queues.get_queue(kind).enqueue(f'app.tasks.run_validation', user.id, self.id,
+        job_id=job_id, retry=validation_retry(), on_failure=validation_on_failure())
+    except redis.exceptions.RedisError:
+      db.session.delete(task)
+      self.running = False
+      db.session.commit()
+      raise
+    return task, True
+
+
+# Check name of the row recording a case that returned no checks at all;
+# such a case counts as a success, like an empty dict of checks always did.
+NO_CHECKS = ''
+
+
+class ValidationRun(db.Model):
+  id: so.Mapped[int] = so.mapped_column(primary_key=True)
+  validation_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(DeviceValidation.id, ondelete='CASCADE'), index=True)
+  status: so.Mapped[str] = so.mapped_column(sa.String(16), default='running')
+  started: so.Mapped[float] = so.mapped_column(index=True, default=time)
+  finished: so.Mapped[Optional[float]] = so.mapped_column()
+  checkpoint: so.Mapped[Optional[float]] = so.mapped_column()
+  fingerprints: so.Mapped[Optional[str]] = so.mapped_column(sa.Text())
+  attempts: so.Mapped[int] = so.mapped_column(sa.Integer, default=0, server_default='0')
+  inputs: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
+
+  validation: so.Mapped[DeviceValidation] = so.relationship(back_populates='runs')
+  results: so.WriteOnlyMapped['ValidationResult'] = so.relationship(back_populates='run', passive_deletes=True)
+
+  def __repr__(self):
+    return f'<ValidationRun({self.id}, {self.validation_id}, {self.status})>'
+
+  @property
+  def duration(self):
+    if self.finished is None:
+      return None
+    return self.finished - self.started
+
+  def add_results(self, results):
+    '''Bulk insert {sequence: {check: status}} as ValidationResult rows.
+
+    Results that are not a dict of checks (a plugin that failed outright)
+    get no rows and show as "no data". An empty dict gets one NO_CHECKS row.
+    '''
+    rows = [
+      dict(validation_id=self.validation_id, run_id=self.id, sequence=int(sequence),
+        check=str(check), status=bool(status))
+      for sequence, checks in results.items() if isinstance(checks, dict)
+      for check, status in (checks.items() if checks else [ (NO_CHECKS, True) ])
+    ]
+    if rows:
+      db.session.execute(sa.insert(ValidationResult), rows)
+
+  def get_fingerprints(self):
+    '''{sequence: fingerprint entry} of the results, written with them.'''
+    try:
+      return json.loads(self.fingerprints or '{}')
+    except ValueError:
+      return dict()
+
+  def get_results(self):
+    query = sa.select(ValidationResult.sequence, ValidationResult.check, ValidationResult.status) \
+      .where(ValidationResult.validation_id == self.validation_id, ValidationResult.run_id == self.id) \
+      .order_by(ValidationResult.id)
+    results = dict()
+    for sequence, check, status in db.session.execute(query):
+      checks = results.setdefault(str(sequence), dict())
+      if check != NO_CHECKS:
+        checks[check] = status
+    return results
+
+
+class ValidationResult(db.Model):
+  id: so.Mapped[int] = so.mapped_column(primary_key=True)
+  validation_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(DeviceValidation.id, ondelete='CASCADE'))
+  run_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(ValidationRun.id, ondelete='CASCADE'))
+  sequence: so.Mapped[int] = so.mapped_column(sa.Integer())
+  check: so.Mapped[str] = so.mapped_column(sa.Text())
+  status: so.Mapped[bool] = so.mapped_column(sa.Boolean)
+  __table_args__ = (
+    sa.Index('ix_validation_result_validation_run_sequence', 'validation_id', 'run_id', 'sequence'),
+  )
+
+  run: so.Mapped[ValidationRun] = so.relationship(back_populates='results')
+
+  def __repr__(self):
+    return f'<ValidationResult({self.run_id}, {self.sequence}, {self.check}, {self.status})>'
 
 
 class TestCase(db.Model):
@@ -698,6 +1025,8 @@ class TestCase(db.Model):
   archived: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   __table_args__ = (
     db.UniqueConstraint('name', 'version', name='_name_version_uc'),
+    sa.Index('ix_test_case_archived_name_version_id', 'archived', 'name',
+      sa.func.coalesce(sa.column('version'), ''), 'id'),
   )
 
   suites: so.Mapped[List['SuiteCase']] = so.relationship('SuiteCase', primaryjoin='TestCase.id == SuiteCase.case_id')
@@ -707,6 +1036,11 @@ class TestCase(db.Model):
   def __repr__(self):
     return f'<TestCase({self.id}, {self.function}, {self.data})>'
 
+  @classmethod
+  def listing_order(cls):
+    # version may be NULL, which a keyset cannot seek past.
+    return [ cls.archived.asc(), cls.name.asc(), sa.func.coalesce(cls.version, '').asc(), cls.id.asc() ]
+
   @classmethod
   def get_by_id(cls, id):
     return TestCase.query.where(TestCase.id == id).first()
@@ -726,7 +1060,7 @@ class TestCase(db.Model):
       'description': self.description,
       'function': self.function,
       'data': self.data,
-      'approver_role': self.approver_role.name,
+      'approver_role': self.approver_role.name if self.approver_role else None,
       'archived': self.archived
     }
 
@@ -764,11 +1098,17 @@ class TestCase(db.Model):
     None
 
   def get_data(self):
-    try:
-      data = json.loads(self.data)
-    except:
-      data = dict()
-    return data
+    # The parsed data is kept until self.data changes; callers get a shallow
+    # copy they are free to extend.
+    cached = getattr(self, '_parsed_data', None)
+    if cached is None or cached[0] != self.data:
+      try:
+        data = json.loads(self.data)
+      except:
+        data = dict()
+      cached = (self.data, data)
+      self._parsed_data = cached
+    return dict(cached[1])
 
   def __str__(self):
     data = self.get_data()
@@ -776,31 +1116,25 @@ class TestCase(db.Model):
       return data['description']
     return f'{self.name} ({self.version})'
 
-  def run(self, data):
-    data = json.loads(data)
-    data['parameters'] = self.get_data()
-    data_updates = dict()
-    for key, value in data.items():
-      if key.startswith('type:') and value == 'file':
-        req_name = key.split(':', 1)[-1]
-        if f'filedata:{req_name}' not in data:
-          fname = data[req_name]
-          with open(fname, 'r') as f:
-            data_updates[f'filedata:{req_name}'] = f.readlines()
-    if data_updates:
-      data.update(data_updates)
+  def get_parameters(self, data):
+    parameters = self.get_data()
     data_updates = dict()
-    for key, value in data['parameters'].items():
+    for key, value in parameters.items():
       if key.startswith('type:') and value == 'file':
         req_name = key.split(':', 1)[-1]
-        if f'filedata:{req_name}' not in data['parameters']:
+        if f'filedata:{req_name}' not in parameters:
           fname = data[req_name]
           with open(fname, 'r') as f:
             data_updates[f'filedata:{req_name}'] = f.readlines()
     if data_updates:
-      data['parameters'].update(data_updates)
-    if self.function in plugins:
-      return plugins[self.function].check(json.dumps(data))
+      parameters.update(data_updates)
+    return parameters
+
+  def run(self, data):
+    if isinstance(data, str):
+      data = ExecutionContext.from_model_data(json.loads(data))
+    parameters = self.get_parameters(data)
+    return run_case(self.function, parameters, data, get_plan(self, parameters))
 
 class Comment(db.Model):
   id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -813,6 +1147,9 @@ class Comment(db.Model):
   deleted: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   is_override: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
   force_failure: so.Mapped[bool] = so.mapped_column(sa.Boolean, server_default=sa.false())
+  __table_args__ = (
+    sa.Index('ix_comment_validation_id_sequence', 'validation_id', 'sequence'),
+  )
 
   device_validation: so.Mapped[DeviceValidation] = so.relationship(back_populates='comments')
   author: so.Mapped[User] = so.relationship(back_populates='comments')
@@ -855,4 +1192,89 @@ class SuiteCase(db.Model):
     return SuiteCase.query.where(SuiteCase.id == id).first()
 
 
+def refresh_suite_requirements(connection, suite_ids):
+  '''Recompute the requirements of the suites from their cases' plugins.'''
+  suite_ids = list(suite_ids)
+  if not suite_ids:
+    return
+  rows = set()
+  query = sa.select(SuiteCase.suite_id, TestCase.function) \
+    .join(TestCase, TestCase.id == SuiteCase.case_id).where(SuiteCase.suite_id.in_(suite_ids))
+  for suite_id, function in connection.execute(query):
+    if function in plugins:
+      for req_type, req_name in plugins[function].requires() or []:
+        rows.add((suite_id, req_type, req_name))
+  connection.execute(SuiteRequirement.delete().where(SuiteRequirement.c.suite_id.in_(suite_ids)))
+  if rows:
+    connection.execute(SuiteRequirement.insert(), [
+      { 'suite_id': suite_id, 'req_type': req_type, 'req_name': req_name }
+      for suite_id, req_type, req_name in rows
+    ])
+
+
+def refresh_device_capabilities(connection, device_ids):
+  '''Recompute what the devices provide: themselves, plus whatever their
+  validation models provide.'''
+  device_ids = list(device_ids)
+  if not device_ids:
+    return
+  rows = set((device_id, 'device', 'device') for device_id in device_ids)
+  query = sa.select(DeviceValidationModel.device_id, DeviceValidationModel.validation_model) \
+    .where(DeviceValidationModel.device_id.in_(device_ids))
+  for device_id, validation_model in connection.execute(query):
+    if validation_model in validation_models:
+      for req_type, req_name in validation_models[validation_model].provides() or []:
+        rows.add((device_id, req_type, req_name))
+  connection.execute(DeviceCapability.delete().where(DeviceCapability.c.device_id.in_(device_ids)))
+  connection.execute(DeviceCapability.insert(), [
+    { 'device_id': device_id, 'req_type': req_type, 'req_name': req_name }
+    for device_id, req_type, req_name in rows
+  ])
+
+
+def refresh_compatibility(connection):
+  '''Rebuild both indexes, e.g. after plugins or validation models changed.'''
+  refresh_suite_requirements(connection, connection.scalars(sa.select(TestSuite.id)).all())
+  refresh_device_capabilities(connection, connection.scalars(sa.select(Device.id)).all())
+
+
+def _changed(obj, *keys):
+  return any(sa.inspect(obj).attrs[key].history.has_changes() for key in keys)
+
+
+def _ids(obj, key):
+  '''Current and previous values of a foreign key of a flushed object.'''
+  history = sa.inspect(obj).attrs[key].history
+  return set(value for value in history.sum() if value is not None) or { getattr(obj, key) }
+
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def _index_compatibility(session, flush_context):
+  '''Keep SuiteRequirement and DeviceCapability in step with the cases of
+  suites and the validation models of devices, in the same transaction.'''
+  suite_ids, case_ids, device_ids = set(), set(), set()
+  for obj in session.new | session.deleted:
+    if isinstance(obj, SuiteCase):
+      suite_ids |= _ids(obj, 'suite_id')
+    elif isinstance(obj, DeviceValidationModel):
+      device_ids |= _ids(obj, 'device_id')
+    elif isinstance(obj, Device) and obj in session.new:
+      device_ids.add(obj.id)
+  for obj in session.dirty:
+    if isinstance(obj, SuiteCase) and _changed(obj, 'suite_id', 'case_id'):
+      suite_ids |= _ids(obj, 'suite_id')
+    elif isinstance(obj, TestCase) and _changed(obj, 'function'):
+      case_ids.add(obj.id)
+    elif isinstance(obj, DeviceValidationModel) and _changed(obj, 'device_id', 'validation_model'):
+      device_ids |= _ids(obj, 'device_id')
+  if not (suite_ids or case_ids or device_ids):
+    return
+  connection = session.connection()
+  if case_ids:
+    suite_ids |= set(connection.scalars(
+      sa.select(SuiteCase.suite_id).where(SuiteCase.case_id.in_(case_ids))))
+  refresh_suite_requirements(connection, suite_ids - { None })
+  refresh_device_capabilities(connection, device_ids - { None })
+
+
   
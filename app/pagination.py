@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+
+import sqlalchemy as sa
+
+from flask import url_for
+from sqlalchemy.sql import operators
+
+from app import db
+
+
+class Page:
+  '''One page of a keyset-paginated listing.
+
+  Iterates over its items like the pagination object of db.paginate.
+  next_cursor and prev_cursor are opaque strings to pass back as the
+  `cursor` argument, or None at either end of the listing.
+  '''
+
+  def __init__(self, items, next_cursor, prev_cursor, per_page):
+    self.items = items
+    self.next_cursor = next_cursor
+    self.prev_cursor = prev_cursor
+    self.per_page = per_page
+
+  def __iter__(self):
+    return iter(self.items)
+
+  def __len__(self):
+    return len(self.items)
+
+  @property
+  def has_next(self):
+    return self.next_cursor is not None
+
+  @property
+  def has_prev(self):
+    return self.prev_cursor is not None
+
+  def next_url(self, endpoint, **kwargs):
+    return url_for(endpoint, cursor=self.next_cursor, **kwargs) if self.has_next else None
+
+  def prev_url(self, endpoint, **kwargs):
+    return url_for(endpoint, cursor=self.prev_cursor, **kwargs) if self.has_prev else None
+
+
+def encode_cursor(direction, values):
+  raw = json.dumps([ direction, values ], separators=(',', ':'))
+  return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+  '''(direction, values) of a cursor, or None if it is not one of ours.'''
+  try:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    direction, values = json.loads(raw)
+  except (ValueError, TypeError, binascii.Error):
+    return None
+  if direction not in ('next', 'prev') or not isinstance(values, list):
+    return None
+  return direction, values
+
+
+def _key(clause):
+  '''(expression, descending) of an ORDER BY clause.'''
+  modifier = getattr(clause, 'modifier', None)
+  if modifier is operators.desc_op:
+    return clause.element, True
+  if modifier is operators.asc_op:
+    return clause.element, False
+  return clause, False
+
+
+def _beyond(keys, values):
+  '''Rows that come after `values` in the order of `keys`.
+
+  Written as c1 >= v1 AND (c1 > v1 OR (c2 >= v2 AND ...)) rather than one
+  row-value comparison, so it works for mixed directions while the
+  leading term still lets the database seek in the index.
+  '''
+  condition = None
+  for (expr, descending), value in reversed(list(zip(keys, values))):
+    value = sa.literal(value, expr.type)
+    after = expr < value if descending else expr > value
+    if condition is None:
+      condition = after
+    else:
+      start = expr <= value if descending else expr >= value
+      condition = sa.and_(start, sa.or_(after, condition))
+  return condition
+
+
+def paginate(query, order, cursor=None, per_page=20):
+  '''One page of `query` in `order`, starting from `cursor`.
+
+  `order` is a list of ORDER BY clauses over columns that are not NULL,
+  the last one unique, e.g. [Device.devicename.desc(), Device.id.desc()],
+  backed by an index in the same order. Each page is found by seeking past
+  the key of the last row seen instead of with OFFSET, so it costs the
+  same however deep it is. An unknown or malformed cursor gives the first
+  page.
+  '''
+  base = query
+  keys = [ _key(clause) for clause in order ]
+  direction, values = (cursor and decode_cursor(cursor)) or ('next', None)
+  if values is not None and len(values) != len(keys):
+    direction, values = 'next', None
+  backwards = direction == 'prev'
+  walk = [ (expr, descending != backwards) for expr, descending in keys ]
+  query = query.add_columns(*[ expr for expr, descending in keys ])
+  if values is not None:
+    query = query.where(_beyond(walk, values))
+  query = query.order_by(*[ expr.desc() if descending else expr.asc() for expr, descending in walk ])
+  rows = db.session.execute(query.limit(per_page + 1)).all()
+  more = len(rows) > per_page
+  if backwards and not more:
+    # Back at the start: show a full first page rather than the remainder.
+    return paginate(base, order, None, per_page)
+  rows = rows[:per_page]
+  if backwards:
+    rows.reverse()
+  has_next = values is not None if backwards else more
+  has_prev = more if backwards else values is not None
+  next_cursor = prev_cursor = None
+  if rows and has_next:
+    next_cursor = encode_cursor('next', list(rows[-1][1:]))
+  if rows and has_prev:
+    prev_cursor = encode_cursor('prev', list(rows[0][1:]))
+  return Page([ row[0] for row in rows ], next_cursor, prev_cursor, per_page)
+
+
+def collection_dict(page, endpoint, **kwargs):
+  '''API representation of a page: its items plus links to its neighbours.'''
+  return {
+    'items': [ item.to_dict() for item in page ],
+    '_meta': {
+      'per_page': page.per_page,
+      'next_cursor': page.next_cursor,
+      'prev_cursor': page.prev_cursor,
+    },
+    '_links': {
+      'next': page.next_url(endpoint, per_page=page.per_page, **kwargs),
+      'prev': page.prev_url(endpoint, per_page=page.per_page, **kwargs),
+    },
+  }
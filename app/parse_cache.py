@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from flask import current_app
+
+from app import metrics
+
+
+def cache_path():
+  path = current_app.config['PARSE_CACHE_PATH']
+  path.mkdir(parents=True, exist_ok=True)
+  return path
+
+
+def is_cacheable(model):
+  '''Only models whose every input is an uploaded file can be cached.'''
+  reqs = model.requires()
+  return bool(reqs) and all(req_type == 'file' for req_type, req_name in reqs)
+
+
+def make_key(model, digests):
+  '''`digests` maps requirement name to the SHA-256 of that file's bytes.'''
+  h = hashlib.sha256()
+  h.update(model.model_name.encode())
+  h.update(b'\0')
+  h.update(str(getattr(model, 'model_version', '')).encode())
+  for req_name in sorted(digests):
+    h.update(b'\0')
+    h.update(req_name.encode())
+    h.update(b'\0')
+    h.update(digests[req_name].encode())
+  return h.hexdigest()
+
+
+def get(key):
+  fname = cache_path() / f'{key}.json'
+  try:
+    with open(fname, 'r') as f:
+      data = json.load(f)
+  except (OSError, ValueError):
+    metrics.incr('parse_cache.miss')
+    return None
+  try:
+    os.utime(fname)
+  except OSError:
+    pass
+  metrics.incr('parse_cache.hit')
+  return data
+
+
+def put(key, data):
+  path = cache_path()
+  fd, tmp = tempfile.mkstemp(dir=path, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as f:
+      json.dump(data, f)
+    os.replace(tmp, path / f'{key}.json')
+  except OSError:
+    try:
+      os.unlink(tmp)
+    except OSError:
+      pass
+    return
+  evict()
+
+
+def entries():
+  '''Cache files, least recently used first, as (path, size) pairs.'''
+  found = list()
+  for entry in os.scandir(cache_path()):
+    if entry.name.endswith('.json'):
+      try:
+        st = entry.stat()
+      except OSError:
+        continue
+      found.append((st.st_mtime, entry.path, st.st_size))
+  found.sort()
+  return [ (fname, size) for mtime, fname, size in found ]
+
+
+def evict():
+  max_bytes = current_app.config['PARSE_CACHE_MAX_BYTES']
+  files = entries()
+  total = sum(size for fname, size in files)
+  for fname, size in files:
+    if total <= max_bytes:
+      break
+    try:
+      os.unlink(fname)
+    except OSError:
+      continue
+    total -= size
+    metrics.incr('parse_cache.evicted')
+
+
+def stats():
+  files = entries()
+  return {
+    'entries': len(files),
+    'bytes': sum(size for fname, size in files),
+    'max_bytes': current_app.config['PARSE_CACHE_MAX_BYTES'],
+  }
@@ -0,0 +1,55 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+from flask import current_app
+
+# Compiled execution plans of test cases, at most PLAN_CACHE_SIZE of them,
+# least recently used first. Like the parse cache, an entry is keyed by a
+# digest of what it was compiled from, so an edit made by another process
+# only ever misses; the stale entry ages out.
+# key -> (case id, plan)
+_plans = OrderedDict()
+_lock = threading.Lock()
+
+
+def make_key(case):
+  h = hashlib.sha256()
+  h.update(case.function.encode())
+  h.update(b'\0')
+  h.update((case.data or '').encode())
+  return h.hexdigest()
+
+
+def get_plan(case, parameters):
+  '''Return the compiled plan for running `case` with `parameters`.
+
+  Returns None if the case's plugin has no compile step. Parameters that
+  carry file contents are compiled on every call and not cached.
+  '''
+  from app.models import plugins
+  plugin = plugins.get(case.function)
+  if plugin is None or not hasattr(plugin, 'compile_plan'):
+    return None
+  if any(key.startswith('filedata:') for key in parameters):
+    return plugin.compile_plan(parameters)
+  key = make_key(case)
+  with _lock:
+    cached = _plans.get(key)
+    if cached is not None:
+      _plans.move_to_end(key)
+      return cached[1]
+  plan = plugin.compile_plan(parameters)
+  size = current_app.config['PLAN_CACHE_SIZE']
+  with _lock:
+    _plans[key] = (case.id, plan)
+    _plans.move_to_end(key)
+    while len(_plans) > size:
+      _plans.popitem(last=False)
+  return plan
+
+
+def invalidate(case_id):
+  with _lock:
+    for key in [ key for key, (cached_id, plan) in _plans.items() if cached_id == case_id ]:
+      del _plans[key]
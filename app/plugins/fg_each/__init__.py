@@ -1 +1 @@
-from .plugin import plugin_name, check, parameters, requires, usage
+from .plugin import plugin_name, accepts_context, plugin_version, check, compile_plan, evaluate, evaluate_batch, batchable, plan_reads, parameters, requires, usage
@@ -3,8 +3,13 @@ import re
 import sys
 import traceback
 
+from collections import namedtuple
+from functools import partial
+
 
 plugin_name = 'fg_each'
+accepts_context = True
+plugin_version = '1'
 
 usage = '''plugin: fg_each
 
@@ -21,124 +26,311 @@ def requires():
     ('json', 'fgt_cli_configuration')
   ]
 
-def validate_setting(context, key, value, or_empty=False, partial_match=False):
-  if isinstance(value, list):
-    for val in value:
-      if validate_setting(context, key, val, or_empty=or_empty, partial_match=partial_match):
-        return True
-    return False
-  if key in context:
-    if context[key] == value or context[key].strip('"') == value:
-      return True
-    elif partial_match:
-      return value in context[key]
-    else:
-      #print(f'# DEBUG: context: {context}')
-      #print(f'# DEBUG: key: <{key}> value: <{value}>')
-      return False
+pipe_escape_split = r'(?<!\\)\|'
+
+tables = {
+  'policy': 'config firewall policy',
+  'addr': 'config firewall address',
+  'addr6': 'config firewall address6',
+  'addrgrp': 'config firewall addrgrp',
+  'addr6grp': 'config firewall addr6grp',
+  'admin': 'config system admin',
+  'tacuser': 'config user tacacs+',
+  'usergroup': 'config user group',
+}
+
+# A compiled setting spec. `error` is set when the spec's type or select is
+# invalid; it then only contributes a failed result.
+# `select_names` are the selected ids without quotes, as keys of the parsed
+# entry index; `match_ids` the table keys they may appear as.
+Spec = namedtuple('Spec', [
+  'description', 'path', 'select_names', 'match_ids', 'negate_match',
+  'setting', 'values', 'or_empty', 'partial_match', 'fail_on_match',
+  'pass_on_match', 'threshold', 'error',
+])
+
+Plan = namedtuple('Plan', ['specs', 'error'])
+
+
+def _threshold_all(description, pass_count, fail_count, match_count):
+  return description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)', bool(pass_count and not fail_count)
+
+def _threshold_any(description, pass_count, fail_count, match_count):
+  return description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)', bool(pass_count)
+
+def _threshold_none(description, pass_count, fail_count, match_count):
+  return description + f' ({fail_count} pass/{pass_count} fail/{match_count} matched)', bool(fail_count and not pass_count)
+
+def _threshold_count(count, description, pass_count, fail_count, match_count):
+  return description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)', pass_count > count
+
+def threshold_function(pass_threshhold):
+  if pass_threshhold == 'all':
+    return _threshold_all
+  elif pass_threshhold == 'any':
+    return _threshold_any
+  elif pass_threshhold == 'none':
+    return _threshold_none
+  elif pass_threshhold.isdigit():
+    count = int(pass_threshhold)
+    if count > 0:
+      return partial(_threshold_count, count)
+    return _threshold_none
+  return None
+
+def compile_spec(spec):
+  spec_type = spec['type']
+  select = spec.get('select', 'all')
+  setting = spec['setting']
+  values = frozenset(re.split(pipe_escape_split, spec['value']))
+  description = spec.get('description', f'{spec_type}:{select}:{setting}')
+  if spec_type not in tables:
+    return Spec(description, None, None, None, False, setting, values, False, False, False, False, None, 'type')
+  path = ('fgt_cli_configuration', 'hierarchy', tables[spec_type])
+  if select.startswith('id:'):
+    ids = re.split(pipe_escape_split, select[3:])
+    select_names = tuple(dict.fromkeys(unquote(id) for id in ids))
+    match_ids = frozenset(
+      entry
+      for id in ids
+      for entry in (f'edit {id}', f'edit "{id}"')
+    )
+  elif select == 'all' or select == 'any':
+    select_names = None
+    match_ids = None
   else:
-    return or_empty
+    return Spec(description, path, None, None, False, setting, values, False, False, False, False, None, 'select')
+  return Spec(
+    description=description,
+    path=path,
+    select_names=select_names,
+    match_ids=match_ids,
+    negate_match=spec.get('negate_match', False),
+    setting=setting,
+    values=values,
+    or_empty=spec.get('or_empty', False),
+    partial_match=spec.get('partial_match', False),
+    fail_on_match=spec.get('fail_on_match', False),
+    pass_on_match=spec.get('pass_on_match', False),
+    threshold=threshold_function(spec.get('pass_threshhold', 'all')),
+    error=None,
+  )
 
-def _check_match(spec, entry):
-  return f'edit {spec}' == entry or f'edit "{spec}"' == entry
+def compile_plan(parameters):
+  '''Compile the setting specs of a test case into an immutable Plan.'''
+  specs = list()
+  try:
+    for spec in parameters['setting_specs']:
+      specs.append(compile_spec(spec))
+  except:
+    return Plan(tuple(specs), traceback.format_exc())
+  return Plan(tuple(specs), None)
 
-def check_match(spec, entry, negate=False):
-  if negate:
-    return not check_match(spec, entry, negate=False)
-  if spec is True:
+def validate_setting(context, spec):
+  if spec.setting not in context:
+    return spec.or_empty
+  current = context[spec.setting]
+  if current in spec.values or current.strip('"') in spec.values:
     return True
-  for sp in spec:
-    if _check_match(sp, entry):
-      return True
+  if spec.partial_match:
+    return any(value in current for value in spec.values)
   return False
 
-pipe_escape_split = r'(?<!\\)\|'
+def unquote(name):
+  if len(name) >= 2 and name[0] == '"' and name[-1] == '"':
+    return name[1:-1]
+  return name
 
-def check(data):
-  if isinstance(data, str):
-    data = json.loads(data)
+def is_match(spec, entry):
+  matched = spec.match_ids is None or entry in spec.match_ids
+  return matched != spec.negate_match
+
+def table_index(data, spec):
+  '''The parsed entry index of the spec's table, if the model provides one.'''
+  index = data[spec.path[0]].get('index')
+  if index is None:
+    return None
+  return index.get(spec.path[-1])
+
+def select_entries(spec, data, context):
+  '''Yield (entry, ctx) for the entries of `context` the spec selects.
+
+  Selection by id looks the ids up in the entry index instead of comparing
+  every entry; negated selection skips those entries. Entries are yielded
+  in table order either way.
+  '''
+  if spec.match_ids is None:
+    if not spec.negate_match:
+      yield from context.items()
+    return
+  index = table_index(data, spec)
+  if index is None:
+    for entry, ctx in context.items():
+      if is_match(spec, entry):
+        yield entry, ctx
+    return
+  selected = sorted(set(
+    (ordinal, entry)
+    for name in spec.select_names
+    for ordinal, entry in index.get(name, ())
+    if entry in spec.match_ids
+  ))
+  if spec.negate_match:
+    skip = set(entry for ordinal, entry in selected)
+    for entry, ctx in context.items():
+      if entry not in skip:
+        yield entry, ctx
+  else:
+    for ordinal, entry in selected:
+      yield entry, context[entry]
+
+def evaluate_spec(spec, data, result):
+  if spec.path is None:
+    result[spec.description + f' [ERROR: {spec.error}]'] = False
+    return
+  context = data
+  for key in spec.path:
+    context = context[key]
+  if spec.error is not None:
+    result[spec.description + f' [ERROR: {spec.error}]'] = False
+    return
+  match_count = 0
+  pass_count = 0
+  fail_count = 0
+  for entry, ctx in select_entries(spec, data, context):
+    matched = entry.split(' ', 1)[-1].strip('"')
+    match_count += 1
+    if spec.fail_on_match:
+      result[spec.description + f' ({matched} found)'] = False
+      fail_count += 1
+    elif spec.pass_on_match:
+      result[spec.description + f' ({matched} found)'] = True
+      pass_count += 1
+    elif validate_setting(ctx, spec):
+      pass_count += 1
+    else:
+      fail_count += 1
+  if spec.fail_on_match:
+    result[spec.description + f' (user not found)'] = True
+  elif spec.threshold is not None:
+    key, passed = spec.threshold(spec.description, pass_count, fail_count, match_count)
+    result[key] = passed
+
+def print_exception(text):
+  print("Exception in user code:")
+  print("-"*60)
+  print(text, end='')
+  print("-"*60)
+
+def evaluate(plan, data):
   result = dict()
   try:
-    for spec in data['parameters']['setting_specs']:
-      spec_type = spec['type']
-      select = spec.get('select', 'all')
-      setting = spec['setting']
-      value = re.split(pipe_escape_split, spec['value'])
-      or_empty = spec.get('or_empty', False)
-      partial_match = spec.get('partial_match', False)
-      fail_on_match = spec.get('fail_on_match', False)
-      pass_on_match = spec.get('pass_on_match', False)
-      pass_threshhold = spec.get('pass_threshhold', 'all')
-      negate_match = spec.get('negate_match', False)
-      description = spec.get('description', f'{spec_type}:{select}:{setting}')
-      if spec_type == 'policy':
-        context = data['fgt_cli_configuration']['hierarchy']['config firewall policy']
-      elif spec_type == 'addr':
-        context = data['fgt_cli_configuration']['hierarchy']['config firewall address']
-      elif spec_type == 'addr6':
-        context = data['fgt_cli_configuration']['hierarchy']['config firewall address6']
-      elif spec_type == 'addrgrp':
-        context = data['fgt_cli_configuration']['hierarchy']['config firewall addrgrp']
-      elif spec_type == 'addr6grp':
-        context = data['fgt_cli_configuration']['hierarchy']['config firewall addr6grp']
-      elif spec_type == 'admin':
-        context = data['fgt_cli_configuration']['hierarchy']['config system admin']
-      elif spec_type == 'tacuser':
-        context = data['fgt_cli_configuration']['hierarchy']['config user tacacs+']
-      elif spec_type == 'usergroup':
-        context = data['fgt_cli_configuration']['hierarchy']['config user group']
-      else:
-        result[description + ' [ERROR: type]'] = False
-        continue
-      if select.startswith('id:'):
-        match_entry = re.split(pipe_escape_split, select[3:])
-      elif select == 'all' or select == 'any':
-        match_entry = True
-      else:
-        result[description + ' [ERROR: select]'] = False
-        continue
-      match_count = 0
-      pass_count = 0
-      fail_count = 0
-      for entry, ctx in context.items():
-        if check_match(match_entry, entry, negate=negate_match):
-          matched = entry.split(' ', 1)[-1].strip('"')
-          print(f'# DEBUG: fg_each: match: {matched} (match_entry: {match_entry}, negate_match: {negate_match})')
-          print(f'# DEBUG:   description: {description}')
-          match_count += 1
-          if fail_on_match:
-            result[description + f' ({matched} found)'] = False
-            fail_count += 1
-          elif pass_on_match:
-            result[description + f' ({matched} found)'] = True
-            pass_count += 1
-          else:
-            res = validate_setting(ctx, setting, value, or_empty=or_empty, partial_match=partial_match)
-            if res:
-              pass_count += 1
-            else:
-              fail_count += 1
-      if fail_on_match:
-        result[description + f' (user not found)'] = True
-      else:
-        if pass_threshhold == 'all':
-          result[description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)'] = True if pass_count and not fail_count else False
-        elif pass_threshhold == 'any':
-          result[description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)'] = True if pass_count else False
-        elif pass_threshhold == 'none':
-          result[description + f' ({fail_count} pass/{pass_count} fail/{match_count} matched)'] = True if fail_count and not pass_count else False
-        elif pass_threshhold.isdigit():
-          pass_threshhold = int(pass_threshhold)
-          if pass_threshhold > 0:
-            result[description + f' ({pass_count} pass/{fail_count} fail/{match_count} matched)'] = True if pass_count > pass_threshhold else False
-          elif pass_threshhold == 0:
-            result[description + f' ({fail_count} pass/{pass_count} fail/{match_count} matched)'] = True if fail_count and not pass_count else False
-          elif pass_threadhold < 0:
-            result[description + f' ({fail_count} pass/{pass_count} fail/{match_count} matched)'] = True if fail_count and not pass_count else False
-    return result
+    for spec in plan.specs:
+      evaluate_spec(spec, data, result)
+    if plan.error is None:
+      return result
+    print_exception(plan.error)
   except:
-    print("Exception in user code:")
-    print("-"*60)
-    traceback.print_exc(file=sys.stdout)
-    print("-"*60)
-  return result
\ No newline at end of file
+    print_exception(traceback.format_exc())
+  return result
+
+def batchable(plan):
+  '''True if every spec of the plan has to walk its whole table anyway.'''
+  return all(spec.match_ids is None or spec.negate_match for spec in plan.specs)
+
+def plan_reads(plan):
+  '''Paths of the data a batched evaluation of `plan` depends on.'''
+  return [ spec.path for spec in plan.specs if spec.path is not None ]
+
+
+class SpecState:
+  '''Counts and per-entry results of one spec during a batched pass.'''
+
+  def __init__(self):
+    self.found = list()
+    self.match_count = 0
+    self.pass_count = 0
+    self.fail_count = 0
+    self.error = None
+
+
+def _evaluate_entry(spec, state, entry, ctx):
+  matched = entry.split(' ', 1)[-1].strip('"')
+  state.match_count += 1
+  if spec.fail_on_match:
+    state.found.append((spec.description + f' ({matched} found)', False))
+    state.fail_count += 1
+  elif spec.pass_on_match:
+    state.found.append((spec.description + f' ({matched} found)', True))
+    state.pass_count += 1
+  elif validate_setting(ctx, spec):
+    state.pass_count += 1
+  else:
+    state.fail_count += 1
+
+def _evaluate_table(specs, data, states):
+  try:
+    context = data
+    for key in specs[0].path:
+      context = context[key]
+  except:
+    error = traceback.format_exc()
+    for spec in specs:
+      states[spec].error = error
+    return
+  active = [ (spec, states[spec]) for spec in specs if spec.error is None ]
+  for entry, ctx in context.items():
+    for spec, state in active:
+      if state.error is None and is_match(spec, entry):
+        try:
+          _evaluate_entry(spec, state, entry, ctx)
+        except:
+          state.error = traceback.format_exc()
+
+def _scatter(plan, states):
+  result = dict()
+  for spec in plan.specs:
+    if spec.path is None:
+      result[spec.description + f' [ERROR: {spec.error}]'] = False
+      continue
+    state = states[spec]
+    if spec.error is not None and state.error is None:
+      result[spec.description + f' [ERROR: {spec.error}]'] = False
+      continue
+    for key, passed in state.found:
+      result[key] = passed
+    if state.error is not None:
+      print_exception(state.error)
+      return result
+    if spec.fail_on_match:
+      result[spec.description + f' (user not found)'] = True
+    elif spec.threshold is not None:
+      key, passed = spec.threshold(spec.description, state.pass_count, state.fail_count, state.match_count)
+      result[key] = passed
+  if plan.error is not None:
+    print_exception(plan.error)
+  return result
+
+def evaluate_batch(plans, data):
+  '''Evaluate several batchable plans with a single pass over each table.
+
+  All specs of all plans are grouped by the table they target. Each table
+  is walked once, every spec's predicate is applied to each entry, and the
+  counts are scattered back into one result dict per plan, the same as
+  evaluate() would return for that plan on its own.
+  '''
+  states = dict()
+  tables = dict()
+  for plan in plans:
+    for spec in plan.specs:
+      if spec.path is not None and spec not in states:
+        states[spec] = SpecState()
+        tables.setdefault(spec.path, list()).append(spec)
+  for specs in tables.values():
+    _evaluate_table(specs, data, states)
+  return [ _scatter(plan, states) for plan in plans ]
+
+def check(data):
+  if isinstance(data, str):
+    data = json.loads(data)
+  return evaluate(compile_plan(data.get('parameters', dict())), data)
@@ -1,8 +1,12 @@
 import json
 import re
 
+from collections import namedtuple
+
 
 plugin_name = 'fg_setting'
+accepts_context = True
+plugin_version = '1'
 
 usage = '''plugin: fg_setting
 
@@ -19,43 +23,57 @@ def requires():
     ('json', 'fgt_cli_configuration')
   ]
 
-def validate_setting(context, key, value, or_empty=False, partial_match=False):
-  if isinstance(value, list):
-    for val in value:
-      if validate_setting(context, key, val, or_empty=or_empty, partial_match=partial_match):
-        return True
-    return False
-  if key in context:
-    if context[key] == value or context[key].strip('"') == value:
-      return True
-    elif partial_match:
-      return value in context[key]
-    else:
-      print(f'# DEBUG: context: {context}')
-      print(f'# DEBUG: key: <{key}> value: <{value}>')
-      return False
-  else:
-    return or_empty
-
 pipe_escape_split = r'(?<!\\)\|'
 
-def check(data):
-  if isinstance(data, str):
-    data = json.loads(data)
+Spec = namedtuple('Spec', ['description', 'path', 'setting', 'values', 'or_empty', 'partial_match'])
+
+
+def compile_plan(parameters):
+  '''Compile the setting specs of a test case into an immutable plan.
+
+  The plan is a tuple of Spec, or None if the specs are malformed.
+  '''
+  try:
+    return tuple(
+      Spec(
+        description=spec.get('description', f'{spec["config_path"]}:{spec["setting"]}'),
+        path=('fgt_cli_configuration', 'hierarchy', *spec['config_path']),
+        setting=spec['setting'],
+        values=frozenset(re.split(pipe_escape_split, spec['value'])),
+        or_empty=spec.get('or_empty', False),
+        partial_match=spec.get('partial_match', False),
+      )
+      for spec in parameters['setting_specs']
+    )
+  except:
+    return None
+
+def validate_setting(context, spec):
+  if spec.setting not in context:
+    return spec.or_empty
+  current = context[spec.setting]
+  if current in spec.values or current.strip('"') in spec.values:
+    return True
+  if spec.partial_match:
+    return any(value in current for value in spec.values)
+  return False
+
+def evaluate(plan, data):
+  if plan is None:
+    return False
   result = dict()
   try:
-    for spec in data['parameters']['setting_specs']:
-      config_path = spec['config_path']
-      setting = spec['setting']
-      value = re.split(pipe_escape_split, spec['value'])
-      or_empty = spec.get('or_empty', False)
-      partial_match = spec.get('partial_match', False)
-      description = spec.get('description', f'{config_path}:{setting}')
-      context = data['fgt_cli_configuration']['hierarchy']
-      for path in config_path:
-        context = context[path]
-      result[description] = validate_setting(context, setting, value, or_empty=or_empty, partial_match=partial_match)
+    for spec in plan:
+      context = data
+      for key in spec.path:
+        context = context[key]
+      result[spec.description] = validate_setting(context, spec)
     return result
   except:
     pass
   return False
+
+def check(data):
+  if isinstance(data, str):
+    data = json.loads(data)
+  return evaluate(compile_plan(data.get('parameters', dict())), data)
@@ -2,6 +2,8 @@ import json
 
 
 plugin_name = 'fg_version'
+accepts_context = True
+plugin_version = '1'
 
 usage = '''plugin: fg_version
 
@@ -20,10 +22,8 @@ def requires():
 
 
 def check(data):
-  try:
+  if isinstance(data, str):
     data = json.loads(data)
-  except:
-    pass
   description = f'Software Version is ' + data['parameters']['fw_version']
   try:
     conf = data['fgt_cli_configuration']
@@ -3,6 +3,8 @@ import re
 import sys
 
 plugin_name = 'manual'
+accepts_context = True
+plugin_version = '1'
 
 usage = '''plugin: manual
 
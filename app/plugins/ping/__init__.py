@@ -1 +1 @@
-from .plugin import plugin_name, check, parameters, requires, usage
+from .plugin import plugin_name, accepts_context, check, parameters, requires, usage
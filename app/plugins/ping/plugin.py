@@ -1,34 +1,50 @@
-import subprocess
+from app import reachability
 
 
 plugin_name = 'ping'
+accepts_context = True
 
 
 usage = '''plugin: ping
 
-requires: "ip_address" - IP Address of host to ping
+requires: "device" - the device under validation
+
+parameters: "checks" - any of icmp, ssh, https (default: all three)
 
 successful if:
-  IP address is pingable using system's ping command
+  the device answers a ping (icmp) and accepts TCP connections on its SSH
+  and HTTPS ports, for each check requested
 
 '''
 
 def parameters():
-  return []
+  return [
+    ('list', 'checks', 'icmp|ssh|https'),
+  ]
 
 def requires():
   return [
-    ('ip', 'ip_address')
+    ('device', 'device')
   ]
 
 
 def check(data):
-  if 'ip_address' not in data:
-    raise KeyError
-  status, result = sp.getstatusoutput(f"ping -c1 -w2 {data['ip_address']}")
-  job.meta['progress'] = 100
-  if status == 0:
-    job.meta['status'] = True
-  else:
-    job.meta['status'] = False
-
+  device = data['device']
+  host = device['hostname']
+  checks = data['parameters'].get('checks') or [ 'icmp', 'ssh', 'https' ]
+  ports = dict()
+  if 'ssh' in checks and device.get('ssh_port'):
+    ports['ssh'] = device['ssh_port']
+  if 'https' in checks and device.get('https_port'):
+    ports['https'] = device['https_port']
+  icmp = 'icmp' in checks
+  result, = reachability.sweep([ (host, tuple(ports.values())) ], icmp=icmp)
+  status = dict()
+  if icmp:
+    if result['icmp'] is None:
+      status[f'{host} answers ping [ERROR: ping unavailable]'] = False
+    else:
+      status[f'{host} answers ping'] = result['icmp']
+  for name, port in ports.items():
+    status[f'{host} accepts {name} on TCP {port}'] = result['tcp'][port]
+  return status
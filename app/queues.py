@@ -0,0 +1,155 @@
+import redis
+import rq
+import sqlalchemy as sa
+
+from datetime import datetime, timezone
+from flask import current_app
+
+from app import db
+
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+MAINTENANCE = 'maintenance'
+
+# Highest priority first.
+QUEUES = {
+  INTERACTIVE: 'framease-tasks',
+  BULK: 'framease-bulk',
+  MAINTENANCE: 'framease-maintenance',
+}
+
+WAITS_KEY = 'framease:queue:{}:waits'
+WAITS_KEPT = 200
+
+
+class QueueLimitError(Exception):
+  pass
+
+
+def make_queues(connection):
+  return { kind: rq.Queue(name, connection=connection) for kind, name in QUEUES.items() }
+
+
+def get_queue(kind):
+  return current_app.task_queues[kind]
+
+
+def parse_weights(value):
+  '''"interactive=4,bulk=2,maintenance=1" -> {'interactive': 4, ...}'''
+  weights = dict()
+  for item in str(value).split(','):
+    if not item.strip():
+      continue
+    kind, _, count = item.partition('=')
+    kind = kind.strip()
+    if kind not in QUEUES:
+      raise ValueError(f'Unknown task queue: {kind}')
+    weights[kind] = int(count or 1)
+  return weights
+
+
+def worker_queues(kind):
+  '''Queues a worker of `kind` listens to, in order.
+
+  Workers take their own queue first. Bulk and maintenance workers help
+  with interactive jobs when they are idle; interactive workers never
+  pick up bulk work, so a large fleet run cannot starve them.
+  '''
+  kinds = [ kind ]
+  if kind != INTERACTIVE:
+    kinds.append(INTERACTIVE)
+  return [ QUEUES[k] for k in kinds ]
+
+
+def worker_plan(weights):
+  '''One list of queue names per worker process to start.'''
+  return [ worker_queues(kind) for kind, count in weights.items() for i in range(count) ]
+
+
+def check_limits(user, device=None, validation=None):
+  '''Refuse to enqueue past USER_MAX_ACTIVE_TASKS interactive tasks in
+  flight for the user, or DEVICE_MAX_ACTIVE_RUNS running validations of
+  the device (not counting `validation` itself).'''
+  from app.models import Task, DeviceValidation
+  limit = current_app.config['USER_MAX_ACTIVE_TASKS']
+  if user is not None and limit:
+    active = db.session.scalar(sa.select(sa.func.count(Task.id)).where(
+      Task.user_id == user.id, Task.complete == False, Task.parent_id == None,
+      Task.kind == INTERACTIVE))
+    if active >= limit:
+      raise QueueLimitError(f'You already have {active} tasks running (limit {limit}).')
+  limit = current_app.config['DEVICE_MAX_ACTIVE_RUNS']
+  if device is not None and limit:
+    query = sa.select(sa.func.count(DeviceValidation.id)).where(
+      DeviceValidation.device_id == device.id, DeviceValidation.running == True)
+    if validation is not None:
+      query = query.where(DeviceValidation.id != validation.id)
+    active = db.session.scalar(query)
+    if active >= limit:
+      raise QueueLimitError(f'{device} already has {active} validations running (limit {limit}).')
+
+
+def busy_devices(device_ids):
+  '''Ids of the devices at their DEVICE_MAX_ACTIVE_RUNS limit.'''
+  from app.models import DeviceValidation
+  limit = current_app.config['DEVICE_MAX_ACTIVE_RUNS']
+  if not limit or not device_ids:
+    return set()
+  query = sa.select(DeviceValidation.device_id).where(
+    DeviceValidation.device_id.in_(device_ids), DeviceValidation.running == True) \
+    .group_by(DeviceValidation.device_id) \
+    .having(sa.func.count(DeviceValidation.id) >= limit)
+  return set(db.session.scalars(query))
+
+
+def record_wait(job):
+  '''Remember how long `job` waited in its queue before a worker took it.'''
+  if job is None or job.enqueued_at is None:
+    return
+  started = job.started_at or datetime.now(timezone.utc).replace(tzinfo=None)
+  wait = max((started - job.enqueued_at).total_seconds(), 0.0)
+  key = WAITS_KEY.format(job.origin)
+  try:
+    with current_app.redis.pipeline() as pipe:
+      pipe.lpush(key, wait)
+      pipe.ltrim(key, 0, WAITS_KEPT - 1)
+      pipe.execute()
+  except redis.exceptions.RedisError:
+    pass
+
+
+def _percentile(values, fraction):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def stats():
+  '''Depth, oldest waiting job, recent wait times and workers per queue.'''
+  result = list()
+  try:
+    workers = rq.Worker.all(connection=current_app.redis)
+  except redis.exceptions.RedisError:
+    workers = list()
+  now = datetime.now(timezone.utc).replace(tzinfo=None)
+  for kind, queue in current_app.task_queues.items():
+    entry = {'kind': kind, 'name': queue.name, 'depth': None, 'oldest': None,
+      'wait_avg': None, 'wait_p95': None, 'started': None,
+      'workers': sum(1 for worker in workers if queue.name in worker.queue_names())}
+    try:
+      entry['depth'] = queue.count
+      entry['started'] = queue.started_job_registry.count
+      oldest = queue.get_job_ids(0, 1)
+      job = rq.job.Job.fetch(oldest[0], connection=current_app.redis) if oldest else None
+      if job is not None and job.enqueued_at is not None:
+        entry['oldest'] = (now - job.enqueued_at).total_seconds()
+      waits = [ float(value) for value in current_app.redis.lrange(WAITS_KEY.format(queue.name), 0, -1) ]
+      if waits:
+        entry['wait_avg'] = sum(waits) / len(waits)
+        entry['wait_p95'] = _percentile(waits, 0.95)
+    except (redis.exceptions.RedisError, rq.exceptions.NoSuchJobError):
+      pass
+    result.append(entry)
+  return result
@@ -0,0 +1,109 @@
+import asyncio
+import math
+import time
+
+from flask import current_app
+
+
+# (host, ports, icmp) -> (expires, result)
+_cache = dict()
+
+
+def _setting(name, value):
+  if value is not None:
+    return value
+  return current_app.config[name]
+
+
+async def check_icmp(host, timeout):
+  '''Ping `host` once with the system ping. None if ping is unavailable.'''
+  try:
+    proc = await asyncio.create_subprocess_exec(
+      'ping', '-n', '-c', '1', '-W', str(max(1, math.ceil(timeout))), '--', host,
+      stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+  except OSError:
+    return None
+  try:
+    return await asyncio.wait_for(proc.wait(), timeout + 1) == 0
+  except asyncio.TimeoutError:
+    proc.kill()
+    await proc.wait()
+    return False
+
+
+async def check_tcp(host, port, timeout):
+  '''True if a TCP connection to host:port is accepted within `timeout`.'''
+  try:
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+  except (OSError, asyncio.TimeoutError):
+    return False
+  writer.close()
+  try:
+    await writer.wait_closed()
+  except OSError:
+    pass
+  return True
+
+
+async def check_host(host, ports, semaphore, timeout, icmp=True):
+  async with semaphore:
+    started = time.monotonic()
+    checks = [ check_tcp(host, port, timeout) for port in ports ]
+    if icmp:
+      checks.append(check_icmp(host, timeout))
+    outcomes = await asyncio.gather(*checks)
+    return {
+      'host': host,
+      'icmp': outcomes[-1] if icmp else None,
+      'tcp': { port: outcome for port, outcome in zip(ports, outcomes) },
+      'seconds': time.monotonic() - started,
+    }
+
+
+async def sweep_async(targets, concurrency, timeout, icmp=True):
+  semaphore = asyncio.Semaphore(concurrency)
+  return await asyncio.gather(*[
+    check_host(host, ports, semaphore, timeout, icmp=icmp)
+    for host, ports in targets
+  ])
+
+
+def sweep(targets, concurrency=None, timeout=None, icmp=True, ttl=None):
+  '''Check many hosts concurrently.
+
+  `targets` is a list of (host, ports). Each host is pinged (unless `icmp`
+  is False) and a TCP connection is tried on each of its ports, with at
+  most `concurrency` hosts in flight and `timeout` seconds per check.
+  Results are cached for `ttl` seconds. Returns one result dict per
+  target, in order.
+  '''
+  concurrency = _setting('REACHABILITY_CONCURRENCY', concurrency)
+  timeout = _setting('REACHABILITY_TIMEOUT', timeout)
+  ttl = _setting('REACHABILITY_CACHE_TTL', ttl)
+  now = time.monotonic()
+  for key in [ key for key, (expires, result) in _cache.items() if expires <= now ]:
+    _cache.pop(key, None)
+  keys = [ (host, tuple(ports), icmp) for host, ports in targets ]
+  results = dict()
+  for key in keys:
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > now:
+      results[key] = cached[1]
+  missing = list(dict.fromkeys(key for key in keys if key not in results))
+  if missing:
+    fresh = asyncio.run(sweep_async(
+      [ (host, ports) for host, ports, icmp in missing ], concurrency, timeout, icmp=icmp))
+    expires = time.monotonic() + ttl
+    for key, result in zip(missing, fresh):
+      results[key] = result
+      if ttl > 0:
+        _cache[key] = (expires, result)
+  return [ results[key] for key in keys ]
+
+
+def device_target(device):
+  return (device.hostname, tuple(port for port in (device.ssh_port, device.https_port) if port))
+
+
+def is_reachable(result):
+  return bool(result['icmp']) or any(result['tcp'].values())
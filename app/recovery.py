@@ -0,0 +1,192 @@
+import json
+import sqlalchemy as sa
+
+from flask import current_app
+from redis.exceptions import RedisError
+from rq.job import Job
+from time import time
+
+from app import db, fleet, leases, queues
+from app.models import Task, DeviceValidation, ValidationRun, TASK_ENDED_STATUSES, \
+  validation_retry, validation_on_failure
+
+
+SWEEP_LOCK = 'framease:recovery:sweep'
+
+
+class RunCheckpoint:
+  '''Writes a run's results as they come in, so an interrupted run resumes.
+
+  save() inserts only the checks not written yet, stores the fingerprints
+  gathered so far on the run and commits. due() says when the next save
+  is needed: every `every` cases or `interval` seconds.
+  '''
+
+  def __init__(self, run, results, every, interval):
+    self.run = run
+    self.every = every
+    self.interval = interval
+    self.written = {
+      seq: set(checks) for seq, checks in results.items() if isinstance(checks, dict)
+    }
+    self.pending = 0
+    self.last = time()
+
+  def due(self):
+    self.pending += 1
+    return self.pending >= self.every or time() - self.last >= self.interval
+
+  def save(self, results, fingerprints):
+    delta = dict()
+    for seq, checks in results.items():
+      if not isinstance(checks, dict):
+        continue
+      written = self.written.get(seq)
+      new = { check: status for check, status in checks.items() if check not in (written or ()) }
+      if new or written is None:
+        delta[seq] = new
+    self.run.add_results(delta)
+    self.run.fingerprints = json.dumps(fingerprints)
+    self.run.checkpoint = time()
+    db.session.commit()
+    for seq, checks in delta.items():
+      self.written.setdefault(seq, set()).update(checks)
+    self.pending = 0
+    self.last = time()
+
+
+def resume_state(run):
+  '''Results and fingerprints an interrupted run had checkpointed.'''
+  fingerprints = run.get_fingerprints()
+  results = run.get_results()
+  return results, { seq: entry for seq, entry in fingerprints.items() if seq in results }
+
+
+def find_stuck(now=None):
+  '''Runs left 'running' whose RQ job is gone or has ended.
+
+  Returns a list of (run, task); task is None when no open task is left.
+  Runs that checkpointed within VALIDATION_STUCK_AFTER seconds are not
+  considered, nor runs whose job is still queued or running.
+  '''
+  now = now if now is not None else time()
+  stale = now - current_app.config['VALIDATION_STUCK_AFTER']
+  runs = db.session.scalars(sa.select(ValidationRun).where(
+    ValidationRun.status == 'running',
+    sa.func.coalesce(ValidationRun.checkpoint, ValidationRun.started) < stale)).all()
+  if not runs:
+    return list()
+  tasks = dict()
+  for task in db.session.scalars(sa.select(Task).where(
+      Task.name == 'run_validation', Task.complete == False,
+      Task.obj_id.in_([ run.validation_id for run in runs ])).order_by(Task.timestamp)):
+    tasks[task.obj_id] = task
+  found = [ tasks.get(run.validation_id) for run in runs ]
+  jobs = Job.fetch_many([ task.id for task in found if task is not None ],
+    connection=current_app.redis)
+  jobs = iter(jobs)
+  stuck = list()
+  for run, task in zip(runs, found):
+    job = next(jobs) if task is not None else None
+    if job is None or job.get_status(refresh=False) in TASK_ENDED_STATUSES:
+      stuck.append((run, task))
+  return stuck
+
+
+def requeue_stuck(now=None):
+  '''Requeue stuck runs that have attempts left; give up on the others.
+
+  A requeued job keeps its task id, so fleet groups and progress keep
+  tracking it, and resumes from the run's checkpoint.
+  '''
+  requeued, failed = list(), list()
+  for run, task in find_stuck(now):
+    if task is not None and run.attempts < current_app.config['VALIDATION_MAX_ATTEMPTS']:
+      queue = queues.get_queue(queues.BULK if task.parent_id else queues.INTERACTIVE)
+      queue.enqueue('app.tasks.run_validation', task.user_id, run.validation_id,
+        job_id=task.id, retry=validation_retry(), on_failure=validation_on_failure())
+      run.checkpoint = time()
+      requeued.append(run)
+      continue
+    run.status = 'failed'
+    run.finished = time()
+    run.validation.running = False
+    if task is not None:
+      task.complete = True
+    failed.append((run, task))
+  db.session.commit()
+  for run, task in failed:
+    fleet.child_finished(task)
+  return requeued, [ run for run, task in failed ]
+
+
+def give_up(task):
+  '''Close the task of a job that will not run again.
+
+  Fails the run it left 'running', clears the validation's running flag,
+  releases the lease the job held and starts the next validation of the
+  task's fleet group.
+  '''
+  validation = db.session.get(DeviceValidation, task.obj_id)
+  if validation is not None:
+    run = validation.interrupted_run()
+    if run is not None:
+      run.status = 'failed'
+      run.finished = time()
+    validation.running = False
+  task.complete = True
+  db.session.commit()
+  try:
+    leases.release(task.obj_id, task.id)
+  except RedisError:
+    current_app.logger.warning(f'Unable to release the lease of validation {task.obj_id}', exc_info=True)
+  fleet.child_finished(task)
+
+
+def find_lost(now=None):
+  '''Fleet children whose job is gone or has ended, task left open.
+
+  A worker that is killed, or a job that dies before a run was started,
+  never completes the task, so its group would wait on it forever.
+  Children still waiting in their group's list are not lost, and neither
+  are validations with a run left 'running': find_stuck() handles those.
+  '''
+  now = now if now is not None else time()
+  stale = now - current_app.config['VALIDATION_STUCK_AFTER']
+  tasks = db.session.scalars(sa.select(Task).where(
+    Task.name == 'run_validation', Task.complete == False,
+    Task.parent_id != None, Task.timestamp < stale)).all()
+  if not tasks:
+    return list()
+  running = set(db.session.scalars(sa.select(ValidationRun.validation_id).where(
+    ValidationRun.status == 'running',
+    ValidationRun.validation_id.in_([ task.obj_id for task in tasks ]))))
+  tasks = [ task for task in tasks if task.obj_id not in running ]
+  waiting = set()
+  for group_id in set(task.parent_id for task in tasks):
+    for item in current_app.redis.lrange(fleet.pending_key(group_id), 0, -1):
+      waiting.add(item.decode().split(':')[0])
+  tasks = [ task for task in tasks if task.id not in waiting ]
+  jobs = Job.fetch_many([ task.id for task in tasks ], connection=current_app.redis)
+  return [
+    task for task, job in zip(tasks, jobs)
+    if job is None or job.get_status(refresh=False) in TASK_ENDED_STATUSES
+  ]
+
+
+def release_lost(now=None):
+  '''Give up on lost fleet children, so their groups carry on.'''
+  lost = find_lost(now)
+  for task in lost:
+    give_up(task)
+  return lost
+
+
+def sweep():
+  '''Queue a requeue_stuck() maintenance job, at most once a minute.'''
+  try:
+    if not current_app.redis.set(SWEEP_LOCK, 1, nx=True, ex=60):
+      return
+    queues.get_queue(queues.MAINTENANCE).enqueue('app.tasks.requeue_stuck_runs')
+  except RedisError:
+    current_app.logger.warning('Unable to queue the stuck validation sweep', exc_info=True)
@@ -0,0 +1,49 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+from app.models import Comment, DeviceValidation, SuiteCase
+
+
+class ReportRow:
+  def __init__(self, suitecase, comments, results):
+    self.suitecase = suitecase
+    self.sequence = suitecase.sequence
+    self.description = suitecase.description
+    self.comments = comments
+    self.num_comments = len(comments)
+    self.status = DeviceValidation.status_from(comments, results)
+    self.row_status = DeviceValidation.row_status_from(comments, results)
+
+
+class ValidationReport:
+  '''What validation.html shows for one validation, built once per request.
+
+  The suite cases, all comments of the validation and the latest results
+  are each loaded with a single query and grouped by sequence, instead of
+  querying comments and results again for every row.
+  '''
+
+  def __init__(self, validation):
+    self.validation = validation
+    suitecases = db.session.scalars(
+      sa.select(SuiteCase).where(SuiteCase.suite_id == validation.suite_id)
+      .options(so.selectinload(SuiteCase.case))
+      .order_by(SuiteCase.sequence)).all()
+    comments = db.session.scalars(
+      sa.select(Comment).where(Comment.validation_id == validation.id)
+      .options(so.selectinload(Comment.author))
+      .order_by(Comment.id)).all()
+    self.comments = dict()
+    for comment in comments:
+      self.comments.setdefault(comment.sequence, list()).append(comment)
+    results = validation.get_results()
+    self.rows = [
+      ReportRow(suitecase, self.comments.get(suitecase.sequence, list()),
+        results.get(str(suitecase.sequence)))
+      for suitecase in suitecases
+    ]
+
+  @property
+  def general_comments(self):
+    return self.comments.get(0, list())
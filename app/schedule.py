@@ -0,0 +1,179 @@
+import random
+import sqlalchemy as sa
+import uuid
+
+from flask import current_app
+from time import time, sleep
+
+from app import db, fingerprint, queues, recovery
+from app.models import User, Task, DeviceValidation
+from app.queues import QueueLimitError
+
+
+SCHEDULE_KEY = 'framease:schedule'
+LEADER_KEY = 'framease:schedule:leader'
+
+_instance = str(uuid.uuid4())
+
+
+def period_start(t):
+  '''Start of the REVALIDATION_INTERVAL period at or after `t`.'''
+  interval = current_app.config['REVALIDATION_INTERVAL']
+  offset = current_app.config['REVALIDATION_WINDOW_START']
+  periods = -(-(t - offset) // interval)
+  return periods * interval + offset
+
+
+def slot(rank, count, start):
+  '''When the `rank`th of `count` validations is due in the window that
+  opens at `start`: evenly spread over REVALIDATION_WINDOW, each moved by
+  up to REVALIDATION_JITTER of its share so runs don't line up.'''
+  width = current_app.config['REVALIDATION_WINDOW'] / max(count, 1)
+  jitter = current_app.config['REVALIDATION_JITTER']
+  return start + (rank + 0.5 + (random.random() - 0.5) * jitter) * width
+
+
+def eligible():
+  '''Ids of the validations revalidated on schedule, in rank order.'''
+  return db.session.scalars(sa.select(DeviceValidation.id).where(
+    DeviceValidation.archived == False, DeviceValidation.submitted == False,
+    DeviceValidation.final == False).order_by(DeviceValidation.id)).all()
+
+
+def sync(now=None):
+  '''Add new validations to the schedule, in the next window, and drop the
+  ones no longer eligible. Scheduled times of the others are kept.'''
+  now = now if now is not None else time()
+  ids = eligible()
+  redis = current_app.redis
+  scheduled = set(int(member) for member in redis.zrange(SCHEDULE_KEY, 0, -1))
+  start = period_start(now)
+  added = {
+    str(validation_id): slot(rank, len(ids), start)
+    for rank, validation_id in enumerate(ids) if validation_id not in scheduled
+  }
+  removed = scheduled - set(ids)
+  with redis.pipeline() as pipe:
+    if added:
+      pipe.zadd(SCHEDULE_KEY, added)
+    if removed:
+      pipe.zrem(SCHEDULE_KEY, *[ str(validation_id) for validation_id in removed ])
+    pipe.execute()
+  return len(added), len(removed)
+
+
+def _reschedule(validation_id, ranks, now):
+  '''Next slot of a validation, in the next window to open.'''
+  return slot(ranks.get(validation_id, 0), len(ranks), period_start(now))
+
+
+def run_user(validation):
+  '''Who scheduled runs are started as: REVALIDATION_USERNAME, else the
+  owner of the validation's last task, else the first admin.'''
+  username = current_app.config['REVALIDATION_USERNAME']
+  if username:
+    return db.session.scalar(sa.select(User).where(User.username == username))
+  user = db.session.scalar(sa.select(User).join(Task, Task.user_id == User.id).where(
+    Task.name == 'run_validation', Task.obj_id == validation.id)
+    .order_by(Task.timestamp.desc()).limit(1))
+  if user is None:
+    user = db.session.scalar(sa.select(User).where(User.admin == True).order_by(User.id).limit(1))
+  return user
+
+
+def capacity():
+  '''Scheduled runs that may be enqueued now without exceeding
+  REVALIDATION_CONCURRENCY jobs waiting or running in the bulk queue.'''
+  queue = queues.get_queue(queues.BULK)
+  in_flight = queue.count + queue.started_job_registry.count
+  return max(current_app.config['REVALIDATION_CONCURRENCY'] - in_flight, 0)
+
+
+def unchanged(validation):
+  '''True if the last complete run was computed from the same inputs.'''
+  digest = fingerprint.input_digest(validation)
+  if digest is None:
+    return False
+  run = validation.latest_run()
+  return run is not None and run.inputs == digest
+
+
+def tick(now=None):
+  '''Enqueue the validations that are due, as far as capacity allows.
+
+  Returns (started, skipped): validations enqueued and validations whose
+  inputs had not changed since their last complete run. A validation that
+  fails to start is logged and rescheduled.
+  '''
+  now = now if now is not None else time()
+  redis = current_app.redis
+  budget = capacity()
+  if not budget:
+    return 0, 0
+  due = redis.zrangebyscore(SCHEDULE_KEY, '-inf', now, start=0, num=budget * 4)
+  if not due:
+    return 0, 0
+  ranks = { validation_id: rank for rank, validation_id in enumerate(eligible()) }
+  started = skipped = 0
+  for member in due:
+    validation_id = int(member)
+    validation = db.session.get(DeviceValidation, validation_id)
+    if validation is None or validation_id not in ranks:
+      redis.zrem(SCHEDULE_KEY, member)
+      continue
+    try:
+      if unchanged(validation):
+        skipped += 1
+      else:
+        user = run_user(validation)
+        if user is None:
+          current_app.logger.warning(f'No user to revalidate {validation_id} as')
+        else:
+          try:
+            task, enqueued = validation.run(user, kind=queues.BULK)
+          except QueueLimitError:
+            # The device is busy; try again a little later.
+            redis.zadd(SCHEDULE_KEY, {member: now + current_app.config['REVALIDATION_RETRY']})
+            continue
+          started += int(enqueued)
+    except Exception:
+      # One broken validation must not hold up the others; it gets its
+      # next slot like any other.
+      db.session.rollback()
+      current_app.logger.error(f'Unable to revalidate {validation_id}', exc_info=True)
+    redis.zadd(SCHEDULE_KEY, {member: _reschedule(validation_id, ranks, now)})
+    if started >= budget:
+      break
+  return started, skipped
+
+
+def is_leader(ttl):
+  '''Only one scheduler acts at a time; the others stand by.'''
+  redis = current_app.redis
+  if redis.set(LEADER_KEY, _instance, nx=True, ex=int(ttl)):
+    return True
+  if (redis.get(LEADER_KEY) or b'').decode() == _instance:
+    redis.expire(LEADER_KEY, int(ttl))
+    return True
+  return False
+
+
+def run_forever():
+  tick_interval = current_app.config['SCHEDULER_TICK']
+  last_sync = 0
+  while True:
+    try:
+      if current_app.config['REVALIDATION_INTERVAL'] and is_leader(tick_interval * 3):
+        if time() - last_sync >= current_app.config['SCHEDULER_SYNC_INTERVAL']:
+          sync()
+          last_sync = time()
+        started, skipped = tick()
+        if started or skipped:
+          current_app.logger.info(f'Scheduler: {started} validations started, {skipped} unchanged')
+        recovery.sweep()
+    except Exception:
+      db.session.rollback()
+      current_app.logger.error('Scheduler tick failed', exc_info=True)
+    finally:
+      db.session.remove()
+    sleep(tick_interval)
@@ -1,15 +1,19 @@
 import sqlalchemy as sa
 
-import json
 import sys
 import time
+import uuid
 
 from flask import render_template, current_app
+from redis.exceptions import RedisError
 from rq import get_current_job
+from rq.timeouts import JobTimeoutException
+from sqlalchemy.orm.exc import StaleDataError
 
-from app import create_app, db
-from app.models import User, Device, Task, DeviceValidation
+from app import create_app, db, config_index, config_store, events, fingerprint, fleet, leases, plans, queues, recovery
+from app.models import User, Device, Task, DeviceValidation, ValidationRun
 from app.email import send_email
+from app.executor import run_cases
 
 app = create_app()
 app.app_context().push()
@@ -17,45 +21,224 @@ app.app_context().push()
 def _set_task_progress(progress):
   job = get_current_job()
   if job:
-    job.meta['progress'] = progress
-    job.save_meta()
     task = db.session.get(Task, job.get_id())
+    events.set_progress(task.user_id, task.id, progress)
     if progress >= 100:
       task.complete = True
     db.session.commit()
 
 
+def _publish_progress(user_id, progress):
+  job = get_current_job()
+  if job:
+    events.set_progress(user_id, job.get_id(), progress)
+
+
+def _start_next_in_group():
+  job = get_current_job()
+  if job:
+    try:
+      fleet.child_finished(db.session.get(Task, job.get_id()))
+    except Exception:
+      app.logger.error('Unable to continue fleet validation', exc_info=sys.exc_info())
+
+
+def _job_id():
+  job = get_current_job()
+  return job.get_id() if job else f'local-{uuid.uuid4()}'
+
+
+def _finish_validation(validation):
+  '''Clear the running flag under the optimistic version check; a
+  concurrent update is re-read and retried.'''
+  for attempt in range(3):
+    validation.running = False
+    try:
+      db.session.commit()
+      return True
+    except StaleDataError:
+      db.session.rollback()
+  app.logger.error(f'Unable to update {validation}: it keeps changing concurrently')
+  return False
+
+
 def run_validation(user_id, device_validation_id):
   try:
     validation = db.session.get(DeviceValidation, device_validation_id)
-  except:
+  except Exception:
+    db.session.rollback()
+    validation = None
+  if validation is None:
+    # Deleted since the job was queued.
     _set_task_progress(100)
+    _start_next_in_group()
+    return
+  queues.record_wait(get_current_job())
+  owner = _job_id()
+  if leases.claim(validation.id, owner, app.config['VALIDATION_LEASE_TTL']) != owner:
+    # Another job holds the validation; this request coalesces into it.
+    app.logger.info(f'Validation {validation.id} is already running, dropping job {owner}')
+    _set_task_progress(100)
+    _start_next_in_group()
+    return
+  with leases.Heartbeat(validation.id, owner, app.config['VALIDATION_LEASE_TTL']) as heartbeat:
+    _run_validation(user_id, validation, owner, heartbeat)
+  recovery.sweep()
+
+
+def validation_failed(job, connection, type, value, traceback):
+  '''RQ failure callback of run_validation jobs.'''
+  if job.retries_left:
+    # RQ retries the job, which resumes the run.
+    return
+  try:
+    db.session.rollback()
+    task = db.session.get(Task, job.get_id())
+    if task is not None and not task.complete:
+      recovery.give_up(task)
+  except Exception:
+    db.session.rollback()
+    app.logger.error(f'Unable to close the task of failed job {job.get_id()}', exc_info=sys.exc_info())
+
+
+def requeue_stuck_runs():
+  queues.record_wait(get_current_job())
+  try:
+    requeued, failed = recovery.requeue_stuck()
+    lost = recovery.release_lost()
+  except Exception:
+    db.session.rollback()
+    app.logger.error('Unable to requeue stuck validations', exc_info=sys.exc_info())
     return
-  validation_data = json.loads(validation.data)
-  if 'history' not in validation_data:
-    validation_data['history'] = list()
-  if 'results' in validation_data:
-    validation_data['history'].append(validation_data['results'])
-  results = dict()
-  validation_data['results'] = results
+  if requeued or failed:
+    app.logger.info(f'Requeued {len(requeued)} stuck validation runs, gave up on {len(failed)}')
+  if lost:
+    app.logger.info(f'Released {len(lost)} lost fleet validations')
+
+
+def index_device_config(device_id):
+  queues.record_wait(get_current_job())
+  try:
+    device = db.session.get(Device, device_id)
+    if device is not None:
+      config_index.index_device(device)
+  except Exception:
+    db.session.rollback()
+    app.logger.error(f'Unable to index the configuration of device {device_id}', exc_info=sys.exc_info())
+
+
+def build_config_store():
+  queues.record_wait(get_current_job())
+  try:
+    # Index changes from now on need a build of their own.
+    app.redis.delete(config_index.STORE_BUILD_KEY)
+  except RedisError:
+    pass
+  try:
+    config_store.build()
+  except Exception:
+    db.session.rollback()
+    app.logger.error('Unable to build the configuration store', exc_info=sys.exc_info())
+
+
+def _index_config(device, device_model_data):
+  # The configuration was parsed for the run anyway; keep the search index
+  # in step with it, without letting the index fail the validation.
+  try:
+    config_index.update_from_model_data(device, device_model_data)
+  except Exception:
+    db.session.rollback()
+    app.logger.warning(f'Unable to index the configuration of {device}', exc_info=sys.exc_info())
+
+
+def _run_validation(user_id, validation, owner, heartbeat):
+  # Results are copied forward only with the fingerprints of the run that
+  # computed them; both were written in the same checkpoint.
+  latest = validation.latest_run()
+  previous = latest.get_results() if latest is not None else dict()
+  previous_fingerprints = latest.get_fingerprints() if latest is not None else dict()
+  run = validation.interrupted_run()
+  if run is not None:
+    results, fingerprints = recovery.resume_state(run)
+    app.logger.info(f'Resuming {run} with {len(results)} sequences done')
+  else:
+    run = ValidationRun(validation_id=validation.id, status='running', attempts=0)
+    db.session.add(run)
+    results, fingerprints = dict(), dict()
+  run.attempts += 1
+  run.checkpoint = time.time()
+  run.inputs = fingerprint.input_digest(validation)
+  db.session.commit()
+  checkpoint = recovery.RunCheckpoint(run, results,
+    every=app.config['VALIDATION_CHECKPOINT_CASES'],
+    interval=app.config['VALIDATION_CHECKPOINT_SECONDS'])
+  interrupted = lease_lost = False
   try:
     device = validation.device
-    device_model_data = device.get_model_data()
-    for suitecase in validation.suite.cases:
+    device_model_data = device.get_model_data(validation.suite.requirements)
+    _index_config(device, device_model_data)
+    memo = dict()
+    cases = list()
+    case_info = dict()
+    suitecases = validation.suite.cases
+    total = len(suitecases) or 1
+    for suitecase in suitecases:
       seq = str(suitecase.sequence)
-      case = suitecase.case
-      result = case.run(json.dumps(device_model_data))
+      if seq in checkpoint.written:
+        continue
+      parameters = suitecase.case.get_parameters(device_model_data)
+      if seq in previous and fingerprint.is_unchanged(suitecase.case, parameters,
+          device_model_data, previous_fingerprints.get(seq), memo):
+        results[seq] = previous[seq]
+        fingerprints[seq] = previous_fingerprints[seq]
+        continue
+      cases.append((seq, suitecase.case.function, parameters, plans.get_plan(suitecase.case, parameters)))
+      case_info[seq] = (suitecase.case, parameters)
+    progress = min(len(results) * 100 // total, 99)
+    _publish_progress(user_id, progress)
+    for seq, result, reads in run_cases(device_model_data, cases,
+        pool_size=app.config['VALIDATION_POOL_SIZE'],
+        timeout=app.config['VALIDATION_CASE_TIMEOUT']):
+      if heartbeat.lost.is_set():
+        # Someone else holds the validation now; leave the run to them.
+        app.logger.warning(f'Job {owner} lost the lease of validation {validation.id}')
+        interrupted = lease_lost = True
+        db.session.rollback()
+        return
       if seq not in results:
         results[seq] = result
+        entry = fingerprint.make_entry(*case_info[seq], device_model_data, reads, memo)
+        if entry is not None:
+          fingerprints[seq] = entry
       else:
         results[seq].update(result)
-      #print(f'# DEBUG: seq <{seq}> result: {result} results: {results}')
-    validation.data = json.dumps(validation_data)
+        fingerprints.pop(seq, None)
+      if checkpoint.due():
+        checkpoint.save(results, fingerprints)
+      done = min(len(results) * 100 // total, 99)
+      if done > progress:
+        progress = done
+        _publish_progress(user_id, progress)
+    checkpoint.save(results, fingerprints)
+    run.status = 'complete'
+  except JobTimeoutException:
+    # Keep the run 'running': RQ retries the job, which resumes from here.
+    interrupted = True
+    db.session.rollback()
+    checkpoint.save(results, fingerprints)
+    raise
   except Exception:
-    _set_task_progress(100)
+    db.session.rollback()
+    run.status = 'failed'
     app.logger.error('Unhandled exception', exc_info=sys.exc_info())
   finally:
-    validation.running = False
-    db.session.commit()
-    _set_task_progress(100)
-
+    if not interrupted:
+      run.finished = time.time()
+      db.session.commit()
+      _finish_validation(validation)
+      leases.release(validation.id, owner)
+    if not interrupted or lease_lost:
+      # A lost lease leaves the run to its new owner, but this job's task
+      # is done all the same.
+      _set_task_progress(100)
+      _start_next_in_group()
@@ -1 +1 @@
-from .model import model_name, requires, provides, usage, process
+from .model import model_name, model_version, accepts_context, requires, provides, usage, process
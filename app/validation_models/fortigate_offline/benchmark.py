@@ -0,0 +1,157 @@
+import json
+import shlex
+import time
+
+from .model import get_context, set_value
+from .parser import parse
+
+
+def legacy_parse(lines):
+  '''Reference parser: the shlex based implementation the model used to ship.'''
+  fgt_cli_configuration = dict()
+  admin_accounts = dict()
+  interfaces = dict()
+  config_lines = list()
+  config_hier = dict()
+
+  fgt_cli_configuration['admin_accounts'] = admin_accounts
+  fgt_cli_configuration['interfaces'] = interfaces
+  fgt_cli_configuration['config'] = config_lines
+  fgt_cli_configuration['hierarchy'] = config_hier
+
+  file = [ line.strip('\n') for line in lines ]
+
+  quoted_newline = ''
+  for line in file:
+    if quoted_newline:
+      line = f'{quoted_newline}\\n{line}'
+    if line.count('"') % 2:
+      quoted_newline = line
+      continue
+    else:
+      quoted_newline = ""
+      config_lines.append(line)
+  if quoted_newline:
+    config_lines.append(quoted_newline)
+
+  hier = list()
+  context = config_hier
+  for line in config_lines:
+    if not line:
+      continue
+    if not line.strip():
+      continue
+    if line.startswith('#config-version'):
+      fgt_cli_configuration['fw_version'] = line.split('-')[2]
+      continue
+    tokens = shlex.split(line, posix=False)
+    act, params = tokens[0], tokens[1:]
+    if act == 'end':
+      hier.pop()
+      context = get_context(config_hier, hier)
+    elif act == 'next':
+      hier.pop()
+      context = get_context(config_hier, hier)
+    elif act == 'config':
+      hier.append(line.lstrip())
+      context = get_context(config_hier, hier)
+    elif act == 'edit':
+      hier.append(line.lstrip())
+      context = get_context(config_hier, hier)
+    elif act == 'set':
+      set_value(context, params[0], ' '.join(params[1:]))
+
+  for edit_intf, ctx in config_hier['config system interface'].items():
+    interface = shlex.split(edit_intf)[-1]
+    interfaces[interface] = json.dumps(ctx)
+
+  for edit_admin, ctx in config_hier['config system admin'].items():
+    username = shlex.split(edit_admin)[-1]
+    admin_accounts[username] = json.dumps(ctx)
+
+  return fgt_cli_configuration
+
+
+def synthetic_config(policies=10000, addresses=20000):
+  '''Build a FortiGate style backup of roughly the size of a large site.'''
+  lines = [
+    '#config-version=FGT60F-7.2.8-FW-build1639-240313:opmode=0:vdom=0:user=admin\n',
+    '#conf_file_ver=1\n',
+    'config system global\n',
+    '    set admintimeout 5\n',
+    '    set hostname "bench-fgt"\n',
+    'end\n',
+    'config system admin\n',
+    '    edit "admin"\n',
+    '        set accprofile "super_admin"\n',
+    '        set comments "line one\n',
+    'line two"\n',
+    '    next\n',
+    'end\n',
+    'config system interface\n',
+  ]
+  for i in range(1, 9):
+    lines += [
+      f'    edit "port{i}"\n',
+      '        set vdom "root"\n',
+      f'        set ip 10.{i}.0.1 255.255.255.0\n',
+      '        set allowaccess ping https ssh\n',
+      '    next\n',
+    ]
+  lines.append('end\n')
+  lines.append('config firewall address\n')
+  for i in range(addresses):
+    lines += [
+      f'    edit "host-{i}"\n',
+      f'        set uuid 8e4a7c3a-{i:04x}-51ee-2c1b-9f1e6a3d{i:04x}\n',
+      f'        set subnet 10.{(i >> 8) & 255}.{i & 255}.1 255.255.255.255\n',
+      '    next\n',
+    ]
+  lines.append('end\n')
+  lines.append('config firewall policy\n')
+  for i in range(1, policies + 1):
+    lines += [
+      f'    edit {i}\n',
+      f'        set name "policy {i}"\n',
+      '        set srcintf "port1"\n',
+      '        set dstintf "port2"\n',
+      '        set action accept\n',
+      f'        set srcaddr "host-{i % addresses}" "host-{(i + 1) % addresses}"\n',
+      '        set dstaddr "all"\n',
+      '        set schedule "always"\n',
+      '        set service "ALL"\n',
+      '        set logtraffic all\n',
+      '    next\n',
+    ]
+  lines.append('end\n')
+  return lines
+
+
+def _time(func, lines, repeat):
+  best = None
+  result = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func(lines)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best, result
+
+
+def run_benchmark(lines, repeat=3):
+  '''Time both parsers over `lines` and check that they agree.'''
+  lines = list(lines)
+  legacy_time, legacy_result = _time(legacy_parse, lines, repeat)
+  stream_time, stream_result = _time(parse, lines, repeat)
+  # The entry index is new with the streaming parser.
+  stream_result = dict(stream_result)
+  stream_result.pop('index', None)
+  return {
+    'lines': len(lines),
+    'legacy_seconds': legacy_time,
+    'legacy_lines_per_sec': len(lines) / legacy_time if legacy_time else 0,
+    'stream_seconds': stream_time,
+    'stream_lines_per_sec': len(lines) / stream_time if stream_time else 0,
+    'speedup': legacy_time / stream_time if stream_time else 0,
+    'identical': legacy_result == stream_result,
+  }
@@ -1,7 +1,10 @@
 import json
-import shlex
+
+from .parser import parse
 
 model_name = 'fortigate_offline'
+model_version = '2'
+accepts_context = True
 
 
 usage = '''model: fortigate_offline
@@ -82,72 +85,9 @@ def set_value(ctx, key, val):
 
 
 def _process(data):
-  data = json.loads(data)
-  fgt_cli_configuration = dict()
-  admin_accounts = dict()
-  interfaces = dict()
-  config_lines = list()
-  config_hier = dict()
-
-  fgt_cli_configuration['admin_accounts'] = admin_accounts
-  fgt_cli_configuration['interfaces'] = interfaces
-  fgt_cli_configuration['config'] = config_lines
-  fgt_cli_configuration['hierarchy'] = config_hier
-
-  file = [ line.strip('\n') for line in data['filedata:filename'] ]
-
-
-  quoted_newline = ''
-  for line in file:
-    if quoted_newline:
-      line = f'{quoted_newline}\\n{line}'
-    if line.count('"') % 2:
-      quoted_newline = line
-      continue
-    else:
-      quoted_newline = ""
-      config_lines.append(line)
-  if quoted_newline:
-    config_lines.append(quoted_newline)
-
-  hier = list()
-  context = fgt_cli_configuration['hierarchy']
-  fw_version = ''
-  for line in config_lines:
-    if not line:
-      continue
-    if not line.strip():
-      continue
-    if line.startswith('#config-version'):
-      fgt_cli_configuration['fw_version'] = line.split('-')[2]
-      continue
-    tokens = shlex.split(line, posix=False)
-    act, params = tokens[0], tokens[1:]
-    if act == 'end':
-      hier.pop()
-      context = get_context(config_hier, hier)
-    elif act == 'next':
-      hier.pop()
-      context = get_context(config_hier, hier)
-    elif act == 'config':
-      hier.append(line.lstrip())
-      context = get_context(config_hier, hier)
-    elif act == 'edit':
-      hier.append(line.lstrip())
-      context = get_context(config_hier, hier)
-    elif act == 'set':
-      config_key = '|'.join(hier) + f'|{act} {params[0]}'
-      config_value = ' '.join(params[1:])
-      set_value(context, params[0], config_value)
-
-  for edit_intf, ctx in fgt_cli_configuration['hierarchy']['config system interface'].items():
-    interface = shlex.split(edit_intf)[-1]
-    fgt_cli_configuration['interfaces'][interface] = json.dumps(ctx)
-
-  for edit_admin, ctx in fgt_cli_configuration['hierarchy']['config system admin'].items():
-    username = shlex.split(edit_admin)[-1]
-    fgt_cli_configuration['admin_accounts'][username] = json.dumps(ctx)
-
+  if isinstance(data, str):
+    data = json.loads(data)
+  fgt_cli_configuration = parse(data['filedata:filename'])
   return [
     ('fgt_cli_configuration', fgt_cli_configuration)
   ]
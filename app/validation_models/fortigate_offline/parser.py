@@ -0,0 +1,124 @@
+import json
+import re
+import shlex
+
+
+# Mirrors shlex.split(line, posix=False): a token is either a quoted string
+# (which ends at its closing quote) or a run of non-whitespace that may carry
+# quotes inside it.  A lone quote character means the quote was never closed.
+_token_re = re.compile(r'''"[^"]*"|'[^']*'|[^ \t\r\n"'][^ \t\r\n]*|["']''')
+_tokenize = _token_re.findall
+
+
+def tokenize(line):
+  tokens = _tokenize(line)
+  for token in tokens:
+    if token == '"' or token == "'":
+      raise ValueError('No closing quotation')
+  return tokens
+
+
+def iter_logical_lines(lines):
+  '''Yield config lines, joining values whose quotes span several lines.
+
+  A line with an odd number of double quotes is continued on the next line;
+  the pieces are joined with a literal "\\n", as FortiOS shows them.
+  '''
+  pending = None
+  for line in lines:
+    line = line.strip('\n')
+    if pending is not None:
+      line = f'{pending}\\n{line}'
+    if line.count('"') % 2:
+      pending = line
+      continue
+    pending = None
+    yield line
+  if pending is not None:
+    yield pending
+
+
+def entry_name(entry):
+  '''Name of an `edit` entry with its quotes removed, or None.'''
+  if not entry.startswith('edit '):
+    return None
+  name = entry[5:]
+  if len(name) >= 2 and name[0] == '"' and name[-1] == '"':
+    name = name[1:-1]
+  return name
+
+
+def build_index(config_hier):
+  '''Index the entries of every top-level table by name.
+
+  Maps table -> name -> [[ordinal, entry], ...], where `entry` is the key in
+  the table (`edit 1`, `edit "name"`) and `ordinal` its position, so callers
+  can keep the table order. Quoted and unquoted names share one key.
+  '''
+  index = dict()
+  for table, entries in config_hier.items():
+    if not isinstance(entries, dict):
+      continue
+    table_index = dict()
+    for ordinal, entry in enumerate(entries):
+      name = entry_name(entry)
+      if name is not None:
+        table_index.setdefault(name, list()).append([ordinal, entry])
+    if table_index:
+      index[table] = table_index
+  return index
+
+
+def parse(lines):
+  '''Parse FortiGate CLI configuration in a single pass.
+
+  `lines` may be any iterable of lines, including an open file.  The current
+  position in the hierarchy is kept on an explicit stack of contexts, so
+  `end`/`next` return to the parent without walking down from the root.
+  '''
+  fgt_cli_configuration = dict()
+  admin_accounts = dict()
+  interfaces = dict()
+  config_lines = list()
+  config_hier = dict()
+
+  fgt_cli_configuration['admin_accounts'] = admin_accounts
+  fgt_cli_configuration['interfaces'] = interfaces
+  fgt_cli_configuration['config'] = config_lines
+  fgt_cli_configuration['hierarchy'] = config_hier
+
+  stack = list()
+  context = config_hier
+  for line in iter_logical_lines(lines):
+    config_lines.append(line)
+    if not line.strip():
+      continue
+    if line.startswith('#config-version'):
+      fgt_cli_configuration['fw_version'] = line.split('-')[2]
+      continue
+    tokens = tokenize(line)
+    act = tokens[0]
+    if act == 'set':
+      context[tokens[1]] = ' '.join(tokens[2:])
+    elif act == 'config' or act == 'edit':
+      stack.append(context)
+      context = context.setdefault(line.lstrip(), dict())
+    elif act == 'end' or act == 'next':
+      context = stack.pop()
+
+  for edit_intf, ctx in config_hier['config system interface'].items():
+    interface = shlex.split(edit_intf)[-1]
+    interfaces[interface] = json.dumps(ctx)
+
+  for edit_admin, ctx in config_hier['config system admin'].items():
+    username = shlex.split(edit_admin)[-1]
+    admin_accounts[username] = json.dumps(ctx)
+
+  fgt_cli_configuration['index'] = build_index(config_hier)
+
+  return fgt_cli_configuration
+
+
+def parse_file(fname):
+  with open(fname, 'r') as f:
+    return parse(f)
@@ -0,0 +1 @@
+from .model import model_name, model_version, accepts_context, requires, provides, usage, process, fetch, fetch_many
@@ -0,0 +1,141 @@
+import http.client
+import json
+import ssl
+import threading
+
+from contextlib import contextmanager
+from flask import current_app
+
+
+STATUS_PATH = '/api/v2/monitor/system/status'
+BACKUP_PATH = '/api/v2/monitor/system/config/backup?scope=global'
+
+# (host, port) -> HostPool
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+class APIError(Exception):
+  def __init__(self, status, reason, path):
+    super().__init__(f'{path}: HTTP {status} {reason}')
+    self.status = status
+
+
+def ssl_context():
+  if not current_app.config['FORTIGATE_ONLINE_VERIFY_TLS']:
+    return ssl._create_unverified_context()
+  return ssl.create_default_context(cafile=current_app.config['FORTIGATE_ONLINE_CA_FILE'])
+
+
+class HostPool:
+  '''Keep-alive HTTPS connections to one FortiGate.
+
+  At most `size` requests are in flight at once; idle connections are kept
+  and reused by the next request instead of opening a new TLS session.
+  '''
+
+  def __init__(self, host, port, size, timeout, context):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self.context = context
+    self._slots = threading.BoundedSemaphore(size)
+    self._idle = list()
+    self._lock = threading.Lock()
+
+  def _connect(self):
+    return http.client.HTTPSConnection(self.host, self.port,
+      timeout=self.timeout, context=self.context)
+
+  @contextmanager
+  def connection(self, fresh=False):
+    with self._slots:
+      with self._lock:
+        conn = self._idle.pop() if self._idle and not fresh else None
+      reused = conn is not None
+      if conn is None:
+        conn = self._connect()
+      try:
+        yield conn, reused
+      except BaseException:
+        conn.close()
+        raise
+      with self._lock:
+        self._idle.append(conn)
+
+  def request(self, path, headers):
+    '''GET `path`, returning (status, headers, body).
+
+    A reused connection the device has meanwhile closed is retried once on
+    a fresh one.
+    '''
+    fresh = False
+    while True:
+      try:
+        with self.connection(fresh) as (conn, reused):
+          conn.request('GET', path, headers=headers)
+          response = conn.getresponse()
+          body = response.read()
+          return response.status, { k.lower(): v for k, v in response.getheaders() }, body
+      except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        if not reused:
+          raise
+        fresh = True
+
+  def close(self):
+    with self._lock:
+      idle, self._idle = self._idle, list()
+    for conn in idle:
+      conn.close()
+
+
+def get_pool(host, port):
+  key = (host, int(port))
+  with _pools_lock:
+    pool = _pools.get(key)
+    if pool is None:
+      pool = HostPool(host, int(port),
+        size=current_app.config['FORTIGATE_ONLINE_POOL_SIZE'],
+        timeout=current_app.config['FORTIGATE_ONLINE_TIMEOUT'],
+        context=ssl_context())
+      _pools[key] = pool
+  return pool
+
+
+def close_pools():
+  with _pools_lock:
+    pools = list(_pools.values())
+    _pools.clear()
+  for pool in pools:
+    pool.close()
+
+
+def _headers(token, etag=None):
+  headers = {
+    'Authorization': f'Bearer {token}',
+    'Accept': 'application/json',
+  }
+  if etag:
+    headers['If-None-Match'] = etag
+  return headers
+
+
+def get_status(pool, token):
+  status, headers, body = pool.request(STATUS_PATH, _headers(token))
+  if status != 200:
+    raise APIError(status, 'status request failed', STATUS_PATH)
+  return json.loads(body)
+
+
+def get_config(pool, token, etag=None):
+  '''Download the running configuration.
+
+  Returns (body, etag). `body` is None if the device answered 304 Not
+  Modified to the `etag` of the copy we already have.
+  '''
+  status, headers, body = pool.request(BACKUP_PATH, _headers(token, etag))
+  if status == 304:
+    return None, etag
+  if status != 200:
+    raise APIError(status, 'config backup failed', BACKUP_PATH)
+  return body, headers.get('etag')
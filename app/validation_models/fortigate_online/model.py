@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+from . import client
+
+model_name = 'fortigate_online'
+model_version = '1'
+accepts_context = True
+
+
+usage = '''model: fortigate_online
+
+requires: <device> "device" (hostname and HTTPS port of the device)
+requires: <secret> "api_token" - FortiOS REST API token
+
+provides: <json> "fgt_cli_configuration"
+provides: <json> "fgt_system_status"
+
+The running configuration is downloaded from the FortiOS REST API and
+parsed like an uploaded backup (see fortigate_offline). A copy is kept with
+its ETag, so a configuration the device reports as unchanged is not
+downloaded again.
+
+'''
+
+def requires():
+  return [
+    ('device', 'device'),
+    ('secret', 'api_token'),
+  ]
+
+def provides():
+  return [
+    ('json', 'fgt_cli_configuration'),
+    ('json', 'fgt_system_status'),
+  ]
+
+
+def cache_path():
+  path = current_app.config['FORTIGATE_ONLINE_CACHE_PATH']
+  path.mkdir(parents=True, exist_ok=True)
+  return path
+
+
+def _cache_files(host, port):
+  name = hashlib.sha256(f'{host}:{port}'.encode()).hexdigest()[:32]
+  path = cache_path()
+  return path / f'{name}.conf', path / f'{name}.json'
+
+
+def _write(fname, data):
+  fd, tmp = tempfile.mkstemp(dir=fname.parent, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.replace(tmp, fname)
+  except OSError:
+    try:
+      os.unlink(tmp)
+    except OSError:
+      pass
+    raise
+
+
+def fetch(device, token):
+  '''Bring the local copy of a device's configuration up to date.
+
+  Returns (config file name, system status). The configuration is only
+  downloaded when the device does not confirm our copy's ETag.
+  '''
+  host, port = device['hostname'], device['https_port']
+  pool = client.get_pool(host, port)
+  conf_file, meta_file = _cache_files(host, port)
+  try:
+    with open(meta_file, 'r') as f:
+      meta = json.load(f)
+  except (OSError, ValueError):
+    meta = dict()
+  etag = meta.get('etag') if conf_file.exists() else None
+  status = client.get_status(pool, token)
+  body, etag = client.get_config(pool, token, etag)
+  if body is not None:
+    _write(conf_file, body)
+    _write(meta_file, json.dumps({'etag': etag}).encode())
+  return conf_file, status
+
+
+def fetch_many(targets, max_workers=None):
+  '''Fetch several devices at once. `targets` is a list of (device, token).
+
+  Returns a list of (config file name, status) or the exception raised,
+  in the order of `targets`.
+  '''
+  if max_workers is None:
+    max_workers = current_app.config['FORTIGATE_ONLINE_WORKERS']
+  app = current_app._get_current_object()
+
+  def fetch_in_app(device, token):
+    with app.app_context():
+      try:
+        return fetch(device, token)
+      except Exception as e:
+        return e
+
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets) or 1))) as executor:
+    return list(executor.map(lambda target: fetch_in_app(*target), targets))
+
+
+def process(data):
+  from app.model_graph import run_model
+  from app.validation_models import fortigate_offline
+  if isinstance(data, str):
+    data = json.loads(data)
+  try:
+    conf_file, status = fetch(data['device'], data['api_token'])
+  except Exception:
+    current_app.logger.error('Unable to fetch configuration from %s',
+      data.get('device', dict()).get('hostname'), exc_info=True)
+    return [('fgt_cli_configuration', dict()), ('fgt_system_status', dict())]
+  parsed = run_model(fortigate_offline, {
+    'filename': str(conf_file),
+    'type:filename': 'file',
+  }, dict())
+  return [
+    ('fgt_cli_configuration', parsed['fgt_cli_configuration']),
+    ('fgt_system_status', status.get('results', status)),
+  ]
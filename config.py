@@ -27,6 +27,66 @@ class Config:
 
   DEFAULT_SSH_PORT = 22
   DEFAULT_HTTPS_PORT = 443
+
+  MODEL_GRAPH_WORKERS = int(os.environ.get('MODEL_GRAPH_WORKERS') or 4)
+  # Cases of a run are evaluated by VALIDATION_POOL_SIZE forked workers; a
+  # case running longer than VALIDATION_CASE_TIMEOUT seconds fails and its
+  # worker is replaced.
+  VALIDATION_POOL_SIZE = int(os.environ.get('VALIDATION_POOL_SIZE') or 1)
+  VALIDATION_CASE_TIMEOUT = int(os.environ.get('VALIDATION_CASE_TIMEOUT') or 300)
+  VALIDATION_CHECKPOINT_CASES = int(os.environ.get('VALIDATION_CHECKPOINT_CASES') or 50)
+  VALIDATION_CHECKPOINT_SECONDS = float(os.environ.get('VALIDATION_CHECKPOINT_SECONDS') or 30)
+  VALIDATION_STUCK_AFTER = float(os.environ.get('VALIDATION_STUCK_AFTER') or 900)
+  VALIDATION_MAX_ATTEMPTS = int(os.environ.get('VALIDATION_MAX_ATTEMPTS') or 3)
+  VALIDATION_LEASE_TTL = int(os.environ.get('VALIDATION_LEASE_TTL') or 60)
+  VALIDATION_LEASE_QUEUED_TTL = int(os.environ.get('VALIDATION_LEASE_QUEUED_TTL') or 3600)
+  PLAN_CACHE_SIZE = int(os.environ.get('PLAN_CACHE_SIZE') or 1024)
+
+  # Worker processes started per queue by `flask workers`.
+  TASK_WORKERS = os.environ.get('TASK_WORKERS') or 'interactive=2,bulk=2,maintenance=1'
+  USER_MAX_ACTIVE_TASKS = int(os.environ.get('USER_MAX_ACTIVE_TASKS') or 10)
+  DEVICE_MAX_ACTIVE_RUNS = int(os.environ.get('DEVICE_MAX_ACTIVE_RUNS') or 2)
+
+  # Scheduled revalidation: every REVALIDATION_INTERVAL seconds (0: off),
+  # spread over REVALIDATION_WINDOW seconds starting REVALIDATION_WINDOW_START
+  # seconds into each interval (UTC, counted from the Unix epoch).
+  REVALIDATION_INTERVAL = int(os.environ.get('REVALIDATION_INTERVAL') or 0)
+  REVALIDATION_WINDOW_START = int(os.environ.get('REVALIDATION_WINDOW_START') or 2 * 3600)
+  REVALIDATION_WINDOW = int(os.environ.get('REVALIDATION_WINDOW') or 4 * 3600)
+  REVALIDATION_JITTER = float(os.environ.get('REVALIDATION_JITTER') or 0.5)
+  REVALIDATION_CONCURRENCY = int(os.environ.get('REVALIDATION_CONCURRENCY') or 10)
+  REVALIDATION_RETRY = int(os.environ.get('REVALIDATION_RETRY') or 300)
+  REVALIDATION_USERNAME = os.environ.get('REVALIDATION_USERNAME') or None
+  SCHEDULER_TICK = int(os.environ.get('SCHEDULER_TICK') or 30)
+  SCHEDULER_SYNC_INTERVAL = int(os.environ.get('SCHEDULER_SYNC_INTERVAL') or 300)
+
+  CONFIG_INDEX_MAX_VALUE = int(os.environ.get('CONFIG_INDEX_MAX_VALUE') or 512)
+  CONFIG_SEARCH_MAX_MATCHES = int(os.environ.get('CONFIG_SEARCH_MAX_MATCHES') or 1000)
+
+  FLEET_CONCURRENCY = int(os.environ.get('FLEET_CONCURRENCY') or 20)
+  FLEET_ENQUEUE_BATCH = int(os.environ.get('FLEET_ENQUEUE_BATCH') or 100)
+
+  REACHABILITY_CONCURRENCY = int(os.environ.get('REACHABILITY_CONCURRENCY') or 256)
+  REACHABILITY_TIMEOUT = float(os.environ.get('REACHABILITY_TIMEOUT') or 2)
+  REACHABILITY_CACHE_TTL = float(os.environ.get('REACHABILITY_CACHE_TTL') or 30)
+
+  IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 1024)
+  IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 60)
+  IDENTITY_CACHE_LOCAL_TTL = float(os.environ.get('IDENTITY_CACHE_LOCAL_TTL') or 5)
+
+  TASK_PROGRESS_TTL = int(os.environ.get('TASK_PROGRESS_TTL') or 24 * 3600)
+  EVENTS_STREAM_DURATION = int(os.environ.get('EVENTS_STREAM_DURATION') or 300)
+  EVENTS_HEARTBEAT = int(os.environ.get('EVENTS_HEARTBEAT') or 15)
+
+  FORTIGATE_ONLINE_POOL_SIZE = int(os.environ.get('FORTIGATE_ONLINE_POOL_SIZE') or 4)
+  FORTIGATE_ONLINE_TIMEOUT = float(os.environ.get('FORTIGATE_ONLINE_TIMEOUT') or 30)
+  FORTIGATE_ONLINE_WORKERS = int(os.environ.get('FORTIGATE_ONLINE_WORKERS') or 16)
+  FORTIGATE_ONLINE_VERIFY_TLS = os.environ.get('FORTIGATE_ONLINE_VERIFY_TLS', '1') != '0'
+  FORTIGATE_ONLINE_CA_FILE = os.environ.get('FORTIGATE_ONLINE_CA_FILE') or None
   
   UPLOAD_PATH = Path(os.environ.get('UPLOAD_PATH', 'uploads'))
+  PARSE_CACHE_PATH = Path(os.environ.get('PARSE_CACHE_PATH') or UPLOAD_PATH / 'parse_cache')
+  PARSE_CACHE_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+  FORTIGATE_ONLINE_CACHE_PATH = Path(os.environ.get('FORTIGATE_ONLINE_CACHE_PATH') or UPLOAD_PATH / 'online_cache')
+  CONFIG_STORE_PATH = Path(os.environ.get('CONFIG_STORE_PATH') or UPLOAD_PATH / 'config_store')
   
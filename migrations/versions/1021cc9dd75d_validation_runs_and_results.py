@@ -0,0 +1,172 @@
+"""validation runs and results
+
+Revision ID: 1021cc9dd75d
+Revises: cb04d60a702c
+Create Date: 2026-10-17 17:57:53.570395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = '1021cc9dd75d'
+down_revision = 'cb04d60a702c'
+branch_labels = None
+depends_on = None
+
+
+# As app.models.NO_CHECKS: the row of a case that returned no checks.
+NO_CHECKS = ''
+
+device_validation = sa.table('device_validation',
+    sa.column('id', sa.Integer),
+    sa.column('data', sa.Text),
+    sa.column('timestamp', sa.Float),
+)
+
+validation_run = sa.Table('validation_run', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('validation_id', sa.Integer),
+    sa.Column('status', sa.String),
+    sa.Column('started', sa.Float),
+    sa.Column('finished', sa.Float),
+)
+
+validation_result = sa.table('validation_result',
+    sa.column('id', sa.Integer),
+    sa.column('validation_id', sa.Integer),
+    sa.column('run_id', sa.Integer),
+    sa.column('sequence', sa.Integer),
+    sa.column('check', sa.Text),
+    sa.column('status', sa.Boolean),
+)
+
+
+def load_data(raw):
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_results():
+    """Move results and history out of the DeviceValidation.data blobs.
+
+    Every history entry, and then the current results, becomes one complete
+    ValidationRun. The blob keeps its other keys (fingerprints).
+    """
+    conn = op.get_bind()
+    ids = conn.execute(sa.select(device_validation.c.id)).scalars().all()
+    for validation_id in ids:
+        raw, timestamp = conn.execute(
+            sa.select(device_validation.c.data, device_validation.c.timestamp)
+            .where(device_validation.c.id == validation_id)).one()
+        data = load_data(raw)
+        if not isinstance(data, dict):
+            continue
+        runs = list(data.pop('history', None) or list())
+        if 'results' in data:
+            runs.append(data.pop('results'))
+        for results in runs:
+            run_id = conn.execute(sa.insert(validation_run).values(
+                validation_id=validation_id, status='complete',
+                started=timestamp or 0.0, finished=None)).inserted_primary_key[0]
+            rows = [
+                dict(validation_id=validation_id, run_id=run_id, sequence=int(sequence),
+                    check=str(check), status=bool(status))
+                for sequence, checks in (results or dict()).items()
+                if isinstance(checks, dict) and str(sequence).isdigit()
+                for check, status in (checks.items() if checks else [ (NO_CHECKS, True) ])
+            ]
+            if rows:
+                conn.execute(sa.insert(validation_result), rows)
+        conn.execute(sa.update(device_validation)
+            .where(device_validation.c.id == validation_id)
+            .values(data=json.dumps(data)))
+
+
+def restore_results():
+    """Write the recorded runs back into the DeviceValidation.data blobs."""
+    conn = op.get_bind()
+    ids = conn.execute(sa.select(device_validation.c.id)).scalars().all()
+    for validation_id in ids:
+        raw = conn.execute(sa.select(device_validation.c.data)
+            .where(device_validation.c.id == validation_id)).scalar()
+        data = load_data(raw)
+        if not isinstance(data, dict):
+            data = dict()
+        runs = list()
+        run_ids = conn.execute(sa.select(validation_run.c.id)
+            .where(validation_run.c.validation_id == validation_id,
+                validation_run.c.status == 'complete')
+            .order_by(validation_run.c.id)).scalars().all()
+        for run_id in run_ids:
+            results = dict()
+            for sequence, check, status in conn.execute(
+                    sa.select(validation_result.c.sequence, validation_result.c.check,
+                        validation_result.c.status)
+                    .where(validation_result.c.run_id == run_id)
+                    .order_by(validation_result.c.id)):
+                checks = results.setdefault(str(sequence), dict())
+                if check != NO_CHECKS:
+                    checks[check] = bool(status)
+            runs.append(results)
+        if runs:
+            data['results'] = runs.pop()
+        data['history'] = runs
+        conn.execute(sa.update(device_validation)
+            .where(device_validation.c.id == validation_id)
+            .values(data=json.dumps(data)))
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('validation_run',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('validation_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('started', sa.Float(), nullable=False),
+    sa.Column('finished', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['validation_id'], ['device_validation.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('validation_run', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_validation_run_started'), ['started'], unique=False)
+        batch_op.create_index(batch_op.f('ix_validation_run_validation_id'), ['validation_id'], unique=False)
+
+    op.create_table('validation_result',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('validation_id', sa.Integer(), nullable=False),
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('sequence', sa.Integer(), nullable=False),
+    sa.Column('check', sa.Text(), nullable=False),
+    sa.Column('status', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['run_id'], ['validation_run.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['validation_id'], ['device_validation.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('validation_result', schema=None) as batch_op:
+        batch_op.create_index('ix_validation_result_validation_run_sequence', ['validation_id', 'run_id', 'sequence'], unique=False)
+
+    # ### end Alembic commands ###
+
+    backfill_results()
+
+
+def downgrade():
+    restore_results()
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('validation_result', schema=None) as batch_op:
+        batch_op.drop_index('ix_validation_result_validation_run_sequence')
+
+    op.drop_table('validation_result')
+    with op.batch_alter_table('validation_run', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_validation_run_validation_id'))
+        batch_op.drop_index(batch_op.f('ix_validation_run_started'))
+
+    op.drop_table('validation_run')
+    # ### end Alembic commands ###
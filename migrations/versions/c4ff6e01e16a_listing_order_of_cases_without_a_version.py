@@ -0,0 +1,30 @@
+"""listing order of cases without a version
+
+Revision ID: c4ff6e01e16a
+Revises: 5a6b44c45862
+Create Date: 2026-10-17 18:37:37.956585
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4ff6e01e16a'
+down_revision = '5a6b44c45862'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cases are listed by COALESCE(version, ''), since a NULL version
+    # cannot be used as a keyset.
+    op.drop_index('ix_test_case_archived_name_version_id', table_name='test_case')
+    op.create_index('ix_test_case_archived_name_version_id', 'test_case',
+        ['archived', 'name', sa.text("coalesce(version, '')"), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_test_case_archived_name_version_id', table_name='test_case')
+    op.create_index('ix_test_case_archived_name_version_id', 'test_case',
+        ['archived', 'name', 'version', 'id'], unique=False)
@@ -0,0 +1,47 @@
+"""mask secrets in the configuration index
+
+Revision ID: ea5fde837167
+Revises: f6184f235e73
+Create Date: 2026-10-17 18:44:26.054596
+
+"""
+from alembic import op
+import re
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ea5fde837167'
+down_revision = 'f6184f235e73'
+branch_labels = None
+depends_on = None
+
+# As in app.config_index at this revision.
+SECRET_KEY = re.compile(r'passw|passphrase|secret|pwd|psk|(^|-)key(-string)?$')
+SECRET_VALUE = re.compile(r'^ENC ')
+BATCH = 300
+
+config_term = sa.table('config_term',
+    sa.column('id', sa.Integer), sa.column('key', sa.String), sa.column('value', sa.String))
+config_posting = sa.table('config_posting', sa.column('term_id', sa.Integer))
+device = sa.table('device', sa.column('config_digest', sa.String))
+
+
+def upgrade():
+    # Drop the secrets indexed so far, and forget every device's digest so
+    # the next update indexes its settings again, masked.
+    bind = op.get_bind()
+    secret = [
+        term_id for term_id, key, value
+        in bind.execute(sa.select(config_term.c.id, config_term.c.key, config_term.c.value))
+        if SECRET_KEY.search(key) or SECRET_VALUE.match(value)
+    ]
+    for i in range(0, len(secret), BATCH):
+        batch = secret[i:i + BATCH]
+        bind.execute(config_posting.delete().where(config_posting.c.term_id.in_(batch)))
+        bind.execute(config_term.delete().where(config_term.c.id.in_(batch)))
+    bind.execute(device.update().values(config_digest=None))
+
+
+def downgrade():
+    pass
@@ -0,0 +1,55 @@
+import datetime
+import ipaddress
+
+import pytest
+
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+  from app import create_app, db
+
+  class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    UPLOAD_PATH = tmp_path / 'uploads'
+    PARSE_CACHE_PATH = UPLOAD_PATH / 'parse_cache'
+    FORTIGATE_ONLINE_CACHE_PATH = UPLOAD_PATH / 'online_cache'
+    CONFIG_STORE_PATH = UPLOAD_PATH / 'config_store'
+
+  app = create_app(TestConfig)
+  with app.app_context():
+    db.create_all()
+    yield app
+    db.session.remove()
+    db.drop_all()
+
+
+@pytest.fixture(scope='session')
+def certificate(tmp_path_factory):
+  '''Self-signed certificate for 127.0.0.1, as (certfile, keyfile).'''
+  from cryptography import x509
+  from cryptography.hazmat.primitives import hashes, serialization
+  from cryptography.hazmat.primitives.asymmetric import ec
+  from cryptography.x509.oid import NameOID
+
+  key = ec.generate_private_key(ec.SECP256R1())
+  name = x509.Name([ x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1') ])
+  now = datetime.datetime.now(datetime.timezone.utc)
+  cert = x509.CertificateBuilder() \
+    .subject_name(name).issuer_name(name) \
+    .public_key(key.public_key()) \
+    .serial_number(x509.random_serial_number()) \
+    .not_valid_before(now - datetime.timedelta(days=1)) \
+    .not_valid_after(now + datetime.timedelta(days=1)) \
+    .add_extension(x509.SubjectAlternativeName([ x509.IPAddress(ipaddress.ip_address('127.0.0.1')) ]), critical=False) \
+    .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True) \
+    .sign(key, hashes.SHA256())
+  path = tmp_path_factory.mktemp('certificate')
+  certfile, keyfile = path / 'cert.pem', path / 'key.pem'
+  certfile.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+  keyfile.write_bytes(key.private_bytes(serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+  return certfile, keyfile
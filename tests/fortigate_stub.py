@@ -0,0 +1,122 @@
+import json
+import socket
+import ssl
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+RECORDINGS = Path(__file__).parent / 'recordings' / 'fortigate_online'
+
+
+def load_recordings(path=RECORDINGS):
+  '''{request path: (status, headers, body)} of the recorded responses.'''
+  with open(path / 'index.json', 'r') as f:
+    index = json.load(f)
+  return {
+    entry['path']: (entry['status'], entry['headers'], (path / entry['body']).read_bytes())
+    for entry in index
+  }
+
+
+class _Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, format, *args):
+    pass
+
+  def do_GET(self):
+    stub = self.server.stub
+    with stub.lock:
+      stub.requests.append((self.path, dict(self.headers)))
+      hang_up = stub.hang_up > 0
+      if hang_up:
+        stub.hang_up -= 1
+    if hang_up:
+      # Like a device that dropped an idle keep-alive connection.
+      self.close_connection = True
+      self.connection.shutdown(socket.SHUT_RDWR)
+      return
+    if self.headers.get('Authorization') != f'Bearer {stub.token}':
+      return self._send(401, { 'Content-Type': 'application/json' }, b'{"status": "error"}')
+    if self.path not in stub.recordings:
+      return self._send(404, { 'Content-Type': 'application/json' }, b'{"status": "error"}')
+    status, headers, body = stub.recordings[self.path]
+    etag = headers.get('ETag')
+    if etag is not None and self.headers.get('If-None-Match') == etag:
+      return self._send(304, { 'ETag': etag }, b'')
+    self._send(status, headers, body)
+
+  def _send(self, status, headers, body):
+    self.send_response(status)
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def get_request(self):
+    sock, address = super().get_request()
+    with self.stub.lock:
+      self.stub.connections.append(sock)
+    return sock, address
+
+
+class StubFortiGate:
+  '''Local HTTPS server answering FortiOS REST API requests with recorded
+  responses, for testing the fortigate_online model without a device.
+
+  Requests must carry `token`. The configuration backup honours
+  If-None-Match like FortiOS does. `requests` and `connections` record
+  what clients did; `hang_up` closes that many upcoming requests'
+  connections without an answer.
+  '''
+
+  def __init__(self, certfile, keyfile, token='stub-token', recordings=None):
+    self.token = token
+    self.recordings = recordings if recordings is not None else load_recordings()
+    self.requests = list()
+    self.connections = list()
+    self.hang_up = 0
+    self.lock = threading.Lock()
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    self._server = _Server(('127.0.0.1', 0), _Handler)
+    self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+    self._server.stub = self
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+  @property
+  def host(self):
+    return self._server.server_address[0]
+
+  @property
+  def port(self):
+    return self._server.server_address[1]
+
+  def paths(self):
+    return [ path for path, headers in self.requests ]
+
+  def drop_connections(self):
+    '''Close every open connection from the server side.'''
+    with self.lock:
+      connections, self.connections = self.connections, list()
+    for sock in connections:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self._server.shutdown()
+    self.drop_connections()
+    self._server.server_close()
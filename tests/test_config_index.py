@@ -0,0 +1,25 @@
+from app import config_index
+
+
+HIERARCHY = {
+  'config system admin': {
+    'edit "admin"': { 'accprofile': '"super_admin"', 'password': 'ENC SH2abcdef' },
+  },
+  'config vpn ipsec phase1-interface': {
+    'edit "branch"': { 'psksecret': 'plain-text-psk', 'keepalive': '10', 'passive-mode': 'enable' },
+  },
+  'config router ospf': {
+    'config ospf-interface': { 'edit "port1"': { 'md5-keys': 'ENC abcd', 'key-string': 'k' } },
+  },
+}
+
+
+def test_secrets_are_masked(app):
+  terms = config_index.terms(HIERARCHY)
+  values = { key: value for path, key, value in terms }
+  assert values['password'] == values['psksecret'] == config_index.MASK
+  assert values['md5-keys'] == values['key-string'] == config_index.MASK
+  assert values['accprofile'] == '"super_admin"'
+  assert values['keepalive'] == '10'
+  assert values['passive-mode'] == 'enable'
+  assert not [ term for term in terms if 'ENC' in term[2] or 'psk' in term[2] ]
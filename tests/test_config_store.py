@@ -0,0 +1,54 @@
+import pytest
+
+from app import db, models, config_index, config_store
+
+
+HIERARCHIES = [
+  { 'config system global': { 'admintimeout': '5', 'hostname': '"fw1"' } },
+  { 'config system global': { 'admintimeout': '5', 'hostname': '"fw2"' } },
+  { 'config system global': { 'admintimeout': '30', 'hostname': '"fw3"' } },
+]
+
+
+@pytest.fixture
+def indexed(app, monkeypatch):
+  builds = list()
+  monkeypatch.setattr(config_index, 'schedule_store_build', lambda: builds.append(True))
+  for i, hierarchy in enumerate(HIERARCHIES):
+    device = models.Device(devicename=f'fw{i + 1}', hostname=f'192.0.2.{i + 1}', ssh_port=22, https_port=443)
+    db.session.add(device)
+    db.session.commit()
+    config_index.update(device, hierarchy)
+  return builds
+
+
+@pytest.mark.parametrize('vectorized', [ True, False ])
+def test_count(indexed, monkeypatch, vectorized):
+  if not vectorized:
+    monkeypatch.setattr(config_store, 'numpy', None)
+  assert config_store.build() == 6
+  store = config_store.open_store()
+  assert store.count('value', key='admintimeout') == [ ('5', 2), ('30', 1) ]
+  assert store.count('key', path='config system global', value='"fw', match='prefix') == [ ('hostname', 3) ]
+  assert store.count('value', key='missing') == list()
+
+
+def test_index_changes_schedule_a_build(indexed):
+  assert len(indexed) == len(HIERARCHIES)
+
+
+def test_build_leaves_other_files_alone(app, indexed):
+  app.config['CONFIG_STORE_PATH'] = app.config['UPLOAD_PATH']
+  other = app.config['UPLOAD_PATH'] / '1' / 'backup.conf'
+  other.parent.mkdir(parents=True)
+  other.write_text('config system global\nend\n')
+  config_store.build()
+  config_store.build()
+  assert other.exists()
+  generations = [ entry for entry in config_store.store_path().iterdir() if entry.is_dir() ]
+  assert len(generations) == 1
+
+
+def test_missing_generation(app, indexed):
+  (config_store.store_path() / config_store.CURRENT).write_text('generation-missing')
+  assert config_store.open_store() is None
@@ -0,0 +1,21 @@
+import json
+
+from app import events
+
+
+def test_only_notifications_have_an_id():
+  notification = events._message('unread_message_count', 3, timestamp=12.5)
+  assert events.format_event(notification).startswith('id: 12.5\n')
+  progress = events._message(events.PROGRESS_EVENT, { 'task_id': 't', 'progress': 50 }, timestamp=13.0)
+  formatted = events.format_event(progress)
+  assert not formatted.startswith('id:')
+  assert json.loads(formatted[len('data: '):])['data'] == { 'task_id': 't', 'progress': 50 }
+
+
+def test_progress_events():
+  backlog = events.progress_events({ 't1': 10, 't2': 100 })
+  assert [ (event['name'], event['data']) for event in backlog ] == [
+    (events.PROGRESS_EVENT, { 'task_id': 't1', 'progress': 10 }),
+    (events.PROGRESS_EVENT, { 'task_id': 't2', 'progress': 100 }),
+  ]
+  assert all('id:' not in events.format_event(event) for event in backlog)
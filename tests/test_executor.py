@@ -0,0 +1,58 @@
+import os
+import time
+
+import pytest
+
+from app import executor
+
+
+def fake_case(function, parameters, context, plan=None):
+  if parameters.get('hang'):
+    time.sleep(60)
+  if parameters.get('exit'):
+    os._exit(3)
+  if parameters.get('raise'):
+    raise ValueError('broken case')
+  return { 'pid': os.getpid(), 'context': context }, [ ('path',) ]
+
+
+@pytest.fixture(autouse=True)
+def cases_run_by(monkeypatch):
+  monkeypatch.setattr(executor, 'run_tracked_case', fake_case)
+
+
+def run(cases, pool_size, timeout=5):
+  return list(executor._run_unbatched('ctx', [
+    (str(i), 'fake', parameters, None) for i, parameters in enumerate(cases)
+  ], pool_size, timeout))
+
+
+@pytest.mark.parametrize('pool_size', [ 1, 3 ])
+def test_workers_are_reused(pool_size):
+  results = run([ dict() ] * 10, pool_size)
+  assert [ sequence for sequence, result, reads in results ] == [ str(i) for i in range(10) ]
+  assert all(result['context'] == 'ctx' for sequence, result, reads in results)
+  pids = set(result['pid'] for sequence, result, reads in results)
+  assert os.getpid() not in pids
+  assert len(pids) <= pool_size
+
+
+def test_hung_case_times_out_with_a_single_worker():
+  started = time.monotonic()
+  results = run([ dict(), { 'hang': True }, dict(), { 'exit': True }, dict() ], 1, timeout=1)
+  assert time.monotonic() - started < 10
+  statuses = [ result for sequence, result, reads in results ]
+  assert statuses[1] == executor.timeout_result(1)
+  assert statuses[3] == { '[ERROR: exited with code 3]': False }
+  assert results[1][2] is None
+  assert len(set(status['pid'] for status in statuses[0::2])) == 3
+
+
+def test_case_exceptions_are_raised():
+  with pytest.raises(ValueError):
+    run([ dict(), { 'raise': True } ], 2)
+
+
+def test_without_timeout_a_single_worker_runs_in_process():
+  results = run([ dict() ] * 2, 1, timeout=None)
+  assert [ result['pid'] for sequence, result, reads in results ] == [ os.getpid() ] * 2
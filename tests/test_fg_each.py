@@ -0,0 +1,124 @@
+import pytest
+
+from app.plugins.fg_each import plugin
+from app.validation_models.fortigate_offline.parser import parse
+
+
+CONFIG = '''#config-version=FGT60F-7.2.5-FW-build1517-230606:opmode=0:vdom=0:user=admin
+config system interface
+    edit "port1"
+        set ip 192.168.1.99 255.255.255.0
+    next
+end
+config system admin
+    edit "admin"
+        set accprofile "super_admin"
+        set trusthost1 10.0.0.0 255.0.0.0
+        config gui-dashboard
+            edit 1
+                set name "Status"
+            next
+        end
+    next
+    edit "guest"
+        set accprofile "prof_admin"
+    next
+end
+config firewall address
+    edit "all"
+        set subnet 0.0.0.0 0.0.0.0
+    next
+    edit "lan"
+        set subnet 192.168.1.0 255.255.255.0
+    next
+end
+config firewall policy
+    edit 1
+        set name "lan-out"
+        set action accept
+        set logtraffic all
+    next
+    edit 2
+        set name "deny"
+        set action deny
+    next
+    edit 3
+        set name "web"
+        set action accept
+        set logtraffic utm
+    next
+end
+'''
+
+
+def spec(type, setting, value, **options):
+  return dict(type=type, setting=setting, value=value, **options)
+
+
+SPECS = [
+  [ spec('policy', 'action', 'accept') ],
+  [ spec('policy', 'action', 'accept', pass_threshhold='any'),
+    spec('policy', 'action', 'deny', pass_threshhold='none'),
+    spec('policy', 'action', 'accept', pass_threshhold='1'),
+    spec('policy', 'action', 'accept', pass_threshhold='0') ],
+  [ spec('policy', 'logtraffic', 'all|utm', or_empty=True),
+    spec('policy', 'logtraffic', 'al', partial_match=True, description='partial') ],
+  [ spec('admin', 'accprofile', 'x', select='id:guest', fail_on_match=True),
+    spec('admin', 'accprofile', 'x', select='id:nobody', fail_on_match=True),
+    spec('admin', 'accprofile', 'x', select='id:"admin"', pass_on_match=True) ],
+  [ spec('policy', 'action', 'accept', select='id:2', negate_match=True),
+    spec('policy', 'action', 'accept', select='id:1|3'),
+    spec('addr', 'subnet', '0.0.0.0 0.0.0.0', select='id:lan', negate_match=True) ],
+  [ spec('bogus', 'action', 'accept'),
+    spec('policy', 'action', 'accept', select='first'),
+    spec('policy', 'action', 'deny') ],
+  [ spec('policy', 'action', 'accept'),
+    spec('usergroup', 'member', 'x'),
+    spec('policy', 'action', 'deny') ],
+  [ spec('addr', 'subnet', '0.0.0.0 0.0.0.0'),
+    spec('admin', 'config gui-dashboard', 'x'),
+    spec('policy', 'action', 'accept') ],
+  [ spec('policy', 'action', 'accept'),
+    { 'type': 'policy', 'value': 'no setting' } ],
+]
+
+
+def exceptions(output):
+  '''The exception each printed traceback ends with, in order. The frames
+  differ between the two paths; what was raised must not.'''
+  blocks = output.split('Exception in user code:\n')[1:]
+  return [ block.split('-' * 60)[1].strip().splitlines()[-1] for block in blocks ]
+
+
+@pytest.fixture(scope='module')
+def data():
+  return { 'fgt_cli_configuration': parse(CONFIG.splitlines(keepends=True)) }
+
+
+def test_batch_matches_evaluate(data, capsys):
+  plans = [ plugin.compile_plan({ 'setting_specs': specs }) for specs in SPECS ]
+  single = list()
+  single_output = list()
+  for plan in plans:
+    single.append(plugin.evaluate(plan, data))
+    single_output.append(capsys.readouterr().out)
+  batched = plugin.evaluate_batch(plans, data)
+  batched_output = capsys.readouterr().out
+  assert batched == single
+  assert exceptions(batched_output) == exceptions(''.join(single_output))
+  # Every path is exercised: thresholds, found entries and errors.
+  keys = [ key for result in single for key in result ]
+  assert any('(guest found)' in key for key in keys)
+  assert any('(user not found)' in key for key in keys)
+  assert any('[ERROR: type]' in key for key in keys)
+  assert any('[ERROR: select]' in key for key in keys)
+  assert len(exceptions(''.join(single_output))) == 3
+
+
+@pytest.mark.parametrize('specs', SPECS)
+def test_each_plan_alone(data, specs, capsys):
+  plan = plugin.compile_plan({ 'setting_specs': specs })
+  expected = plugin.evaluate(plan, data)
+  expected_output = capsys.readouterr().out
+  assert plugin.evaluate_batch([ plan ], data) == [ expected ]
+  assert exceptions(capsys.readouterr().out) == exceptions(expected_output)
@@ -0,0 +1,104 @@
+import pytest
+
+from app.validation_models.fortigate_offline import model
+from app.validation_models.fortigate_offline.benchmark import legacy_parse, synthetic_config
+from app.validation_models.fortigate_offline.parser import parse
+
+
+CONFIG = r'''#config-version=FGT60F-7.2.5-FW-build1517-230606:opmode=0:vdom=0:user=admin
+#conf_file_ver=1234567890
+config system global
+    set hostname "fw-1"
+    set admintimeout 30
+    set pre-login-banner enable
+end
+config system interface
+    edit "port1"
+        set vdom "root"
+        set ip 192.168.1.99 255.255.255.0
+        set allowaccess ping https ssh
+        set description "uplink \"primary\""
+        config ipv6
+            set ip6-mode static
+        end
+    next
+    edit "lan side"
+        set alias 'it''s'
+        set ip 10.0.0.1 255.255.255.0
+    next
+end
+config system admin
+    edit "admin"
+        set accprofile "super_admin"
+        set comments "first line
+second line with a \"quote\"
+third line"
+        config gui-dashboard
+            edit 1
+                set name "Status"
+                config widget
+                    edit 1
+                        set type sysinfo
+                    next
+                end
+            next
+        end
+    next
+    edit "ops"
+        set accprofile "prof_admin"
+        set password ENC SH2abc=
+    next
+end
+config system replacemsg admin "pre_admin-disclaimer-text"
+    set buffer "Authorized access only.
+
+Disconnect now if you are not."
+end
+config firewall policy
+    edit 1
+        set name "lan \"out\""
+        set srcaddr "all" "lan"
+        set action accept
+    next
+end
+'''
+
+
+def lines(text):
+  return text.splitlines(keepends=True)
+
+
+def without_index(parsed):
+  parsed = dict(parsed)
+  parsed.pop('index')
+  return parsed
+
+
+@pytest.mark.parametrize('config', [
+  lines(CONFIG),
+  synthetic_config(policies=50, addresses=100),
+], ids=[ 'quoting', 'synthetic' ])
+def test_parse_matches_the_shlex_parser(config):
+  parsed = parse(config)
+  reference = legacy_parse(config)
+  assert without_index(parsed) == reference
+  for key in ('hierarchy', 'interfaces', 'admin_accounts', 'fw_version'):
+    assert parsed[key] == reference[key]
+
+
+def test_quoted_values():
+  parsed = parse(lines(CONFIG))
+  hierarchy = parsed['hierarchy']
+  # Like shlex.split(posix=False), an escaped quote still ends the token.
+  assert hierarchy['config system admin']['edit "admin"']['comments'] \
+    == r'"first line\nsecond line with a \" quote\"\nthird line"'
+  assert set(parsed['interfaces']) == { 'port1', 'lan side' }
+  assert set(parsed['admin_accounts']) == { 'admin', 'ops' }
+  widget = hierarchy['config system admin']['edit "admin"']['config gui-dashboard']['edit 1']
+  assert widget['config widget']['edit 1'] == { 'type': 'sysinfo' }
+  assert parsed['index']['config system interface']['lan side'] == [ [ 1, 'edit "lan side"' ] ]
+
+
+def test_process():
+  outputs = dict(model.process({ 'filedata:filename': lines(CONFIG) }))
+  assert outputs['fgt_cli_configuration']['fw_version'] == '7.2.5'
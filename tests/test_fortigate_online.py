@@ -0,0 +1,102 @@
+import http.client
+
+import pytest
+
+from fortigate_stub import StubFortiGate, load_recordings, RECORDINGS
+
+from app.context import ExecutionContext
+from app.validation_models.fortigate_online import client, model
+
+
+@pytest.fixture
+def stub(app, certificate):
+  certfile, keyfile = certificate
+  app.config['FORTIGATE_ONLINE_CA_FILE'] = str(certfile)
+  with StubFortiGate(certfile, keyfile) as stub:
+    yield stub
+  client.close_pools()
+
+
+def device(stub):
+  return { 'hostname': stub.host, 'https_port': stub.port }
+
+
+def test_fetch_downloads_config_and_status(stub):
+  conf_file, status = model.fetch(device(stub), stub.token)
+  assert conf_file.read_bytes() == (RECORDINGS / 'backup.conf').read_bytes()
+  assert status['results']['hostname'] == 'stub-fgt'
+  assert stub.paths() == [ client.STATUS_PATH, client.BACKUP_PATH ]
+
+
+def test_unchanged_config_is_not_downloaded_again(stub):
+  model.fetch(device(stub), stub.token)
+  conf_file, status = model.fetch(device(stub), stub.token)
+  etag = load_recordings()[client.BACKUP_PATH][1]['ETag']
+  path, headers = stub.requests[-1]
+  assert path == client.BACKUP_PATH
+  assert headers['If-None-Match'] == etag
+  assert conf_file.read_bytes() == (RECORDINGS / 'backup.conf').read_bytes()
+
+
+def test_connections_are_kept_alive(stub):
+  model.fetch(device(stub), stub.token)
+  model.fetch(device(stub), stub.token)
+  assert len(stub.requests) == 4
+  assert len(stub.connections) == 1
+
+
+def test_closed_idle_connection_is_retried(stub):
+  model.fetch(device(stub), stub.token)
+  stub.drop_connections()
+  conf_file, status = model.fetch(device(stub), stub.token)
+  assert status['results']['hostname'] == 'stub-fgt'
+
+
+def test_retried_only_once(stub):
+  pool = client.get_pool(stub.host, stub.port)
+  with pool.connection() as (first, reused), pool.connection() as (second, reused):
+    first.connect()
+    second.connect()
+  requests = len(stub.requests)
+  stub.hang_up = 3
+  with pytest.raises((http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+    model.fetch(device(stub), stub.token)
+  assert len(stub.requests) - requests == 2
+
+
+def test_wrong_token(stub):
+  with pytest.raises(client.APIError) as e:
+    model.fetch(device(stub), 'wrong')
+  assert e.value.status == 401
+
+
+def test_process_parses_the_configuration(stub):
+  outputs = dict(model.process(ExecutionContext({
+    'device': device(stub),
+    'api_token': stub.token,
+    'type:api_token': 'secret',
+  })))
+  hierarchy = outputs['fgt_cli_configuration']['hierarchy']
+  assert hierarchy['config system global']['hostname'] == '"stub-fgt"'
+  assert outputs['fgt_system_status']['model'] == 'FGT60F'
+
+
+def test_process_with_wrong_token(stub):
+  outputs = dict(model.process(ExecutionContext({
+    'device': { 'hostname': stub.host, 'https_port': stub.port },
+    'api_token': 'wrong',
+    'type:api_token': 'secret',
+  })))
+  assert outputs == { 'fgt_cli_configuration': dict(), 'fgt_system_status': dict() }
+
+
+def test_api_token_is_not_passed_to_plugins():
+  context = ExecutionContext.from_model_data({
+    'device': { 'hostname': '192.0.2.1', 'https_port': 443 },
+    'api_token': 'secret-token',
+    'type:api_token': 'secret',
+    'fgt_system_status': { 'model': 'FGT60F' },
+  })
+  assert 'api_token' not in context
+  assert 'secret-token' not in context.to_json()
+  assert context['fgt_system_status'] == { 'model': 'FGT60F' }
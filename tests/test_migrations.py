@@ -0,0 +1,68 @@
+import json
+
+import flask_migrate
+import pytest
+import sqlalchemy as sa
+
+from config import Config
+
+
+BEFORE_RUNS = 'cb04d60a702c'
+RUNS = '1021cc9dd75d'
+
+BLOB = {
+  'history': [
+    { '1': { 'hostname': False }, '2': { 'policy:all:action': True } },
+  ],
+  'results': {
+    '1': { 'hostname': True, 'admintimeout': False },
+    '2': dict(),
+  },
+  'fingerprints': { '1': { 'inputs': 'abc' } },
+}
+
+
+@pytest.fixture
+def migrated_app(tmp_path):
+  from app import create_app, db
+
+  class MigrationConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "migrations.db"}'
+    UPLOAD_PATH = tmp_path / 'uploads'
+
+  app = create_app(MigrationConfig)
+  with app.app_context():
+    yield app, db
+    db.session.remove()
+
+
+def test_results_round_trip_through_runs(migrated_app):
+  app, db = migrated_app
+  flask_migrate.upgrade(revision=BEFORE_RUNS)
+  with db.engine.begin() as conn:
+    conn.execute(sa.text(
+      'INSERT INTO device_validation (id, device_id, suite_id, name, data, timestamp) '
+      'VALUES (1, 1, 1, :name, :data, 100.0)'), { 'name': 'v', 'data': json.dumps(BLOB) })
+
+  flask_migrate.upgrade(revision=RUNS)
+  with db.engine.connect() as conn:
+    runs = conn.execute(sa.text(
+      'SELECT id, status FROM validation_run WHERE validation_id = 1 ORDER BY id')).all()
+    assert [ status for run_id, status in runs ] == [ 'complete', 'complete' ]
+    rows = conn.execute(sa.text(
+      'SELECT run_id, sequence, "check", status FROM validation_result ORDER BY id')).all()
+    assert [ tuple(row) for row in rows ] == [
+      (runs[0][0], 1, 'hostname', False),
+      (runs[0][0], 2, 'policy:all:action', True),
+      (runs[1][0], 1, 'hostname', True),
+      (runs[1][0], 1, 'admintimeout', False),
+      (runs[1][0], 2, '', True),
+    ]
+    data = json.loads(conn.execute(sa.text('SELECT data FROM device_validation')).scalar())
+    assert data == { 'fingerprints': BLOB['fingerprints'] }
+
+  flask_migrate.downgrade(revision=BEFORE_RUNS)
+  with db.engine.connect() as conn:
+    data = json.loads(conn.execute(sa.text('SELECT data FROM device_validation')).scalar())
+  assert data == BLOB
@@ -0,0 +1,40 @@
+import sqlalchemy as sa
+
+from app import db, models
+from app.pagination import paginate
+
+
+def walk(per_page):
+  '''Every page of the case listing, following next_cursor.'''
+  pages = list()
+  cursor = None
+  while True:
+    page = paginate(sa.select(models.TestCase), models.TestCase.listing_order(), cursor, per_page)
+    pages.append([ (case.name, case.version) for case in page ])
+    if not page.has_next:
+      return pages, page
+    cursor = page.next_cursor
+
+
+def test_cases_without_a_version_are_paged(app):
+  cases = [ ('a', '1'), ('b', None), ('b', '2'), ('b', '3'), ('c', '1') ]
+  for name, version in cases:
+    db.session.add(models.TestCase(name=name, version=version))
+  db.session.commit()
+  pages, last = walk(2)
+  assert pages == [ cases[0:2], cases[2:4], cases[4:5] ]
+  back = paginate(sa.select(models.TestCase), models.TestCase.listing_order(), last.prev_cursor, 2)
+  assert [ (case.name, case.version) for case in back ] == cases[2:4]
+
+
+def test_api_per_page_is_at_least_one(app):
+  user = models.User(username='u', display_name='U', email='u@example.com')
+  db.session.add(user)
+  db.session.add(models.TestCase(name='a', version='1'))
+  db.session.commit()
+  token = user.get_token()
+  db.session.commit()
+  response = app.test_client().get('/api/cases?per_page=0',
+    headers={ 'Authorization': f'Bearer {token}' })
+  assert response.status_code == 200
+  assert len(response.json['items']) == 1
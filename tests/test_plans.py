@@ -0,0 +1,36 @@
+import json
+
+from app import plans, models
+
+
+def case(id, value):
+  return models.TestCase(id=id, name=f'c{id}', version='1', function='app.plugins.fg_setting',
+    data=json.dumps({ 'setting_specs': [ { 'config_path': [ 'config system global' ],
+      'setting': 'hostname', 'value': value } ] }))
+
+
+def get(case):
+  return plans.get_plan(case, case.get_data())
+
+
+def test_plans_are_cached_by_content(app):
+  plans._plans.clear()
+  first = case(1, 'fw1')
+  assert get(first) is get(first)
+  edited = case(1, 'fw2')
+  assert get(edited) is not get(first)
+  assert get(case(2, 'fw1')) is get(first)
+
+
+def test_cache_is_bounded(app):
+  plans._plans.clear()
+  app.config['PLAN_CACHE_SIZE'] = 2
+  cases = [ case(i, f'fw{i}') for i in range(3) ]
+  first = get(cases[0])
+  get(cases[1])
+  assert get(cases[0]) is first
+  get(cases[2])
+  assert len(plans._plans) == 2
+  assert get(cases[0]) is first
+  plans.invalidate(0)
+  assert get(cases[0]) is not first
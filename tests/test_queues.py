@@ -0,0 +1,22 @@
+import pytest
+
+from app import db, models, queues
+
+
+def add_task(user, kind):
+  task = models.Task(id=f'{kind}-{user.id}', name='run_validation', user=user, obj_id=1, kind=kind)
+  db.session.add(task)
+  db.session.commit()
+  return task
+
+
+def test_only_interactive_tasks_count_against_the_user(app):
+  app.config['USER_MAX_ACTIVE_TASKS'] = 1
+  user = models.User(username='u', display_name='U', email='u@example.com')
+  db.session.add(user)
+  db.session.commit()
+  add_task(user, queues.BULK)
+  queues.check_limits(user)
+  add_task(user, queues.INTERACTIVE)
+  with pytest.raises(queues.QueueLimitError):
+    queues.check_limits(user)
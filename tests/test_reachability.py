@@ -0,0 +1,60 @@
+import asyncio
+import socket
+
+import pytest
+
+from app import reachability
+
+
+@pytest.fixture
+def listener():
+  '''A local TCP port accepting connections, and one that refuses them.'''
+  server = socket.socket()
+  server.bind(('127.0.0.1', 0))
+  server.listen()
+  closed = socket.socket()
+  closed.bind(('127.0.0.1', 0))
+  closed_port = closed.getsockname()[1]
+  closed.close()
+  yield server.getsockname()[1], closed_port
+  server.close()
+
+
+def test_check_tcp(listener):
+  open_port, closed_port = listener
+  assert asyncio.run(reachability.check_tcp('127.0.0.1', open_port, 1))
+  assert not asyncio.run(reachability.check_tcp('127.0.0.1', closed_port, 1))
+
+
+def test_sweep(app, listener):
+  open_port, closed_port = listener
+  results = reachability.sweep([
+    ('127.0.0.1', (open_port, closed_port)),
+    ('127.0.0.1', (closed_port,)),
+  ], icmp=False, ttl=0)
+  assert [ result['tcp'] for result in results ] == [
+    { open_port: True, closed_port: False },
+    { closed_port: False },
+  ]
+  assert [ reachability.is_reachable(result) for result in results ] == [ True, False ]
+
+
+def test_sweep_caches_results(app, listener):
+  open_port, closed_port = listener
+  target = [ ('127.0.0.1', (open_port,)) ]
+  first, = reachability.sweep(target, icmp=False, ttl=60)
+  cached, = reachability.sweep(target, icmp=False, ttl=60)
+  assert cached is first
+
+
+def test_host_is_never_a_ping_option(monkeypatch):
+  calls = list()
+
+  async def create_subprocess_exec(*args, **kwargs):
+    calls.append(args)
+    raise OSError('no ping here')
+
+  monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+  assert asyncio.run(reachability.check_icmp('-fhost', 1)) is None
+  args, = calls
+  assert args[-2:] == ('--', '-fhost')
@@ -0,0 +1,30 @@
+import json
+
+from app import db, models
+from app.reports import ValidationReport
+
+
+def test_case_without_checks_is_a_success(app):
+  device = models.Device(devicename='fw1', hostname='192.0.2.1', ssh_port=22, https_port=443)
+  suite = models.TestSuite(name='s', version='1')
+  db.session.add_all([ device, suite ])
+  db.session.commit()
+  for sequence in (1, 2, 3):
+    case = models.TestCase(name=f'c{sequence}', version='1', function='app.plugins.manual', data='{}')
+    db.session.add(case)
+    db.session.commit()
+    db.session.add(models.SuiteCase(suite_id=suite.id, case_id=case.id, sequence=sequence))
+  validation = models.DeviceValidation(device_id=device.id, suite_id=suite.id, name='v',
+    data=json.dumps(dict()), archived=False, submitted=False, approved=False, final=False)
+  db.session.add(validation)
+  db.session.commit()
+  run = models.ValidationRun(validation_id=validation.id, status='complete')
+  db.session.add(run)
+  db.session.commit()
+  run.add_results({ '1': { 'hostname': True }, '2': dict(), '3': '[ERROR: broken]' })
+  db.session.commit()
+
+  assert run.get_results() == { '1': { 'hostname': True }, '2': dict() }
+  assert [ validation.row_status(sequence) for sequence in (1, 2, 3) ] == [ 'success', 'success', 'no data' ]
+  report = ValidationReport(validation)
+  assert [ row.row_status for row in report.rows ] == [ 'success', 'success', 'no data' ]